@@ -39,6 +39,8 @@ from . import( # DuBLF files
 )
 
 from . import ( # pylint: disable=import-error # DuPYF Files
+    color,
+    composite,
     debug,
     oca,
     updater,
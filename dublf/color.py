@@ -0,0 +1,294 @@
+import numpy as np
+
+# pixels per chunk: the chunk and its scratch buffers stay in the CPU cache
+CHUNK_PIXELS = 1 << 14
+
+# Rec. 709 / sRGB luminance weights
+REC709 = (0.2126, 0.7152, 0.0722)
+
+# hsv to rgb: for each hue sector, the [v, t, p, q] index of r, g, b
+_HSV_SECTORS = np.array(((0, 1, 2), (3, 0, 2), (2, 0, 1), (2, 3, 0), (1, 2, 0), (0, 2, 3)), dtype=np.intp)
+
+
+def _flat(a):
+    """(N, C) pixel view of an (..., C) array, copied only if it is not contiguous"""
+    return np.ascontiguousarray(a).reshape(-1, a.shape[-1])
+
+
+def _output(out, shape):
+    if out is None:
+        return np.empty(shape, dtype=np.float32)
+    if out.shape != shape or out.dtype != np.float32 or not out.flags.c_contiguous:
+        raise ValueError("out must be a contiguous float32 array of shape " + str(shape))
+    return out
+
+
+def _convert(src, out, kernel, scratch_rows, chunk=None):
+    """Runs kernel(src_chunk, out_chunk, scratch) on chunks of the (N, C) arrays src and out,
+    with float32 (scratch_rows, n) scratch buffers"""
+    chunk = chunk or CHUNK_PIXELS
+    scratch = np.empty((scratch_rows, min(chunk, max(len(src), 1))), dtype=np.float32)
+    for start in range(0, len(src), chunk):
+        end = min(start + chunk, len(src))
+        kernel(src[start:end], out[start:end], scratch[:, : end - start])
+    return out
+
+
+def _rgb_to_hsv_kernel(src, out, scratch):
+    r, g, b, mn, delta, mask = scratch
+    np.copyto(r, src[:, 0], casting="unsafe")
+    np.copyto(g, src[:, 1], casting="unsafe")
+    np.copyto(b, src[:, 2], casting="unsafe")
+    h = out[:, 0]
+    s = out[:, 1]
+    v = out[:, 2]
+
+    np.maximum(r, g, out=v)
+    np.maximum(v, b, out=v)
+    np.minimum(r, g, out=mn)
+    np.minimum(mn, b, out=mn)
+    np.subtract(v, mn, out=delta)
+
+    # s = delta / v, 0 for black
+    s.fill(0.0)
+    np.divide(delta, v, out=s, where=v > 0.0)
+
+    # hue sector of the max channel, r first on ties
+    is_r = r == v
+    is_g = (g == v) & ~is_r
+    is_b = ~(is_r | is_g)
+    np.subtract(g, b, out=h, where=is_r)
+    np.subtract(b, r, out=h, where=is_g)
+    np.subtract(r, g, out=h, where=is_b)
+    grey = delta == 0.0
+    delta[grey] = 1.0
+    h /= delta
+    np.mod(h, 6.0, out=h, where=is_r)
+    np.add(h, 2.0, out=h, where=is_g)
+    np.add(h, 4.0, out=h, where=is_b)
+    h *= 1.0 / 6.0
+    h[grey] = 0.0
+
+
+def rgb_to_hsv(rgb, out=None, chunk=None):
+    """(..., 3 or 4) RGB(A) to (..., 3) float32 HSV, all components in [0, 1]"""
+    rgb = np.asarray(rgb)
+    out = _output(out, rgb.shape[:-1] + (3,))
+    _convert(_flat(rgb), out.reshape(-1, 3), _rgb_to_hsv_kernel, 6, chunk)
+    return out
+
+
+def _hsv_to_rgb_kernel(src, out, scratch):
+    h, s, f, v, t, p, q = scratch
+    np.copyto(h, src[:, 0], casting="unsafe")
+    np.copyto(s, src[:, 1], casting="unsafe")
+    np.copyto(v, src[:, 2], casting="unsafe")
+
+    h *= 6.0
+    sector = np.floor(h)
+    np.subtract(h, sector, out=f)
+    sector = sector.astype(np.intp) % 6
+
+    # p = v (1 - s), q = v (1 - s f), t = v (1 - s (1 - f))
+    np.multiply(v, s, out=p)
+    np.subtract(v, p, out=p)
+    np.multiply(s, f, out=q)
+    np.subtract(s, q, out=t)
+    np.multiply(v, q, out=q)
+    np.subtract(v, q, out=q)
+    np.multiply(v, t, out=t)
+    np.subtract(v, t, out=t)
+
+    comps = scratch[3:]
+    ids = _HSV_SECTORS[sector]
+    cols = np.arange(len(src))
+    for c in range(3):
+        out[:, c] = comps[ids[:, c], cols]
+
+
+def hsv_to_rgb(hsv, out=None, chunk=None):
+    """(..., 3) HSV to (..., 3) float32 RGB"""
+    hsv = np.asarray(hsv)
+    out = _output(out, hsv.shape[:-1] + (3,))
+    _convert(_flat(hsv), out.reshape(-1, 3), _hsv_to_rgb_kernel, 7, chunk)
+    return out
+
+
+def _rgb_to_hsl_kernel(src, out, scratch):
+    _rgb_to_hsv_kernel(src, out, scratch[:6])
+    s = out[:, 1]
+    v = out[:, 2]
+    l, m = scratch[6:8]
+
+    # l = v (1 - s / 2), s = (v - l) / min(l, 1 - l)
+    np.multiply(s, -0.5, out=l)
+    l += 1.0
+    l *= v
+    np.subtract(1.0, l, out=m)
+    np.minimum(m, l, out=m)
+    np.subtract(v, l, out=s)
+    np.divide(s, m, out=s, where=m > 0.0)
+    s[m <= 0.0] = 0.0
+    np.copyto(v, l)
+
+
+def rgb_to_hsl(rgb, out=None, chunk=None):
+    """(..., 3 or 4) RGB(A) to (..., 3) float32 HSL"""
+    rgb = np.asarray(rgb)
+    out = _output(out, rgb.shape[:-1] + (3,))
+    _convert(_flat(rgb), out.reshape(-1, 3), _rgb_to_hsl_kernel, 8, chunk)
+    return out
+
+
+def _hsl_to_rgb_kernel(src, out, scratch):
+    hsv = scratch[7:10]
+    l = scratch[9]
+    s = scratch[8]
+    np.copyto(hsv[0], src[:, 0], casting="unsafe")
+    np.copyto(s, src[:, 1], casting="unsafe")
+    np.copyto(l, src[:, 2], casting="unsafe")
+
+    # v = l + s min(l, 1 - l), s = 2 (1 - l / v)
+    m = scratch[0]
+    np.subtract(1.0, l, out=m)
+    np.minimum(m, l, out=m)
+    m *= s
+    v = m
+    v += l
+    np.divide(l, v, out=s, where=v > 0.0)
+    np.subtract(1.0, s, out=s)
+    s *= 2.0
+    s[v <= 0.0] = 0.0
+    np.copyto(l, v)
+    _hsv_to_rgb_kernel(hsv.T, out, scratch[:7])
+
+
+def hsl_to_rgb(hsl, out=None, chunk=None):
+    """(..., 3) HSL to (..., 3) float32 RGB"""
+    hsl = np.asarray(hsl)
+    out = _output(out, hsl.shape[:-1] + (3,))
+    _convert(_flat(hsl), out.reshape(-1, 3), _hsl_to_rgb_kernel, 10, chunk)
+    return out
+
+
+def luminance(rgb, out=None, weights=REC709, chunk=None):
+    """(..., 3 or 4) RGB(A) to (...) float32 luminance"""
+    rgb = np.asarray(rgb)
+    out = _output(out, rgb.shape[:-1])
+    w = np.asarray(weights, dtype=np.float32)
+    src = _flat(rgb)
+    flat = out.reshape(-1)
+    chunk = chunk or CHUNK_PIXELS
+    for start in range(0, len(src), chunk):
+        end = min(start + chunk, len(src))
+        np.dot(src[start:end, :3].astype(np.float32, copy=False), w, out=flat[start:end])
+    return out
+
+
+# sRGB transfer functions
+
+_SRGB_KNEE = 0.0031308
+_LINEAR_KNEE = 0.04045
+
+
+def _exact_linear_to_srgb(x, out):
+    """Transfer function of the float array x in [0, 1], written to out (can be x)"""
+    low = x < _SRGB_KNEE
+    lin = x[low] * 12.92
+    np.power(x, 1.0 / 2.4, out=out)
+    out *= 1.055
+    out -= 0.055
+    out[low] = lin
+
+
+def _exact_srgb_to_linear(x, out):
+    low = x < _LINEAR_KNEE
+    lin = x[low] * (1.0 / 12.92)
+    np.add(x, 0.055, out=out)
+    out *= 1.0 / 1.055
+    np.power(out, 2.4, out=out)
+    out[low] = lin
+
+
+def _int_lut(exact_fn, dtype):
+    """Rounded result for each value of the normalized integer type"""
+    top = np.iinfo(dtype).max
+    x = np.arange(top + 1, dtype=np.float64) / top
+    values = np.empty_like(x)
+    exact_fn(x, values)
+    return np.rint(np.clip(values, 0.0, 1.0) * top).astype(dtype)
+
+
+def _half_lut(exact_fn):
+    """Result for each of the 65536 float16 bit patterns"""
+    x = np.arange(1 << 16, dtype=np.uint16).view(np.float16).astype(np.float64)
+    x = np.nan_to_num(x, nan=0.0)
+    np.clip(x, 0.0, 1.0, out=x)
+    values = np.empty_like(x)
+    exact_fn(x, values)
+    return values.astype(np.float16)
+
+
+# LUTs by transfer function and type, built on first use
+_luts = {}
+
+
+def _lut(exact_fn, dtype):
+    key = (exact_fn, dtype)
+    lut = _luts.get(key)
+    if lut is None:
+        lut = _half_lut(exact_fn) if dtype == np.float16 else _int_lut(exact_fn, dtype)
+        _luts[key] = lut
+    return lut
+
+
+def _transfer(exact_fn, a, out, chunk):
+    a = np.asarray(a)
+    if out is None:
+        out = np.empty_like(a)
+    elif out.shape != a.shape or out.dtype != a.dtype:
+        raise ValueError("out must have the shape and the type of the input")
+
+    if a.dtype.kind != "f" and a.dtype != np.uint8 and a.dtype != np.uint16:
+        raise TypeError("Unsupported pixel type: " + str(a.dtype))
+    if not out.flags.c_contiguous:
+        raise ValueError("out must be contiguous")
+    src = np.ascontiguousarray(a).reshape(-1)
+    dst = out.reshape(-1)
+    chunk = (chunk or CHUNK_PIXELS) * 4
+
+    # 8 and 16 bit types: one LUT entry per possible value
+    if a.dtype.itemsize <= 2:
+        lut = _lut(exact_fn, a.dtype.type)
+        if a.dtype == np.float16:
+            src = src.view(np.uint16)
+        ids = np.empty(min(chunk, max(len(src), 1)), dtype=np.intp)
+        for start in range(0, len(src), chunk):
+            end = min(start + chunk, len(src))
+            i = ids[: end - start]
+            np.copyto(i, src[start:end])
+            np.take(lut, i, out=dst[start:end])
+        return out
+
+    # wider floats: the formula, in their own precision
+    scratch = np.empty(min(chunk, max(len(src), 1)), dtype=a.dtype)
+    for start in range(0, len(src), chunk):
+        end = min(start + chunk, len(src))
+        t = scratch[: end - start]
+        np.clip(src[start:end], 0.0, 1.0, out=t)
+        exact_fn(t, t)
+        np.clip(t, 0.0, 1.0, out=dst[start:end])
+    return out
+
+
+def linear_to_srgb(a, out=None, chunk=None):
+    """sRGB encoding of linear values, clamped to [0, 1], keeping the type of a.
+    uint8 and uint16 (normalized integers) and float16 go through a LUT of all their values,
+    float32 and float64 are computed in their own precision.
+    out can be a for an in-place conversion"""
+    return _transfer(_exact_linear_to_srgb, a, out, chunk)
+
+
+def srgb_to_linear(a, out=None, chunk=None):
+    """Linear values of sRGB encoded ones, see linear_to_srgb"""
+    return _transfer(_exact_srgb_to_linear, a, out, chunk)
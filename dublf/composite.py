@@ -0,0 +1,563 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Layer compositing with the OCA (Krita) blending modes.
+# Images are (h, w, 4) float32 RGBA arrays with straight (not premultiplied) alpha;
+# colors are blended as they are stored, without any color space conversion (like Krita).
+
+# pixel tiles flattened by each worker
+TILE_SIZE = 256
+
+_TWO_OVER_PI = np.float32(2.0 / np.pi)
+
+# separable modes: b(s, d), the blended value of the src and dst (..., 3) colors
+
+
+def _step(cond):
+    """1.0 where cond is true, 0.0 elsewhere, as float32 (np.where with scalars would give float64)"""
+    return cond.astype(np.float32)
+
+
+def _screen(s, d):
+    return s + d - s * d
+
+
+def _hard_light(s, d):
+    return np.where(s > 0.5, _screen(2.0 * s - 1.0, d), 2.0 * s * d)
+
+
+def _dodge(s, d):
+    return np.where(s >= 1.0, _step(d > 0.0), np.minimum(d / (1.0 - s), 1.0))
+
+
+def _burn(s, d):
+    return np.where(s <= 0.0, _step(d >= 1.0), 1.0 - np.minimum((1.0 - d) / s, 1.0))
+
+
+def _divide(s, d):
+    return np.where(s <= 0.0, _step(d > 0.0), d / s)
+
+
+def _soft_light(s, d):
+    return np.where(s > 0.5, d + (2.0 * s - 1.0) * (np.sqrt(d) - d), d - (1.0 - 2.0 * s) * d * (1.0 - d))
+
+
+def _soft_light_svg(s, d):
+    dd = np.where(d > 0.25, np.sqrt(d), ((16.0 * d - 12.0) * d + 4.0) * d)
+    return np.where(s > 0.5, d + (2.0 * s - 1.0) * (dd - d), d - (1.0 - 2.0 * s) * d * (1.0 - d))
+
+
+def _gamma_dark(s, d):
+    return np.where(s <= 0.0, 0.0, d ** (1.0 / s))
+
+
+def _vivid_light(s, d):
+    low = np.where(s <= 0.0, _step(d >= 1.0), 1.0 - (1.0 - d) / (2.0 * s))
+    high = np.where(s >= 1.0, _step(d > 0.0), d / (2.0 * (1.0 - s)))
+    return np.where(s < 0.5, low, high)
+
+
+def _hard_mix_photoshop(s, d):
+    return _step(s + d > 1.0)
+
+
+def _penumbra_a(s, d):
+    low = np.minimum(d / (1.0 - s), 1.0) * 0.5
+    high = np.where(d <= 0.0, 0.0, 1.0 - np.minimum((1.0 - s) / d, 1.0) * 0.5)
+    return np.where(s >= 1.0, 1.0, np.where(s + d < 1.0, low, high))
+
+
+def _penumbra_c(s, d):
+    return np.where(s >= 1.0, 1.0, _TWO_OVER_PI * np.arctan(d / (1.0 - s)))
+
+
+def _flat_light(s, d):
+    b = np.where(_hard_mix_photoshop(1.0 - s, d) >= 1.0, _penumbra_a(d, s), _penumbra_a(s, d))
+    return np.where(s <= 0.0, 0.0, b)
+
+
+def _interpolation(s, d):
+    b = 0.5 - 0.25 * np.cos(np.pi * s) - 0.25 * np.cos(np.pi * d)
+    return np.where((s <= 0.0) & (d <= 0.0), 0.0, b)
+
+
+def _freeze(s, d):
+    return np.where(d >= 1.0, 1.0, np.where(s <= 0.0, 0.0, 1.0 - (1.0 - d) ** 2 / s))
+
+
+def _reflect(s, d):
+    return np.where(s >= 1.0, 1.0, d * d / (1.0 - s))
+
+
+def _heat(s, d):
+    return np.where(s >= 1.0, 1.0, np.where(d <= 0.0, 0.0, 1.0 - (1.0 - s) ** 2 / d))
+
+
+def _freeze_reflect(s, d):
+    b = np.where(d <= 0.0, 0.0, _reflect(s, d))
+    return np.where(_hard_mix_photoshop(d, s) >= 1.0, _freeze(s, d), b)
+
+
+def _heat_glow(s, d):
+    b = np.where(s <= 0.0, 0.0, _reflect(d, s))
+    return np.where(_hard_mix_photoshop(s, d) >= 1.0, _heat(s, d), b)
+
+
+def _glow_heat(s, d):
+    b = np.where(_hard_mix_photoshop(s, d) >= 1.0, _reflect(d, s), _heat(s, d))
+    return np.where(d >= 1.0, 1.0, b)
+
+
+def _heat_glow_freeze_reflect(s, d):
+    return np.where(_hard_mix_photoshop(s, d) >= 1.0, _heat_glow(s, d), _freeze_reflect(s, d))
+
+
+def _super_light(s, d, p=2.875):
+    low = 1.0 - ((1.0 - d) ** p + (1.0 - 2.0 * s) ** p) ** (1.0 / p)
+    high = (d ** p + (2.0 * s - 1.0) ** p) ** (1.0 / p)
+    return np.where(s < 0.5, low, high)
+
+
+def _pnorm(p):
+    return lambda s, d: (d ** p + s ** p) ** (1.0 / p)
+
+
+def _divisive_modulo(s, d):
+    eps = np.finfo(np.float32).eps
+    return np.mod(d / np.maximum(s, eps), 1.0 + eps)
+
+
+def _logical(op):
+    """Bitwise op on the colors as normalized 16 bit integers"""
+    def kernel(s, d):
+        a = np.rint(s * 65535.0).astype(np.uint16)
+        b = np.rint(d * 65535.0).astype(np.uint16)
+        return op(a, b).astype(np.float32) * (1.0 / 65535.0)
+    return kernel
+
+
+_SEPARABLE = {
+    'normal': lambda s, d: s,
+    'multiply': lambda s, d: s * d,
+    'screen': _screen,
+    'overlay': lambda s, d: _hard_light(d, s),
+    'hard_light': _hard_light,
+    'soft_light': _soft_light,
+    'soft_light_svg': _soft_light_svg,
+    'soft_light_pegtop_delphi': lambda s, d: (1.0 - d) * s * d + d * _screen(s, d),
+    'soft_light_ifs_illusions': lambda s, d: d ** (2.0 ** (2.0 * (0.5 - s))),
+    'darken': np.minimum,
+    'lighten': np.maximum,
+    'dodge': _dodge,
+    'burn': _burn,
+    'linear_dodge': lambda s, d: s + d,
+    'linear_burn': lambda s, d: s + d - 1.0,
+    'linear light': lambda s, d: 2.0 * s + d - 1.0,
+    'vivid_light': _vivid_light,
+    'pin_light': lambda s, d: np.maximum(2.0 * s - 1.0, np.minimum(d, 2.0 * s)),
+    'hard mix': lambda s, d: np.where(d > 0.5, _dodge(s, d), _burn(s, d)),
+    'hard_mix_photoshop': _hard_mix_photoshop,
+    'hard overlay': lambda s, d: np.where(s >= 1.0, 1.0, np.where(s > 0.5, d / (2.0 - 2.0 * s), 2.0 * s * d)),
+    'easy dodge': lambda s, d: d ** (1.04 * (1.0 - s)),
+    'easy burn': lambda s, d: 1.0 - (1.0 - s) ** (1.04 * d),
+    'gamma_dark': _gamma_dark,
+    'gamma_light': lambda s, d: d ** s,
+    'gamma_illumination': lambda s, d: 1.0 - _gamma_dark(1.0 - s, 1.0 - d),
+    'fog_darken_ifs_illusions': lambda s, d: s * (1.0 - s) + s * d,
+    'fog_lighten_ifs_illusions': lambda s, d: np.where(s < 0.5,
+        1.0 - s * (1.0 - s) - (1.0 - d) * (1.0 - s),
+        s - (1.0 - d) * (1.0 - s) + (1.0 - s) ** 2),
+    'shade_ifs_illusions': lambda s, d: 1.0 - ((1.0 - d) * s + np.sqrt(1.0 - s)),
+    'tint_ifs_illusions': lambda s, d: s * (1.0 - s) + np.sqrt(d),
+    'subtract': lambda s, d: d - s,
+    'inverse_subtract': lambda s, d: d - (1.0 - s),
+    'divide': _divide,
+    'diff': lambda s, d: np.abs(s - d),
+    'equivalence': lambda s, d: np.abs(d - s),
+    'exclusion': lambda s, d: s + d - 2.0 * s * d,
+    'negation': lambda s, d: 1.0 - np.abs(1.0 - s - d),
+    'additive_subtractive': lambda s, d: np.abs(np.sqrt(d) - np.sqrt(s)),
+    'arc_tangent': lambda s, d: np.where(d <= 0.0, _step(s > 0.0), _TWO_OVER_PI * np.arctan(s / d)),
+    'geometric_mean': lambda s, d: np.sqrt(s * d),
+    'allanon': lambda s, d: (s + d) * 0.5,
+    'parallel': lambda s, d: np.where((s > 0.0) & (d > 0.0), 2.0 / (1.0 / s + 1.0 / d), 0.0),
+    'interpolation': _interpolation,
+    'interpolation 2x': lambda s, d: _interpolation(_interpolation(s, d), _interpolation(s, d)),
+    'divisive_modulo': _divisive_modulo,
+    'penumbra a': _penumbra_a,
+    'penumbra b': lambda s, d: _penumbra_a(d, s),
+    'penumbra c': _penumbra_c,
+    'penumbra d': lambda s, d: _penumbra_c(d, s),
+    'flat_light': _flat_light,
+    'freeze': _freeze,
+    'reflect': _reflect,
+    'glow': lambda s, d: _reflect(d, s),
+    'heat': _heat,
+    'freeze_reflect': _freeze_reflect,
+    'reflect_freeze': lambda s, d: _freeze_reflect(d, s),
+    'heat_glow': _heat_glow,
+    'glow_heat': _glow_heat,
+    'heat_glow_freeze_reflect_hybrid': _heat_glow_freeze_reflect,
+    'super_light': _super_light,
+    'pnorm_a': _pnorm(7.0 / 3.0),
+    'pnorm_b': _pnorm(4.0),
+    # Paint Tool SAI "luminosity" (shine) adds the colors
+    'luminosity_sai': lambda s, d: s + d,
+    'and': _logical(np.bitwise_and),
+    'or': _logical(np.bitwise_or),
+    'xor': _logical(np.bitwise_xor),
+    'nand': _logical(lambda a, b: ~(a & b)),
+    'nor': _logical(lambda a, b: ~(a | b)),
+    'xnor': _logical(lambda a, b: ~(a ^ b)),
+    'implication': _logical(lambda a, b: ~a | b),
+    'not_implication': _logical(lambda a, b: a & ~b),
+    'converse': _logical(lambda a, b: a | ~b),
+    'not_converse': _logical(lambda a, b: ~a & b),
+}
+
+# non-separable modes, in the HSY (luma), HSI, HSL and HSV models:
+# (lightness(c), saturation(c)) of (..., 3) colors, with a (..., 1) result
+
+_LUMA = np.array((0.299, 0.587, 0.114), dtype=np.float32)
+
+
+def _max(c):
+    # faster than c.max(-1) on the short last axis
+    return np.maximum(np.maximum(c[..., 0:1], c[..., 1:2]), c[..., 2:3])
+
+
+def _min(c):
+    return np.minimum(np.minimum(c[..., 0:1], c[..., 1:2]), c[..., 2:3])
+
+
+def _chroma(c):
+    return _max(c) - _min(c)
+
+
+def _luma(c):
+    return c[..., 0:1] * _LUMA[0] + c[..., 1:2] * _LUMA[1] + c[..., 2:3] * _LUMA[2]
+
+
+def _intensity(c):
+    return (c[..., 0:1] + c[..., 1:2] + c[..., 2:3]) * (1.0 / 3.0)
+
+
+def _lightness(c):
+    return (_max(c) + _min(c)) * 0.5
+
+
+def _value(c):
+    return _max(c)
+
+
+def _sat_hsi(c):
+    i = _intensity(c)
+    return np.where(_chroma(c) > 0.0, 1.0 - _min(c) / i, 0.0)
+
+
+def _sat_hsl(c):
+    m = 1.0 - np.abs(_max(c) + _min(c) - 1.0)
+    return np.where(m > 0.0, _chroma(c) / m, 0.0)
+
+
+def _sat_hsv(c):
+    v = _value(c)
+    return np.where(v > 0.0, _chroma(c) / v, 0.0)
+
+
+_HSX = {
+    'hsy': (_luma, _chroma),
+    'hsi': (_intensity, _sat_hsi),
+    'hsl': (_lightness, _sat_hsl),
+    'hsv': (_value, _sat_hsv),
+}
+
+
+def _set_lightness(c, l, light):
+    """c with the lightness l, clipped to [0, 1] keeping its lightness and hue
+    (as Krita, l is not clamped: a color can only be clipped when it is not grey)"""
+    c = c + (l - light(c))
+    l = light(c)
+    n = _min(c)
+    c = np.where((n < 0.0) & (l > n), l + (c - l) * l / (l - n), c)
+    x = _max(c)
+    return np.where((x > 1.0) & (x > l), l + (c - l) * (1.0 - l) / (x - l), c)
+
+
+def _set_saturation(c, sat):
+    """c with the chroma sat: as Krita, the saturation of every model is set as a chroma"""
+    mn = _min(c)
+    ch = _chroma(c)
+    return np.where(ch > 0.0, (c - mn) * sat / ch, 0.0)
+
+
+def _hsx(model, hue, sat, light):
+    """Mode taking the hue of 'src' or 'dst', with the saturation sat(s, d, sat_fn)
+    (None keeps the one of the hue color) and the lightness light(s, d, light_fn)"""
+    light_fn, sat_fn = _HSX[model]
+
+    def kernel(s, d):
+        c = s if hue == 'src' else d
+        if sat is not None:
+            c = _set_saturation(c, sat(s, d, sat_fn))
+        return _set_lightness(c, light(s, d, light_fn), light_fn)
+    return kernel
+
+
+def _hsx_modes(model, suffix, light_name):
+    src = lambda s, d, f: f(s)
+    dst = lambda s, d, f: f(d)
+    return {
+        'color' + suffix: _hsx(model, 'src', None, dst),
+        'hue' + suffix: _hsx(model, 'src', dst, dst),
+        'saturation' + suffix: _hsx(model, 'dst', src, dst),
+        light_name: _hsx(model, 'dst', None, src),
+        'inc_' + light_name: _hsx(model, 'dst', None, lambda s, d, f: f(d) + f(s)),
+        'dec_' + light_name: _hsx(model, 'dst', None, lambda s, d, f: f(d) + f(s) - 1.0),
+        'inc_saturation' + suffix: _hsx(model, 'dst', lambda s, d, f: f(d) + (1.0 - f(d)) * f(s), dst),
+        'dec_saturation' + suffix: _hsx(model, 'dst', lambda s, d, f: f(d) * f(s), dst),
+    }
+
+
+_NON_SEPARABLE = {
+    # src on ties, as Krita
+    'darker color': lambda s, d: np.where(_luma(d) < _luma(s), d, s),
+    'lighter color': lambda s, d: np.where(_luma(d) > _luma(s), d, s),
+}
+_NON_SEPARABLE.update(_hsx_modes('hsy', '', 'luminosity'))
+_NON_SEPARABLE.update(_hsx_modes('hsi', '_hsi', 'intensity'))
+_NON_SEPARABLE.update(_hsx_modes('hsl', '_hsl', 'lightness'))
+_NON_SEPARABLE.update(_hsx_modes('hsv', '_hsv', 'value'))
+# the lightness of the HSY mode is 'luminize' in Krita
+_NON_SEPARABLE['luminize'] = _NON_SEPARABLE.pop('luminosity')
+# Krita's hue_hsv is not an OCA mode
+del _NON_SEPARABLE['hue_hsv']
+
+# modes with their own alpha compositing: (color, alpha) of (s, d, sa, da, origin)
+
+
+def _erase(s, d, sa, da, origin):
+    return d, da * (1.0 - sa)
+
+
+def _destination_in(s, d, sa, da, origin):
+    return d, da * sa
+
+
+def _alpha_darken(s, d, sa, da, origin):
+    """Krita's brush mode with a full flow: src over dst, keeping the highest alpha"""
+    return np.where(da > 0.0, d + (s - d) * sa, s), np.maximum(da, sa)
+
+
+def _greater(s, d, sa, da, origin):
+    """Krita's greater: dst is replaced when src is more opaque, with a smooth transition"""
+    w = 1.0 / (1.0 + np.exp(-40.0 * (da - sa)))
+    a = np.maximum(np.clip(da * w + sa * (1.0 - w), 0.0, 1.0), da)
+    fake = 1.0 - (1.0 - a) / (1.0 - da + np.finfo(np.float32).eps)
+    c = d * da + (s - d * da) * fake
+    return np.where(a > 0.0, c / a, 0.0), a
+
+
+def _noise(shape, origin):
+    """Uniform [0, 1) noise, a hash of the pixel coordinates (same result whatever the tiling)"""
+    y, x = np.indices(shape[:-1], dtype=np.uint32)
+    h = (x + np.uint32(origin[0])) * np.uint32(73856093) ^ (y + np.uint32(origin[1])) * np.uint32(19349663)
+    h ^= h >> np.uint32(16)
+    h *= np.uint32(0x45d9f3b)
+    h ^= h >> np.uint32(16)
+    return (h >> np.uint32(8)).astype(np.float32)[..., None] * (1.0 / (1 << 24))
+
+
+def _dissolve(s, d, sa, da, origin):
+    hit = _noise(s.shape, origin) < sa
+    return np.where(hit, s, d), np.where(hit, 1.0, da)
+
+
+_ALPHA = {
+    'erase': _erase,
+    'destination-in': _destination_in,
+    'alphadarken': _alpha_darken,
+    'greater': _greater,
+    'dissolve': _dissolve,
+}
+
+# modes changing dst where src is transparent
+_CLEARS_OUTSIDE = frozenset(('destination-in',))
+
+# all the supported modes, by OCA name (the keys of oca.OCABlendingModes)
+BLEND_MODES = tuple(sorted(set(_SEPARABLE) | set(_NON_SEPARABLE) | set(_ALPHA)))
+
+
+def blend(dst, src, mode='normal', opacity=1.0, out=None, inherit_alpha=False, origin=(0, 0)):
+    """Composites the (h, w, 4) src image over dst with the OCA blending mode mode, into out (can be dst).
+    The colors are blended with the W3C compositing formula (as Krita):
+    (sa da b(s, d) + sa (1 - da) s + da (1 - sa) d) / (sa + da - sa da), sa being the src alpha times opacity.
+    With inherit_alpha, dst alpha is kept and masks src.
+    origin is the (x, y) position of the images in the document, used by the dissolve noise"""
+    dst = np.asarray(dst)
+    src = np.asarray(src)
+    if dst.shape != src.shape or dst.shape[-1] != 4:
+        raise ValueError("src and dst must be RGBA images of the same size")
+    if out is None:
+        out = np.empty(dst.shape, dtype=np.float32)
+
+    with np.errstate(all='ignore'):
+        s = src[..., :3].astype(np.float32, copy=False)
+        d = dst[..., :3].astype(np.float32, copy=False)
+        da = dst[..., 3:].astype(np.float32, copy=False)
+        sa = src[..., 3:] * np.float32(opacity)
+        if inherit_alpha:
+            sa = sa * da
+
+        special = _ALPHA.get(mode)
+        if special is not None:
+            color, alpha = special(s, d, sa, da, origin)
+        else:
+            kernel = _SEPARABLE.get(mode) or _NON_SEPARABLE.get(mode)
+            if kernel is None:
+                raise ValueError("Unknown blending mode: " + str(mode))
+            both = sa * da
+            alpha = sa + da - both
+            if mode == 'normal':
+                color = s * sa
+            else:
+                color = np.clip(kernel(s, d), 0.0, 1.0).astype(np.float32, copy=False)
+                color *= both
+                color += s * (sa - both)
+            color += d * (da - both)
+            # colors are not premultiplied: divide by alpha, 0 where transparent
+            inv = np.zeros_like(alpha)
+            np.divide(1.0, alpha, out=inv, where=alpha > 0.0)
+            color *= inv
+
+        out[..., :3] = color
+        out[..., 3:] = da if inherit_alpha else alpha
+    return out
+
+
+class Layer():
+    """A layer of the stack to flatten.
+    image is an (h, w, 4) RGBA array (float, or normalized uint8 / uint16), top row first,
+    with its top left corner at offset (x, y) in the document.
+    A group has children instead of an image, from bottom to top"""
+
+    __slots__ = ('image', 'mode', 'opacity', 'offset', 'visible', 'inherit_alpha', 'pass_through', 'children')
+
+    def __init__(self, image=None, mode='normal', opacity=1.0, offset=(0, 0), visible=True,
+            inherit_alpha=False, pass_through=False, children=None):
+        self.image = image
+        self.mode = mode
+        self.opacity = opacity
+        self.offset = offset
+        self.visible = visible
+        self.inherit_alpha = inherit_alpha
+        self.pass_through = pass_through
+        self.children = children
+
+
+def _as_float(a):
+    if a.dtype == np.uint8:
+        return a * np.float32(1.0 / 255.0)
+    if a.dtype == np.uint16:
+        return a * np.float32(1.0 / 65535.0)
+    return a.astype(np.float32, copy=False)
+
+
+def _composite(layers, buf, r0, c0, opacity=1.0):
+    """Composites layers over the tile buf at row r0, column c0 of the document"""
+    h, w = buf.shape[:2]
+    for layer in layers:
+        op = layer.opacity * opacity
+        if not layer.visible or op <= 0.0:
+            continue
+
+        if layer.children is not None:
+            if layer.pass_through:
+                # children blended in the parent, with the opacity of the group
+                _composite(layer.children, buf, r0, c0, op)
+                continue
+            group = np.zeros_like(buf)
+            _composite(layer.children, group, r0, c0)
+            blend(buf, group, layer.mode, op, buf, layer.inherit_alpha, (c0, r0))
+            continue
+
+        image = layer.image
+        if image is None:
+            continue
+        x, y = int(round(layer.offset[0])), int(round(layer.offset[1]))
+        # intersection, in tile coordinates
+        tr0 = max(y - r0, 0)
+        tr1 = min(y + image.shape[0] - r0, h)
+        tc0 = max(x - c0, 0)
+        tc1 = min(x + image.shape[1] - c0, w)
+        covers = tr0 < tr1 and tc0 < tc1
+        if layer.mode in _CLEARS_OUTSIDE and (tr0, tr1, tc0, tc1) != (0, h, 0, w):
+            src = np.zeros(buf.shape, dtype=np.float32)
+            if covers:
+                src[tr0:tr1, tc0:tc1] = _as_float(image[tr0 + r0 - y:tr1 + r0 - y, tc0 + c0 - x:tc1 + c0 - x])
+            blend(buf, src, layer.mode, op, buf, layer.inherit_alpha, (c0, r0))
+            continue
+        if not covers:
+            continue
+        src = _as_float(image[tr0 + r0 - y:tr1 + r0 - y, tc0 + c0 - x:tc1 + c0 - x])
+        view = buf[tr0:tr1, tc0:tc1]
+        blend(view, src, layer.mode, op, view, layer.inherit_alpha, (c0 + tc0, r0 + tr0))
+
+
+def flatten(layers, width, height, background=(0.0, 0.0, 0.0, 0.0), tile=None, workers=None, out=None):
+    """Flattens the Layer stack (from bottom to top) to a (height, width, 4) float32 image.
+    The image is composited by tiles of tile x tile pixels, in a pool of workers threads (NumPy releases the GIL)"""
+    if out is None:
+        out = np.empty((height, width, 4), dtype=np.float32)
+    elif out.shape != (height, width, 4) or out.dtype != np.float32:
+        raise ValueError("out must be a float32 array of shape " + str((height, width, 4)))
+    tile = tile or TILE_SIZE
+    background = np.asarray(background, dtype=np.float32)
+    tiles = [(r, c) for r in range(0, height, tile) for c in range(0, width, tile)]
+
+    def run(rc):
+        r, c = rc
+        buf = out[r:r + tile, c:c + tile]
+        buf[...] = background
+        _composite(layers, buf, r, c)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tiles) < 2:
+        for rc in tiles:
+            run(rc)
+    else:
+        with ThreadPoolExecutor(min(workers, len(tiles))) as executor:
+            for _ in executor.map(run, tiles):
+                pass
+    return out
+
+
+def _oca_layer(layer, frame, decode):
+    if layer.type == 'grouplayer':
+        children = [_oca_layer(l, frame, decode) for l in reversed(layer.childLayers)]
+        return Layer(None, layer.blendingMode, layer.opacity, (0, 0), layer.visible and not layer.reference,
+            layer.inheritAlpha, layer.passThrough, [c for c in children if c is not None])
+    f = layer.frameAt(frame)
+    if f is None or f.fileName == '':
+        return None
+    image = decode(f)
+    # OCA positions are the centers of the frames
+    offset = (f.position[0] - image.shape[1] / 2.0, f.position[1] - image.shape[0] / 2.0)
+    return Layer(image, layer.blendingMode, layer.opacity * f.opacity, offset,
+        layer.visible and not layer.reference, layer.inheritAlpha)
+
+
+def document_layers(document, frame, decode):
+    """The Layer stack of an oca.OCADocument at frame, from bottom to top.
+    decode(oca_frame) returns the image of the frame as an (h, w, 4) array, top row first.
+    Reference layers are hidden"""
+    layers = (_oca_layer(l, frame, decode) for l in reversed(document.layers))
+    return [l for l in layers if l is not None]
+
+
+def flatten_document(document, frame, decode, tile=None, workers=None):
+    """The image of an oca.OCADocument at frame, see document_layers and flatten"""
+    layers = document_layers(document, frame, decode)
+    return flatten(layers, document.width, document.height, document.backgroundColor, tile, workers)
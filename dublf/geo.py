@@ -1,9 +1,46 @@
 import numpy as np
 import math
 import mathutils as mu
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
 import bmesh
 
+# optional acceleration: the kernels are compiled with numba if available
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAS_NUMBA = numba is not None
+_BACKENDS = ("numba", "numpy")
+_backend = "numba" if HAS_NUMBA else "numpy"
+
+
+def get_backend():
+    """The active kernel backend: 'numba' or 'numpy'"""
+    return _backend
+
+
+def set_backend(name):
+    """Sets the kernel backend: 'numba' (if available) or 'numpy'"""
+    global _backend
+    if name not in _BACKENDS:
+        raise ValueError("Unknown backend: " + str(name))
+    if name == "numba" and not HAS_NUMBA:
+        raise ValueError("The numba backend is not available")
+    _backend = name
+
+
+def _jit(fn):
+    """Compiles fn with numba, None if numba is not available.
+    The compiled code is not cached on disk: the cache records the name the module
+    was imported with, and geo.py is loaded under several names (dublf.geo, an addon
+    package, the benchmarks)"""
+    if not HAS_NUMBA:
+        return None
+    return numba.njit(nogil=True)(fn)
+
 
 def dist_point_line(p, l1, l2):
     x0, y0 = p
@@ -16,8 +53,41 @@ def dist_point_line(p, l1, l2):
     return abs(y21 * x0 - x21 * y0 + x2 * y1 - y2 * x1) / math.sqrt(y21 ** 2 + x21 ** 2)
 
 
-# if HAS_NUMBA:
-#     dist_point_line = numba.njit(dist_point_line)
+def _dist_points_line_loop(pts, l1, l2):
+    x1, y1 = l1
+    x2, y2 = l2
+    y21 = y2 - y1
+    x21 = x2 - x1
+    tsq = math.sqrt(y21 ** 2 + x21 ** 2)
+    out = np.empty(len(pts), dtype=np.float64)
+    for i in range(len(pts)):
+        x0 = pts[i, 0]
+        y0 = pts[i, 1]
+        if x1 == x2 and y1 == y2:
+            out[i] = math.sqrt((x1 - x0) ** 2 + (y1 - y0) ** 2)
+        else:
+            out[i] = abs(y21 * x0 - x21 * y0 + x2 * y1 - y2 * x1) / tsq
+    return out
+
+
+_dist_points_line_nb = _jit(_dist_points_line_loop)
+
+
+def dist_points_line(pts, l1, l2):
+    """dist_point_line for an (N, 2) array of points"""
+    pts = np.ascontiguousarray(pts, dtype=np.float64).reshape(-1, 2)
+    l1 = (float(l1[0]), float(l1[1]))
+    l2 = (float(l2[0]), float(l2[1]))
+    if _backend == "numba":
+        return _dist_points_line_nb(pts, l1, l2)
+
+    x1, y1 = l1
+    x2, y2 = l2
+    y21 = y2 - y1
+    x21 = x2 - x1
+    if x1 == x2 and y1 == y2:
+        return np.sqrt((x1 - pts[:, 0]) ** 2 + (y1 - pts[:, 1]) ** 2)
+    return np.abs(y21 * pts[:, 0] - x21 * pts[:, 1] + x2 * y1 - y2 * x1) / math.sqrt(y21 ** 2 + x21 ** 2)
 
 
 def _dpcall3(chain, eps):
@@ -58,35 +128,191 @@ def _dpcall3(chain, eps):
     return result
 
 
-# @numba.jit
+def _dp_loop(xs, ys, eps):
+    """Douglas-Peucker kernel for the numba backend, see douglas_peucker_ids"""
+    n = len(xs)
+    # spans in the stack never overlap
+    stack = np.empty((n + 1, 2), dtype=np.intp)
+    stack[0, 0] = 0
+    stack[0, 1] = n - 1
+    top = 1
+    result = np.empty(n + 1, dtype=np.intp)
+    count = 0
+    while top > 0:
+        top -= 1
+        pl0 = stack[top, 0]
+        pl1 = stack[top, 1]
+
+        dmax = 0.0
+        index = 0
+        if pl1 - pl0 >= 2:
+            x1 = xs[pl0]
+            y1 = ys[pl0]
+            x2 = xs[pl1]
+            y2 = ys[pl1]
+            y21 = y2 - y1
+            x21 = x2 - x1
+            tsq2 = math.sqrt(y21 ** 2 + x21 ** 2)
+            xyyx = x2 * y1 - y2 * x1
+            for i in range(pl0 + 1, pl1):
+                if tsq2 == 0.0:
+                    d = math.sqrt((xs[i] - x1) ** 2 + (ys[i] - y1) ** 2)
+                else:
+                    d = abs(y21 * xs[i] - x21 * ys[i] + xyyx) / tsq2
+                if d > dmax:
+                    index = i
+                    dmax = d
+
+        if dmax <= eps:
+            result[count] = pl0
+            count += 1
+        else:
+            stack[top, 0] = index
+            stack[top, 1] = pl1
+            stack[top + 1, 0] = pl0
+            stack[top + 1, 1] = index - 1
+            top += 2
+
+    return result[:count].copy()
+
+
+_dp_nb = _jit(_dp_loop)
+
+
+# spans shorter than this are measured in plain python
+_DP_NUMPY_SPAN = 48
+
+
+def douglas_peucker_ids(points, eps):
+    """Simplifies a closed chain, returns the indices of the kept points.
+    points: (N, 2) array (or sequence of pairs)"""
+    pts = np.asarray(points, dtype=np.float64)
+    xs = pts[:, 0]
+    ys = pts[:, 1]
+    if _backend == "numba":
+        return _dp_nb(np.ascontiguousarray(xs), np.ascontiguousarray(ys), float(eps))
+
+    lxs = xs.tolist()
+    lys = ys.tolist()
+
+    stack = [(0, len(pts) - 1)]
+    result = []
+    while stack:
+        pl0, pl1 = stack.pop()
+
+        # no point between the span ends
+        if pl1 - pl0 < 2:
+            result.append(pl0)
+            continue
+
+        x1, y1 = lxs[pl0], lys[pl0]
+        x2, y2 = lxs[pl1], lys[pl1]
+        y21 = y2 - y1
+        x21 = x2 - x1
+        tsq2 = math.sqrt(y21 ** 2 + x21 ** 2)
+
+        if pl1 - pl0 < _DP_NUMPY_SPAN:
+            # short spans: the numpy call overhead is higher than the loop
+            dmax = 0.0
+            index = 0
+            xyyx = x2 * y1 - y2 * x1
+            for i in range(pl0 + 1, pl1):
+                if tsq2 == 0.0:
+                    d = math.sqrt((lxs[i] - x1) ** 2 + (lys[i] - y1) ** 2)
+                else:
+                    d = abs(y21 * lxs[i] - x21 * lys[i] + xyyx) / tsq2
+                if d > dmax:
+                    index = i
+                    dmax = d
+        else:
+            # distances of all the points of the span at once
+            if tsq2 == 0.0:
+                d = np.sqrt((xs[pl0 + 1 : pl1] - x1) ** 2 + (ys[pl0 + 1 : pl1] - y1) ** 2)
+            else:
+                xyyx = x2 * y1 - y2 * x1
+                d = np.abs(y21 * xs[pl0 + 1 : pl1] - x21 * ys[pl0 + 1 : pl1] + xyyx) / tsq2
+            # argmax returns the first maximum, like the strict comparison of _dpcall3
+            i = int(d.argmax())
+            index = pl0 + 1 + i
+            dmax = d[i]
+
+        if dmax <= eps:
+            result.append(pl0)
+        else:
+            stack.append((index, pl1))
+            stack.append((pl0, index - 1))
+
+    return np.array(result, dtype=np.intp)
+
+
 def douglas_peucker(ch, margin):
-    # t = ch[:]
-    # res = _dpcall2(ch, margin)
-    # assert len(res) <= len(t)
-    return _dpcall3(ch, margin)
+    return [ch[i] for i in douglas_peucker_ids(ch, margin)]
 
 
-class Chain:
-    def __init__(self):
-        self.verts = []
-        self.inner = False
-        self.bm_verts = []
-        self.invalid = False
+def _crossing_counts(segs, px, py, y_min):
+    """Number of crossings between the (S, 2, 2) segments and each test line (px, y_min) - (px, py)"""
+    px = np.atleast_1d(px)
+    py = np.atleast_1d(py)
+    x0 = segs[:, 0, 0, None]
+    y0 = segs[:, 0, 1, None]
+    x1 = segs[:, 1, 0, None]
+    y1 = segs[:, 1, 1, None]
+    dx = x1 - x0
+
+    # segment points at opposite sides of the tested line, and crossing it between its ends
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y = y0 + (px - x0) * ((y1 - y0) / dx)
+    hit = ((x0 - px) * (x1 - px) <= 0.0) & (dx != 0.0) & (y >= y_min) & (y <= py)
+    return np.count_nonzero(hit, axis=0)
+
+
+# initial capacity of the chain vertex buffers
+_CHAIN_MIN_SIZE = 16
 
-        self._pvert = None
-        self._cvert = None
 
-        self._minx = None
-        self._minx_id = 0
+def _bb_property(i, axis):
+    """Bounding box value (axis = 0 or 1) or id (axis = None) of a Chain,
+    i is 0: min x, 1: min y, 2: max x, 3: max y"""
 
-        self._miny = None
-        self._miny_id = 0
+    def getter(self):
+        self._update_bb()
+        vid = int(self._bb[i])
+        if axis is None:
+            return vid
+        return self._buf[vid, axis]
 
-        self._maxx = None
-        self._maxx_id = 0
+    return property(getter)
 
-        self._maxy = None
-        self._maxy_id = 0
+
+class Chain:
+    """A closed chain of 2D vertices, stored in a growable (N, 2) float64 buffer"""
+
+    __slots__ = (
+        "_buf",
+        "_n",
+        "_bb",
+        "_bb_n",
+        "inner",
+        "bm_verts",
+        "invalid",
+        "_segments",
+        "_np_segments",
+        "parent",
+        "children",
+    )
+
+    def __init__(self, verts=None):
+        self._buf = np.empty((_CHAIN_MIN_SIZE, 2), dtype=np.float64)
+        self._n = 0
+
+        # ids of the min x, min y, max x, max y vertices
+        # computed for the first _bb_n vertices
+        self._bb = np.zeros(4, dtype=np.intp)
+        self._bb_n = 0
+
+        self.inner = False
+        self.bm_verts = []
+        self.invalid = False
 
         self._segments = None
         self._np_segments = None
@@ -94,103 +320,123 @@ class Chain:
         self.parent = None
         self.children = []
 
+        if verts is not None:
+            self.extend(verts)
+
     def __len__(self):
-        return len(self.verts)
+        return self._n
+
+    @property
+    def verts(self):
+        """(N, 2) view on the vertex buffer"""
+        return self._buf[: self._n]
+
+    @verts.setter
+    def verts(self, verts):
+        verts = np.array(verts, dtype=np.float64).reshape(-1, 2)
+        self._buf = verts
+        self._n = len(verts)
+        self._bb_n = 0
+        self._segments = None
+        self._np_segments = None
+
+    _minx_id = _bb_property(0, None)
+    _miny_id = _bb_property(1, None)
+    _maxx_id = _bb_property(2, None)
+    _maxy_id = _bb_property(3, None)
+    _minx = _bb_property(0, 0)
+    _miny = _bb_property(1, 1)
+    _maxx = _bb_property(2, 0)
+    _maxy = _bb_property(3, 1)
+
+    def _reserve(self, size):
+        if size <= len(self._buf):
+            return
+        # amortized doubling
+        buf = np.empty((max(size, 2 * len(self._buf), _CHAIN_MIN_SIZE), 2), dtype=np.float64)
+        buf[: self._n] = self._buf[: self._n]
+        self._buf = buf
 
     def verify(self):
-        for i in range(len(self.verts)):
-            v0 = self.verts[i]
-            v1 = self.verts[(i + 1) % len(self.verts)]
-            if v0 == v1:
-                return False
-        if self.verts[0] == self.verts[-1]:
+        v = self.verts
+        if np.any(np.all(v == np.roll(v, -1, axis=0), axis=1)):
+            return False
+        if np.all(v[0] == v[-1]):
             return False
         return True
 
     def add_vert(self, vert):
-        if self._cvert == None:
-            self._pvert = vert
-            self._cvert = vert
-            self._miny = vert[1]
-            self._minx = vert[0]
-            self._maxy = vert[1]
-            self._maxx = vert[0]
-
-        self._pvert = self._cvert
-        self._cvert = vert
-
-        if self._cvert[0] < self._minx:
-            self._minx = self._cvert[0]
-            self._minx_id = len(self.verts)
-
-        if self._cvert[1] < self._miny:
-            self._miny = self._cvert[1]
-            self._miny_id = len(self.verts)
-
-        if self._cvert[0] > self._maxx:
-            self._maxx = self._cvert[0]
-            self._maxx_id = len(self.verts)
-
-        if self._cvert[1] > self._maxy:
-            self._maxy = self._cvert[1]
-            self._maxy_id = len(self.verts)
+        if self._n == len(self._buf):
+            self._reserve(self._n + 1)
+        self._buf[self._n] = vert
+        self._n += 1
+        self._segments = None
+        self._np_segments = None
 
-        self.verts.append(vert)
+    def extend(self, verts):
+        """Adds all the verts, an (N, 2) array or a sequence of pairs"""
+        verts = np.asarray(verts, dtype=np.float64).reshape(-1, 2)
+        self._reserve(self._n + len(verts))
+        self._buf[self._n : self._n + len(verts)] = verts
+        self._n += len(verts)
+        self._segments = None
+        self._np_segments = None
 
     def get_end_location(self, loc="BOTTOM"):
         if loc == "CENTER":
-            # x, y = 0.0, 0.0
-            # for v in self.verts:
-            #     x += v[0]
-            #     y += v[1]
-            # return (x / len(self.verts), y / len(self.verts))
-            maxx = self.verts[self._maxx_id][0]
-            minx = self.verts[self._minx_id][0]
-            maxy = self.verts[self._maxy_id][1]
-            miny = self.verts[self._miny_id][1]
-            return ((maxx + minx) / 2, (maxy + miny) / 2)
-
-        return self.verts[
-            {
-                "LEFT": self._miny_id,
-                "RIGHT": self._maxy_id,
-                "BOTTOM": self._minx_id,
-                "TOP": self._maxx_id,
-            }[loc]
-        ]
+            return ((self._maxx + self._minx) / 2, (self._maxy + self._miny) / 2)
+
+        return tuple(
+            self.verts[
+                {
+                    "LEFT": self._miny_id,
+                    "RIGHT": self._maxy_id,
+                    "BOTTOM": self._minx_id,
+                    "TOP": self._maxx_id,
+                }[loc]
+            ]
+        )
+
+    def _update_bb(self):
+        """Extends the bounding box to the vertices added since the last update"""
+        n0 = self._bb_n
+        if n0 == self._n:
+            return
+        new = self._buf[n0 : self._n]
+        ids = np.array(
+            (new[:, 0].argmin(), new[:, 1].argmin(), new[:, 0].argmax(), new[:, 1].argmax()),
+            dtype=np.intp,
+        )
+        ids += n0
+        if n0 == 0:
+            self._bb[:] = ids
+        else:
+            # like argmin/argmax, keep the first vertex on ties
+            axes = (0, 1, 0, 1)
+            old_vals = self._buf[self._bb, axes]
+            new_vals = self._buf[ids, axes]
+            better = np.concatenate((new_vals[:2] < old_vals[:2], new_vals[2:] > old_vals[2:]))
+            self._bb[better] = ids[better]
+        self._bb_n = self._n
 
     def _recalc_bb(self):
-        self._miny = self.verts[0][1]
-        self._minx = self.verts[0][0]
-        self._maxy = self.verts[0][1]
-        self._maxx = self.verts[0][0]
-        self._miny_id = 0
-        self._minx_id = 0
-        self._maxy_id = 0
-        self._maxx_id = 0
-        for i in range(len(self.verts)):
-            cvert = self.verts[i]
-            if cvert[0] < self._minx:
-                self._minx = cvert[0]
-                self._minx_id = i
-
-            if cvert[1] < self._miny:
-                self._miny = cvert[1]
-                self._miny_id = i
-
-            if cvert[0] > self._maxx:
-                self._maxx = cvert[0]
-                self._maxx_id = i
-
-            if cvert[1] > self._maxy:
-                self._maxy = cvert[1]
-                self._maxy_id = i
+        self._bb_n = 0
+        self._update_bb()
 
     def get_segments(self):
         if self._segments == None:
-            self._segments = list(zip(self.verts, list(self.verts[1:]) + [self.verts[0]]))
-            self._np_segments = np.array(self._segments)
-        return (self._segments, self._np_segments)
+            vl = list(map(tuple, self.verts.tolist()))
+            self._segments = list(zip(vl, vl[1:] + vl[:1]))
+        return (self._segments, self._get_np_segments())
+
+    def _get_np_segments(self):
+        if self._np_segments is None:
+            v = self.verts
+            self._np_segments = np.empty((len(v), 2, 2), dtype=np.float64)
+            self._np_segments[:, 0] = v
+            self._np_segments[:-1, 1] = v[1:]
+            self._np_segments[-1:, 1] = v[:1]
+        return self._np_segments
 
     def inside(self, other):
         if (
@@ -201,49 +447,217 @@ class Chain:
         ):
             return False
 
+        px, py = self._test_point()
+        isect_count = _crossing_counts(other._get_np_segments(), px, py, other._miny - 1.0)
+        return isect_count[0] % 2 != 0
+
+    def _test_point(self):
+        """Point used to test if the chain is inside another one"""
         mp = self.verts[self._miny_id]
-        tlp = mp[0] + 0.001
-        test_line = ((tlp, other._miny - 1.0), (tlp, mp[1]))
-        isect_count = 0
-
-        # ...if segment points at opposite sides of the tested line
-        np_segs = other.get_segments()[1]
-        seg_ids = (np_segs[:, 0, 0] - tlp) * (np_segs[:, 1, 0] - tlp) <= 0.0
-        np_segs_line = np_segs[seg_ids]
-        for s in np_segs_line:
-            if mu.geometry.intersect_line_line_2d(test_line[0], test_line[1], s[0], s[1]):
-                isect_count += 1
-        return isect_count % 2 != 0
+        return mp[0] + 0.001, mp[1]
 
     def simplify(self, error):
-        tmp = douglas_peucker(self.verts, error)
-        if len(tmp) > 3:
-            self.verts = tmp
-            self._recalc_bb()
+        ids = douglas_peucker_ids(self.verts, error)
+        if len(ids) > 3:
+            self.verts = self.verts[ids]
         else:
             self.invalid = True
 
-    def smooth(self, amount, t):
-        ch = self.verts
-        for _ in range(t):
-            for i in range(len(ch)):
-                vl = ch[(i - 1) % len(ch)]
-                vr = ch[(i + 1) % len(ch)]
-                x = ((vl[0] + vr[0]) * 0.5) * amount + ch[i][0] * (1.0 - amount)
-                y = ((vl[1] + vr[1]) * 0.5) * amount + ch[i][1] * (1.0 - amount)
-                ch[i] = (x, y)
-        self.verts = ch
+    def smooth(self, amount, t, mu=None):
+        """Laplacian (or Taubin, with mu) smoothing, see smooth_verts"""
+        smooth_verts(self.verts, (0, self._n), amount, t, mu)
+        self._bb_n = 0
+        self._segments = None
+        self._np_segments = None
 
 
-def lines_square(img, cutoff):
-    nm = img > cutoff
+def _smooth_loop(verts, offsets, factors, t):
+    """Smoothing kernel for the numba backend, see smooth_verts"""
+    src = verts.copy()
+    dst = np.empty_like(verts)
+    for _ in range(t):
+        for f in factors:
+            for c in range(len(offsets) - 1):
+                s = offsets[c]
+                e = offsets[c + 1]
+                for i in range(s, e):
+                    p = i - 1 if i > s else e - 1
+                    q = i + 1 if i < e - 1 else s
+                    x = src[i, 0]
+                    y = src[i, 1]
+                    dst[i, 0] = x + ((src[p, 0] + src[q, 0]) * 0.5 - x) * f
+                    dst[i, 1] = y + ((src[p, 1] + src[q, 1]) * 0.5 - y) * f
+            src, dst = dst, src
+    verts[:, :] = src
+
+
+_smooth_nb = _jit(_smooth_loop)
+
+
+def smooth_verts(verts, offsets, amount, t, mu=None):
+    """Laplacian smoothing, in place, of closed chains stored in one (N, 2) float buffer.
+    offsets: start of each chain in the buffer, followed by N.
+    amount: weight of the neighbours average; if mu is set (negative, with |mu| > amount),
+    each iteration is followed by a mu step which compensates the shrinkage (Taubin smoothing)"""
+    offsets = np.asarray(offsets, dtype=np.intp)
+    starts = offsets[:-1]
+    ends = offsets[1:] - 1
+    if len(verts) == 0:
+        return verts
+
+    factors = (amount,) if mu is None else (amount, mu)
+    if _backend == "numba" and verts.dtype == np.float64 and verts.flags.c_contiguous:
+        _smooth_nb(verts, offsets, np.array(factors, dtype=np.float64), t)
+        return verts
+
+    avg = np.empty_like(verts)
+    tmp = np.empty_like(verts)
+    for _ in range(t):
+        for f in factors:
+            # neighbours: the shifted buffer, wrapped at the chain ends
+            avg[1:] = verts[:-1]
+            avg[starts] = verts[ends]
+            tmp[:-1] = verts[1:]
+            tmp[ends] = verts[starts]
+            avg += tmp
+            avg *= 0.5
+            avg -= verts
+            avg *= f
+            verts += avg
+    return verts
 
-    # make black borders
-    nm[0, :] = False
-    nm[-1, :] = False
-    nm[:, 0] = False
-    nm[:, -1] = False
 
+def smooth_chains(chains, amount, t, mu=None):
+    """Smoothes all the chains at once, see smooth_verts"""
+    if not chains:
+        return
+    offsets = np.zeros(len(chains) + 1, dtype=np.intp)
+    np.cumsum([len(ch) for ch in chains], out=offsets[1:])
+    verts = np.concatenate([ch.verts for ch in chains])
+    smooth_verts(verts, offsets, amount, t, mu)
+    for i, ch in enumerate(chains):
+        ch.verts = verts[offsets[i] : offsets[i + 1]]
+
+
+# max number of (segment, point) pairs tested at once by classify_chains
+_CROSSING_BLOCK = 1 << 22
+
+
+def classify_chains(chains):
+    """Sets the parent, children and inner (hole) attributes of all the chains at once,
+    using a uniform grid over the chain bounding boxes"""
+    for ch in chains:
+        ch.parent = None
+        ch.children = []
+        ch.inner = False
+    n = len(chains)
+    if n < 2:
+        return
+
+    bb = np.array([(ch._minx, ch._miny, ch._maxx, ch._maxy) for ch in chains], dtype=np.float64)
+    pts = np.array([ch._test_point() for ch in chains], dtype=np.float64)
+
+    # uniform grid, each chain is registered in all the cells its bounding box covers
+    size = int(min(max(math.sqrt(n), 1), 128))
+    origin = bb[:, :2].min(axis=0)
+    cell = (bb[:, 2:].max(axis=0) - origin) / size
+    cell[cell == 0.0] = 1.0
+
+    def cell_ids(xy):
+        return np.clip(((xy - origin) / cell).astype(np.intp), 0, size - 1)
+
+    lo = cell_ids(bb[:, :2])
+    hi = cell_ids(bb[:, 2:])
+    nx = hi[:, 0] - lo[:, 0] + 1
+    ny = hi[:, 1] - lo[:, 1] + 1
+    counts = nx * ny
+    owner = np.repeat(np.arange(n), counts)
+    local = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    cells = (lo[owner, 0] + local % nx[owner]) * size + lo[owner, 1] + local // nx[owner]
+    order = np.argsort(cells, kind="stable")
+    owner = owner[order]
+    indptr = np.searchsorted(cells[order], np.arange(size * size + 1))
+
+    # candidate (chain, container) pairs: the container bounding box holds the test point
+    pc = cell_ids(pts)
+    pcell = pc[:, 0] * size + pc[:, 1]
+    start = indptr[pcell]
+    counts = indptr[pcell + 1] - start
+    inner = np.repeat(np.arange(n), counts)
+    local = np.arange(len(inner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    outer = owner[np.repeat(start, counts) + local]
+    px = pts[inner, 0]
+    py = pts[inner, 1]
+    keep = (
+        (inner != outer)
+        & (bb[outer, 0] <= px)
+        & (px <= bb[outer, 2])
+        & (bb[outer, 1] <= py)
+        & (py <= bb[outer, 3])
+    )
+    inner = inner[keep]
+    outer = outer[keep]
+
+    # even-odd tests, grouped by container
+    inside = np.zeros(len(inner), dtype=bool)
+    order = np.argsort(outer, kind="stable")
+    bounds = np.flatnonzero(np.diff(outer[order])) + 1
+    for group in np.split(order, bounds):
+        if len(group) == 0:
+            continue
+        other = chains[outer[group[0]]]
+        segs = other._get_np_segments()
+        step = max(1, _CROSSING_BLOCK // max(len(segs), 1))
+        for i in range(0, len(group), step):
+            ids = group[i : i + step]
+            isect = _crossing_counts(segs, pts[inner[ids], 0], pts[inner[ids], 1], bb[outer[ids], 1] - 1.0)
+            inside[ids] = isect % 2 != 0
+    inner = inner[inside]
+    outer = outer[inside]
+
+    # the parent is the deepest container
+    depth = np.bincount(inner, minlength=n)
+    parent = np.full(n, -1, dtype=np.intp)
+    order = np.lexsort((depth[outer], inner))
+    last = np.flatnonzero(np.diff(inner[order], append=-1))
+    parent[inner[order[last]]] = outer[order[last]]
+    for i in range(n):
+        ch = chains[i]
+        ch.inner = bool(depth[i] % 2)
+        if parent[i] >= 0:
+            ch.parent = chains[parent[i]]
+            ch.parent.children.append(ch)
+
+
+class _SegmentBuffer:
+    """Growable (M, 2, 2) segment array, with amortized doubling"""
+
+    __slots__ = ("data", "size")
+
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.empty((capacity, 2, 2), dtype=dtype)
+        self.size = 0
+
+    def add(self, i0, j0, i1, j1):
+        """Appends the segments (i0, j0) - (i1, j1)"""
+        end = self.size + len(i0)
+        if end > len(self.data):
+            data = np.empty((max(end, 2 * len(self.data)), 2, 2), dtype=self.data.dtype)
+            data[: self.size] = self.data[: self.size]
+            self.data = data
+        seg = self.data[self.size : end]
+        seg[:, 0, 0] = i0
+        seg[:, 0, 1] = j0
+        seg[:, 1, 0] = i1
+        seg[:, 1, 1] = j1
+        self.size = end
+
+    def array(self):
+        return self.data[: self.size]
+
+
+def _fix_square_mask(nm):
+    """Breaks one vert corners and fills single pixels of the mask, in place"""
     # break one vert corners
     one_vert = ~nm[:-1, :-1] & nm[1:, :-1] & nm[:-1, 1:] & ~nm[1:, 1:]
     nm[:-1, :-1] = np.where(one_vert, True, nm[:-1, :-1])
@@ -254,220 +668,724 @@ def lines_square(img, cutoff):
     not_single = nm[:-2, 1:-1] & nm[2:, 1:-1] & nm[1:-1, :-2] & nm[1:-1, 2:]
     nm[1:-1, 1:-1] = np.where(not_single * (~nm[1:-1, 1:-1]), True, nm[1:-1, 1:-1])
 
-    # edge: l[x,y] -> l[x,y-1]
-    ylocs = np.argwhere(nm[1:, :] != nm[:-1, :])
-    y_verts = [((l[0], l[1]), (l[0], l[1] - 1)) for l in ylocs]
 
-    nmt = nm.copy()
-    nmt[1:-1, :] = False
-    ylocs = np.argwhere(nmt)
-    y_verts.extend([((l[0], l[1]), (l[0], l[1] - 1)) for l in ylocs])
+def lines_square_np(img, cutoff, band_rows=256):
+    """Pixel edge contours, returns the segments as an (M, 2, 2) int32 array.
+    The image is thresholded and processed by bands of rows,
+    so memory is proportional to the band size and the contour length"""
+    height, width = img.shape[:2]
+    band_rows = max(1, int(band_rows))
+    border_rows = sorted({0, height - 1})
+    border_cols = np.array(sorted({0, width - 1}), dtype=np.intp)
+
+    x_edges = _SegmentBuffer(np.int32)
+    x_border = _SegmentBuffer(np.int32)
+    y_edges = _SegmentBuffer(np.int32)
+    y_border = _SegmentBuffer(np.int32)
+
+    for r0 in range(0, height, band_rows):
+        r1 = min(r0 + band_rows, height)
+
+        # the fixed mask of a row depends on the source rows [row - 1, row + 3]
+        a = max(0, r0 - 1)
+        b = min(height, r1 + 4)
+        nm = img[a:b] > cutoff
+
+        # make black borders
+        if a == 0:
+            nm[0, :] = False
+        if b == height:
+            nm[-1, :] = False
+        nm[:, 0] = False
+        nm[:, -1] = False
+
+        _fix_square_mask(nm)
+
+        # final rows [r0, r1], the last one for the y edges
+        band = nm[r0 - a : min(r1 + 1, height) - a]
+        rows = r1 - r0
+
+        # edge: l[x,y] -> l[x-1,y]
+        ii, jj = np.nonzero(band[:rows, 1:] != band[:rows, :-1])
+        ii += r0
+        x_edges.add(ii, jj, ii - 1, jj)
+
+        ii, jj = np.nonzero(band[:rows, border_cols])
+        ii += r0
+        jj = border_cols[jj]
+        x_border.add(ii, jj, ii - 1, jj)
+
+        # edge: l[x,y] -> l[x,y-1]
+        y_rows = min(r1, height - 1) - r0
+        ii, jj = np.nonzero(band[1 : y_rows + 1] != band[:y_rows])
+        ii += r0
+        y_edges.add(ii, jj, ii, jj - 1)
+
+        # first and last rows
+        for row in border_rows:
+            if r0 <= row < r1:
+                jj = np.flatnonzero(band[row - r0])
+                ii = np.full(len(jj), row)
+                y_border.add(ii, jj, ii, jj - 1)
+
+    return np.concatenate((x_edges.array(), x_border.array(), y_edges.array(), y_border.array()))
 
-    # edge: l[x,y] -> l[x-1,y]
-    xlocs = np.argwhere(nm[:, 1:] != nm[:, :-1])
-    x_verts = [((l[0], l[1]), (l[0] - 1, l[1])) for l in xlocs]
 
-    nmt = nm.copy()
-    nmt[:, 1:-1] = False
-    xlocs = np.argwhere(nmt)
-    x_verts.extend([((l[0], l[1]), (l[0] - 1, l[1])) for l in xlocs])
+def lines_square(img, cutoff):
+    """Pixel edge contours, returns the segments as a list of pairs of tuples"""
+    return [(tuple(p0), tuple(p1)) for p0, p1 in lines_square_np(img, cutoff).tolist()]
+
+
+# marching squares cases, in output order
+# cell code: bit 0: [i, j], bit 1: [i + 1, j], bit 2: [i, j + 1], bit 3: [i + 1, j + 1]
+# segment: the two end points, as offsets in the cell (0.5 = on the edge crossing)
+_MARCHING_CASES = (
+    (0b0001, (0, 0.5, 0.5, 0)),
+    (0b0010, (0.5, 0, 1, 0.5)),
+    (0b0100, (0, 0.5, 0.5, 1)),
+    (0b1000, (0.5, 1, 1, 0.5)),
+    (0b1110, (0, 0.5, 0.5, 0)),
+    (0b1101, (0.5, 0, 1, 0.5)),
+    (0b1011, (0, 0.5, 0.5, 1)),
+    (0b0111, (0.5, 1, 1, 0.5)),
+    (0b0011, (0, 0.5, 1, 0.5)),
+    (0b1010, (0.5, 0, 0.5, 1)),
+    (0b1100, (0, 0.5, 1, 0.5)),
+    (0b0101, (0.5, 0, 0.5, 1)),
+    # \
+    (0b0110, (0, 0.5, 0.5, 1)),
+    (0b0110, (0.5, 0, 1, 0.5)),
+    # /
+    (0b1001, (0, 0.5, 0.5, 0)),
+    (0b1001, (0.5, 1, 1, 0.5)),
+)
+
+
+def _marching_codes(nm):
+    """Case code of each cell of the mask"""
+    codes = nm[:-1, :-1].astype(np.uint8)
+    codes += nm[1:, :-1] * np.uint8(2)
+    codes += nm[:-1, 1:] * np.uint8(4)
+    codes += nm[1:, 1:] * np.uint8(8)
+    return codes
+
+
+# crossings are scaled to stay strictly inside their edge
+_EDGE_SCALE = 0.999
+
+
+def _edge_keys(i, j, a, b, width, size):
+    """Keys of the edges described by (a, b) in the cells [i, j]:
+    the flat index of their first sample, + size for the [i, j] - [i + 1, j] edges"""
+    if a != 0.5:
+        # [i + a, j] - [i + a, j + 1] edge
+        return (i + a) * width + j
+    # [i, j + b] - [i + 1, j + b] edge
+    return i * width + (j + b) + size
+
+
+def _crossing_table(img, cutoff, flat, step, origin=(0, 0), edge_scale=_EDGE_SCALE):
+    """Interpolated locations of the crossings on the [flat] - [flat + step] edges,
+    origin is the location of img[0, 0] in the output coordinates"""
+    width = img.shape[1]
+    imgf = img.reshape(-1)
+    da = np.abs(cutoff - imgf[flat])
+    db = np.abs(cutoff - imgf[flat + step])
+    td = da + db
+    nz = td != 0
+    t = np.zeros(len(flat), dtype=np.float64)
+    t[nz] = da[nz] * edge_scale / td[nz]
+
+    i = flat // width
+    verts = np.empty((len(flat), 2), dtype=np.float64)
+    verts[:, 0] = i + origin[0]
+    verts[:, 1] = (flat - i * width) + origin[1]
+    verts[:, 0 if step != 1 else 1] += t
+    return verts
 
-    return x_verts + y_verts
 
+def _marching_segments(img, cutoff, nm, origin=(0, 0)):
+    """Marching squares on the mask nm, without changing its borders"""
+    img = np.ascontiguousarray(img)
+    codes = _marching_codes(nm)
+    ci, cj = np.nonzero((codes != 0) & (codes != 15))
+    return _cell_segments(img, cutoff, ci, cj, codes[ci, cj], origin)
+
+
+def _case_groups(ci, cj, codes):
+    """Groups the boundary cells [ci, cj] by marching case, keeping them in row-major order.
+    Returns (count, groups): the segment count, and (start, i, j, a0, b0, a1, b1) for each case"""
+    order = np.argsort(codes, kind="stable")
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=16))))
+    groups = []
+    start = 0
+    for code, ends in _MARCHING_CASES:
+        ids = order[bounds[code] : bounds[code + 1]]
+        if len(ids):
+            groups.append((start, ci[ids], cj[ids]) + ends)
+            start += len(ids)
+    return start, groups
+
+
+def _cell_graph(img, cutoff, ci, cj, codes, origin=(0, 0), edge_scale=_EDGE_SCALE):
+    """Contour graph of the boundary cells [ci, cj] (in row-major order) with their case codes.
+    Each edge crossing is computed once and shared by the segments of the two cells around it.
+    Returns (verts, edges): the (V, 2) crossings, row edges then column edges in row-major order,
+    and the (E, 2) crossing ids of the segments"""
+    width = img.shape[1]
+    size = img.size
+
+    count, groups = _case_groups(ci, cj, codes)
+    keys = np.empty((count, 2), dtype=np.intp)
+    for start, i, j, a0, b0, a1, b1 in groups:
+        keys[start : start + len(i), 0] = _edge_keys(i, j, a0, b0, width, size)
+        keys[start : start + len(i), 1] = _edge_keys(i, j, a1, b1, width, size)
+
+    # crossing ids: the sorted unique keys are the row edges then the column edges, in row-major order
+    uniq, inverse = np.unique(keys.reshape(-1), return_inverse=True)
+    split = np.searchsorted(uniq, size)
+
+    verts = np.concatenate((
+        _crossing_table(img, cutoff, uniq[:split], 1, origin, edge_scale),
+        _crossing_table(img, cutoff, uniq[split:] - size, width, origin, edge_scale),
+    ))
+    return verts, inverse.reshape(-1, 2)
+
+
+def _cell_segments(img, cutoff, ci, cj, codes, origin=(0, 0)):
+    """Segments of the boundary cells [ci, cj] (in row-major order) with their case codes.
+    The crossings are computed for each segment end: when only the segments are needed,
+    this is cheaper than sharing them like _cell_graph"""
+    width = img.shape[1]
+    count, groups = _case_groups(ci, cj, codes)
+    segs = np.empty((count, 2, 2), dtype=np.float64)
+    for start, i, j, a0, b0, a1, b1 in groups:
+        for end, a, b in ((0, a0, b0), (1, a1, b1)):
+            if a != 0.5:
+                crossings = _crossing_table(img, cutoff, (i + a) * width + j, 1, origin)
+            else:
+                crossings = _crossing_table(img, cutoff, i * width + (j + b), width, origin)
+            segs[start : start + len(i), end] = crossings
+    return segs
 
-def lines_marching(img, cutoff, nm):
+
+def lines_marching_np(img, cutoff, nm):
+    """Marching squares, returns all the segments as an (M, 2, 2) float array"""
     # make black borders
     nm[0, :] = False
     nm[-1, :] = False
     nm[:, 0] = False
     nm[:, -1] = False
 
-    zz = nm[:-1, :-1]
-    oz = nm[1:, :-1]
-    zo = nm[:-1, 1:]
-    oo = nm[1:, 1:]
-
-    verts = []
-
-    ct_img = np.abs(cutoff - img)
-
-    def _dif_y(v, pos):
-        xpos = pos[0] + v[0]
-        da = ct_img[xpos, pos[1]]
-        db = ct_img[xpos, pos[1] + 1]
-        td = da + db
-        x, y = v[0], 0.0
-        if td != 0:
-            y = da * 0.999 / td
-        return (x, y)
-
-    def _dif_x(v, pos):
-        ypos = pos[1] + v[1]
-        da = ct_img[pos[0], ypos]
-        db = ct_img[pos[0] + 1, ypos]
-        td = da + db
-        x, y = 0.0, v[1]
-        if td != 0:
-            x = da * 0.999 / td
-        return (x, y)
-
-    def _add(ia, da, check=None):
-        ad0 = (da[0], da[1])
-        ad1 = (da[2], da[3])
-
-        locs = np.argwhere(ia)
-
-        # make sure we are dealing with the same data we think we are
-        # if check:
-        #     for l in locs[:10]:
-        #         ta = []
-        #         ta.append(img[l[0], l[1]] > cutoff)
-        #         ta.append(img[l[0] + 1, l[1]] > cutoff)
-        #         ta.append(img[l[0], l[1] + 1] > cutoff)
-        #         ta.append(img[l[0] + 1, l[1] + 1] > cutoff)
-        #         assert sum(check[i] == v for i, v in enumerate(ta)) == 4
-
-        f0 = _dif_y if ad0[0] == 0 or ad0[0] == 1 else _dif_x
-        f1 = _dif_y if ad1[0] == 0 or ad1[0] == 1 else _dif_x
-
-        for l in locs:
-            m0x, m0y = f0(ad0, l)
-            p0 = (l[0] + m0x, l[1] + m0y)
-
-            m1x, m1y = f1(ad1, l)
-            p1 = (l[0] + m1x, l[1] + m1y)
-
-            verts.append((p0, p1))
-
-    _add(zz & ~oz & ~zo & ~oo, [0, 0.5, 0.5, 0])
-    _add(~zz & oz & ~zo & ~oo, [0.5, 0, 1, 0.5])
-    _add(~zz & ~oz & zo & ~oo, [0, 0.5, 0.5, 1])
-    _add(~zz & ~oz & ~zo & oo, [0.5, 1, 1, 0.5])
-
-    _add(~zz & oz & zo & oo, [0, 0.5, 0.5, 0])
-    _add(zz & ~oz & zo & oo, [0.5, 0, 1, 0.5])
-    _add(zz & oz & ~zo & oo, [0, 0.5, 0.5, 1])
-    _add(zz & oz & zo & ~oo, [0.5, 1, 1, 0.5])
-
-    # _add(zz & oz & ~zo & ~oo, [0, 0.5, 1, 0.5], check=[1, 1, 0, 0])
-    # _add(~zz & oz & ~zo & oo, [0.5, 0, 0.5, 1], check=[0, 1, 0, 1])
-    # _add(~zz & ~oz & zo & oo, [0, 0.5, 1, 0.5], check=[0, 0, 1, 1])
-    # _add(zz & ~oz & zo & ~oo, [0.5, 0, 0.5, 1], check=[1, 0, 1, 0])
-
-    _add(zz & oz & ~zo & ~oo, [0, 0.5, 1, 0.5])
-    _add(~zz & oz & ~zo & oo, [0.5, 0, 0.5, 1])
-
-    _add(~zz & ~oz & zo & oo, [0, 0.5, 1, 0.5])
-    _add(zz & ~oz & zo & ~oo, [0.5, 0, 0.5, 1])
-
-    # \
-    cross_a = ~zz & oz & zo & ~oo
-    _add(cross_a, [0, 0.5, 0.5, 1])
-    _add(cross_a, [0.5, 0, 1, 0.5])
-
-    # /
-    cross_b = zz & ~oz & ~zo & oo
-    _add(cross_b, [0, 0.5, 0.5, 0])
-    _add(cross_b, [0.5, 1, 1, 0.5])
-
-    return verts
+    return _marching_segments(img, cutoff, nm)
 
 
-def parse_segments(self, l_verts):
-    # create verts and connect edges
-    edges = set()
-    verts = []
-    vert_ids = {}
-    vert_edges = defaultdict(list)
-    for l in l_verts:
-        v0, v1 = l
-        ev0, ev1 = 0, 0
-
-        # limit to bounds
-        if v0[0] < 0 or v0[1] < 0 or v1[0] < 0 or v1[1] < 0:
-            continue
+def marching_graph(img, cutoff, nm, edge_scale=_EDGE_SCALE):
+    """Marching squares, returns the contour graph (verts, edges) like segment_graph,
+    with the segments sharing the crossings exactly instead of merging close end points"""
+    nm[0, :] = False
+    nm[-1, :] = False
+    nm[:, 0] = False
+    nm[:, -1] = False
 
-        if v0 in vert_ids:
-            ev0 = vert_ids[v0]
-        else:
-            verts.append(v0)
-            ev0 = len(verts) - 1
-            vert_ids[v0] = ev0
+    img = np.ascontiguousarray(img)
+    codes = _marching_codes(nm)
+    ci, cj = np.nonzero((codes != 0) & (codes != 15))
+    return _cell_graph(img, cutoff, ci, cj, codes[ci, cj], edge_scale=edge_scale)
+
+
+def trace_marching(img, cutoff, nm, edge_scale=_EDGE_SCALE):
+    """Marching squares and chain parsing without the segment array.
+    Returns (verts, chains, failures) like parse_segments_np"""
+    verts, edges = marching_graph(img, cutoff, nm, edge_scale)
+    chains, failures = chain_ids(len(verts), edges)
+    return verts, chains, failures
+
+
+def lines_marching_levels(img, cutoffs, workers=None):
+    """Marching squares at several cutoff values, with img > cutoff as the mask.
+    The image is scanned once for all the levels: each sample gets the number of levels it is
+    above, each cell the range of levels between its corners, and each level then only processes
+    its own boundary cells. Levels run in a thread pool if workers > 1.
+    Returns the list of the (M, 2, 2) segment arrays of each level"""
+    img = np.ascontiguousarray(img)
+    cutoffs = list(cutoffs)
+    if not cutoffs:
+        return []
+    order = sorted(range(len(cutoffs)), key=cutoffs.__getitem__)
+
+    # level of each sample: img > cutoffs[order[k]] for k < q
+    q = np.zeros(img.shape, dtype=np.uint8 if len(cutoffs) < 256 else np.uint16)
+    above = np.empty(img.shape, dtype=bool)
+    for i in order:
+        np.greater(img, cutoffs[i], out=above)
+        q += above
+    # black borders
+    q[0, :] = 0
+    q[-1, :] = 0
+    q[:, 0] = 0
+    q[:, -1] = 0
+
+    # a cell is on the contour of the levels qmin <= k < qmax
+    r = np.minimum(q[:-1], q[1:])
+    qmin = np.minimum(r[:, :-1], r[:, 1:])
+    r = np.maximum(q[:-1], q[1:])
+    qmax = np.maximum(r[:, :-1], r[:, 1:])
+    del r
+    cells = np.flatnonzero(qmin < qmax)
+    lo = np.take(qmin, cells).astype(np.intp)
+    hi = np.take(qmax, cells).astype(np.intp)
+    del qmin, qmax
+    width = img.shape[1]
+    ci = cells // (width - 1)
+    cj = cells - ci * (width - 1)
+    flat = ci * width + cj
+    corners = np.stack([np.take(q, flat + offset) for offset in (0, width, 1, width + 1)])
+    del q, cells, flat
+
+    # (cell, level) pairs grouped by level, the cells staying in row-major order
+    counts = hi - lo
+    level_ids = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    level_ids += np.arange(len(level_ids))
+    level_ids = level_ids.astype(corners.dtype)
+    by_level = np.argsort(level_ids, kind="stable")
+    pairs = np.repeat(np.arange(len(ci)), counts)[by_level]
+    bounds = np.searchsorted(level_ids[by_level], np.arange(len(cutoffs) + 1))
+    del level_ids, by_level
+
+    def level(k):
+        cell = pairs[bounds[k] : bounds[k + 1]]
+        c = corners[:, cell] > k
+        codes = c[0].astype(np.uint8)
+        codes += c[1] * np.uint8(2)
+        codes += c[2] * np.uint8(4)
+        codes += c[3] * np.uint8(8)
+        return _cell_segments(img, cutoffs[order[k]], ci[cell], cj[cell], codes)
+
+    if workers is not None and workers > 1 and len(cutoffs) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            segs = list(executor.map(level, range(len(cutoffs))))
+    else:
+        segs = [level(k) for k in range(len(cutoffs))]
 
-        if v1 in vert_ids:
-            ev1 = vert_ids[v1]
-        else:
-            verts.append(v1)
-            ev1 = len(verts) - 1
-            vert_ids[v1] = ev1
+    result = [None] * len(cutoffs)
+    for k, i in enumerate(order):
+        result[i] = segs[k]
+    return result
 
-        edges.add((ev0, ev1))
 
-        vert_edges[ev0].append(ev1)
-        vert_edges[ev1].append(ev0)
+def lines_marching(img, cutoff, nm):
+    """Marching squares, returns the segments as a list of pairs of tuples"""
+    return [(tuple(p0), tuple(p1)) for p0, p1 in lines_marching_np(img, cutoff, nm).tolist()]
+
+
+def segment_graph(segs, tolerance=1e-6):
+    """Merges the end points of an (M, 2, 2) segment array.
+    Segments with negative coordinates are ignored.
+    Returns (verts, edges): the (V, 2) vertices and the (E, 2) vertex ids of the segments"""
+    segs = np.asarray(segs, dtype=np.float64).reshape(-1, 2, 2)
+
+    # limit to bounds
+    segs = segs[~np.any(segs < 0.0, axis=(1, 2))]
+
+    # end points closer than the tolerance are the same vertex
+    pts = segs.reshape(-1, 2)
+    keys = np.round(pts / tolerance).astype(np.int64)
+    order = np.lexsort((keys[:, 1], keys[:, 0]))
+    skeys = keys[order]
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = np.any(skeys[1:] != skeys[:-1], axis=1)
+    inverse = np.empty(len(order), dtype=np.intp)
+    inverse[order] = np.cumsum(is_first) - 1
+    return pts[order[is_first]], inverse.reshape(-1, 2)
+
+
+def chain_ids(vert_count, edges):
+    """Walks the closed chains of a graph.
+    Returns (chains, failures): the list of vertex id arrays of the closed chains,
+    and the number of open or branching chains which were dropped"""
+    edges = np.asarray(edges, dtype=np.intp).reshape(-1, 2)
+    if len(edges) == 0:
+        return [], 0
+
+    # CSR adjacency, neighbours in segment order
+    src = edges.reshape(-1)
+    dst = edges[:, ::-1].reshape(-1)
+    degree = np.bincount(src, minlength=vert_count)
+    indptr = np.zeros(vert_count + 1, dtype=np.intp)
+    np.cumsum(degree, out=indptr[1:])
+    indices = dst[np.argsort(src, kind="stable")]
+
+    # only degree 2 verts can be in a closed chain
+    is_link = degree == 2
+    last = len(indices) - 1
+    first = np.where(degree > 0, indices[np.minimum(indptr[:-1], last)], -1)
+    second = np.where(is_link, indices[np.minimum(indptr[:-1] + 1, last)], -1)
+    is_link = is_link.tolist()
+    first = first.tolist()
+    second = second.tolist()
 
-    # parse chains
     chains = []
-    remaining = set(list(range(len(verts))))
     failures = 0
-    while len(remaining) > 0:
-        chains.append(Chain())
-        head = remaining.pop()
-        prev = head
-        start = head
-        chains[-1].add_vert(verts[head])
-        while True:
-            # connected vert ids
-            veh = vert_edges[head]
-
-            if len(veh) == 1:
-                head = veh[0]
-                remaining.discard(head)
-                chains[-1].add_vert(verts[head])
-                failures += 1
-                # added.add(head)
-                break
-
-            if len(veh) > 2:
-                chains.pop()
-                remaining.discard(head)
-                failures += 1
-                break
-
-            here = veh[0] if veh[0] != head and veh[0] != prev else veh[1]
+    visited = bytearray(vert_count)
+    for start in range(vert_count):
+        if visited[start]:
+            continue
+        visited[start] = 1
+
+        chain = [start]
+        prev = start
+        head = start
+        closed = False
+        while is_link[head]:
+            here = first[head] if first[head] != head and first[head] != prev else second[head]
             prev = head
             head = here
-
             if head == start:
+                closed = True
                 break
+            if visited[head]:
+                break
+            visited[head] = 1
+            chain.append(head)
+
+        if closed:
+            chains.append(np.array(chain, dtype=np.intp))
+        else:
+            failures += 1
 
-            remaining.discard(head)
-            chains[-1].add_vert(verts[head])
+    return chains, failures
 
-        # dist = np.linalg.norm(np.array(verts[prev]) - np.array(verts[start]))
-        # if dist <= 0.0:
-        #     print("too small:", dist)
-        #     assert False
-        # if dist >= 2.0:
-        #     print("too big:", dist)
-        #     assert False
 
-        # if chains and (len(chains[-1]) < 6 or head != start):
-        if chains and head != start:
-            failures += 1
-            chains.pop()
+def parse_segments_np(segs, tolerance=1e-6):
+    """Builds the closed chains from an (M, 2, 2) segment array.
+    Returns (verts, chains, failures): the (V, 2) vertex buffer, the list of vertex id arrays
+    of the chains, and the number of open or branching chains which were dropped"""
+    verts, edges = segment_graph(segs, tolerance)
+    chains, failures = chain_ids(len(verts), edges)
+    return verts, chains, failures
+
+
+def parse_segments(self, l_verts):
+    """Builds the closed Chains of a list of segments.
+    Returns (chains, failures): the list of Chains (empty if no polygon was found)
+    and the number of open or branching chains which were dropped"""
+    verts, chain_list, failures = parse_segments_np(l_verts)
+    return [Chain(verts[ids]) for ids in chain_list], failures
+
+
+def _window_graph(img, cutoff, r0, r1, c0, c1):
+    """Marching squares graph (verts, edges) of the cells [r0:r1, c0:c1] only,
+    with the same crossings as marching_graph on the whole image"""
+    win = img[r0 : r1 + 1, c0 : c1 + 1]
+    nm = win > cutoff
+
+    # black borders of the whole image only
+    if r0 == 0:
+        nm[0, :] = False
+    if r1 + 1 == img.shape[0]:
+        nm[-1, :] = False
+    if c0 == 0:
+        nm[:, 0] = False
+    if c1 + 1 == img.shape[1]:
+        nm[:, -1] = False
+
+    codes = _marching_codes(nm)
+    ci, cj = np.nonzero((codes != 0) & (codes != 15))
+    return _cell_graph(np.ascontiguousarray(win), cutoff, ci, cj, codes[ci, cj], (r0, c0))
+
+
+def _window_segments(img, cutoff, r0, r1, c0, c1):
+    """Marching squares segments of the cells [r0:r1, c0:c1] only,
+    identical to the ones of lines_marching_np on the whole image"""
+    verts, edges = _window_graph(img, cutoff, r0, r1, c0, c1)
+    return np.take(verts, edges, axis=0)
+
+
+def _tile_chains(img, cutoff, r0, r1, c0, c1, tolerance):
+    """Traces a tile, returns (verts, lengths, segs): the vertices and lengths of the chains
+    closed inside the tile, and the segments of the chains crossing its seams"""
+    segs = _window_segments(img, cutoff, r0, r1, c0, c1)
+    verts, edges = segment_graph(segs, tolerance)
+    chains, _ = chain_ids(len(verts), edges)
+
+    # a vertex on a seam has at most one segment in the tile,
+    # so the chains closed in the tile are closed in the whole image too
+    in_chain = np.zeros(len(verts), dtype=bool)
+    lengths = np.array([len(ids) for ids in chains], dtype=np.intp)
+    if chains:
+        ids = np.concatenate(chains)
+        in_chain[ids] = True
+    else:
+        ids = np.zeros(0, dtype=np.intp)
+    open_edges = edges[~in_chain[edges[:, 0]]]
+    return verts[ids], lengths, verts[open_edges]
+
+
+def _shared_tile_chains(shm_name, shape, dtype, *args):
+    """_tile_chains on an image in shared memory (process pool worker)"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        img = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        result = _tile_chains(img, *args)
+        del img
+    finally:
+        shm.close()
+    return result
 
-    # TODO: return codes instead
-    if len(chains) == 0:
-        print("Leafig: No polygons found at this cutoff value")
-        return
 
-    if failures > 0:
-        print("Leafig: Chain failures:", failures)
+def trace_tiled(img, cutoff, tile_size=1024, workers=None, use_processes=True, tolerance=1e-6):
+    """Marching squares and chain parsing by tiles, in parallel.
+    The image is shared with the worker processes through shared memory,
+    or with threads if use_processes is False.
+    Returns (verts, chains, failures) like parse_segments_np"""
+    img = np.ascontiguousarray(img)
+    rows, cols = img.shape[0] - 1, img.shape[1] - 1
+    tiles = [
+        (cutoff, r0, min(r0 + tile_size, rows), c0, min(c0 + tile_size, cols), tolerance)
+        for r0 in range(0, rows, tile_size)
+        for c0 in range(0, cols, tile_size)
+    ]
+
+    if use_processes:
+        shm = shared_memory.SharedMemory(create=True, size=max(img.nbytes, 1))
+        try:
+            np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[...] = img
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_shared_tile_chains, shm.name, img.shape, img.dtype, *tile)
+                    for tile in tiles
+                ]
+                results = [f.result() for f in futures]
+        finally:
+            shm.close()
+            shm.unlink()
     else:
-        print("Successful parse.")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_tile_chains, img, *tile) for tile in tiles]
+            results = [f.result() for f in futures]
+
+    # stitch the chains crossing the seams
+    seam_segs = np.concatenate([r[2] for r in results]) if results else np.zeros((0, 2, 2))
+    seam_verts, seam_chains, failures = parse_segments_np(seam_segs, tolerance)
+
+    verts = [r[0].reshape(-1, 2) for r in results] + [seam_verts.reshape(-1, 2)]
+    # explicit intp: a tile or the seams may have no chain at all
+    lengths = np.concatenate(
+        [np.asarray(r[1], dtype=np.intp) for r in results]
+        + [np.array([len(ids) for ids in seam_chains], dtype=np.intp)]
+    )
+    offset = sum(len(v) for v in verts[:-1])
+    all_ids = np.concatenate(
+        [np.arange(offset, dtype=np.intp)] + [ids.astype(np.intp) + offset for ids in seam_chains]
+    )
+    chains = np.split(all_ids, np.cumsum(lengths)[:-1]) if len(lengths) else []
+    return np.concatenate(verts), chains, failures
+
+
+class TraceCache:
+    """Marching squares chains of an image, kept up to date with local edits.
+    update() only re-traces the chains around the changed pixels, and splices the new ones in.
+    chains are the (N, 2) vertex arrays, simplified with margin if it is set"""
+
+    __slots__ = ("img", "cutoff", "margin", "chains", "_bbs")
+
+    def __init__(self, img, cutoff, margin=None):
+        self.img = np.array(img)
+        self.cutoff = cutoff
+        self.margin = margin
+        self.chains = []
+        # min row, min col, max row, max col of each chain
+        self._bbs = np.zeros((0, 4), dtype=np.float64)
+        self._trace(0, self.img.shape[0] - 1, 0, self.img.shape[1] - 1)
+
+    def _trace(self, r0, r1, c0, c1):
+        """Traces the cells [r0:r1, c0:c1] and appends their chains.
+        Returns False if some chains are not closed in the window"""
+        verts, edges = _window_graph(self.img, self.cutoff, r0, r1, c0, c1)
+        chains, failures = chain_ids(len(verts), edges)
+        if failures > 0:
+            return False
 
-    return chains
+        bbs = np.empty((len(chains), 4), dtype=np.float64)
+        for k, ids in enumerate(chains):
+            pts = verts[ids]
+            bbs[k, :2] = pts.min(axis=0)
+            bbs[k, 2:] = pts.max(axis=0)
+            if self.margin is not None:
+                pts = pts[douglas_peucker_ids(pts, self.margin)]
+            self.chains.append(pts)
+        self._bbs = np.concatenate((self._bbs, bbs))
+        return True
+
+    def _region(self, r0, r1, c0, c1):
+        """Grows the cell window [r0:r1, c0:c1] until it contains all the chains touching it.
+        Returns the window and the mask of these chains"""
+        rows, cols = self.img.shape[0] - 1, self.img.shape[1] - 1
+        bbs = self._bbs
+        hit = np.zeros(len(bbs), dtype=bool)
+        while True:
+            touching = (bbs[:, 0] <= r1) & (bbs[:, 2] >= r0) & (bbs[:, 1] <= c1) & (bbs[:, 3] >= c0)
+            new = touching & ~hit
+            if not new.any():
+                return (r0, r1, c0, c1), hit
+            hit |= new
+            # the segments of a chain are in the cells around its vertices
+            r0 = max(0, min(r0, int(np.floor(bbs[new, 0].min())) - 1))
+            c0 = max(0, min(c0, int(np.floor(bbs[new, 1].min())) - 1))
+            r1 = min(rows, max(r1, int(np.floor(bbs[new, 2].max())) + 1))
+            c1 = min(cols, max(c1, int(np.floor(bbs[new, 3].max())) + 1))
+
+    def update(self, img, rect=None):
+        """Updates the chains to the new pixels of img.
+        rect (row min, row max, col min, col max), max excluded, bounds the changed pixels;
+        if it is None, img is compared with the previous pixels.
+        Returns the re-traced cell window, or None if nothing changed"""
+        img = np.asarray(img)
+        if img.shape != self.img.shape:
+            raise ValueError("The image size changed")
+
+        if rect is None:
+            rows, cols = np.nonzero(np.any(img != self.img, axis=tuple(range(2, img.ndim))))
+            if len(rows) == 0:
+                return None
+            rect = (rows.min(), rows.max() + 1, cols.min(), cols.max() + 1)
+        pr0, pr1, pc0, pc1 = (int(v) for v in rect)
+        if pr1 <= pr0 or pc1 <= pc0:
+            return None
+        self.img[pr0:pr1, pc0:pc1] = img[pr0:pr1, pc0:pc1]
+
+        # cells using the changed samples
+        rows, cols = self.img.shape[0] - 1, self.img.shape[1] - 1
+        window, hit = self._region(max(pr0 - 1, 0), min(pr1, rows), max(pc0 - 1, 0), min(pc1, cols))
+
+        kept = np.flatnonzero(~hit).tolist()
+        chains = self.chains
+        bbs = self._bbs
+        self.chains = [chains[k] for k in kept]
+        self._bbs = bbs[kept]
+        if not self._trace(*window):
+            # should not happen, the whole image is traced again
+            window = (0, rows, 0, cols)
+            self.chains = []
+            self._bbs = np.zeros((0, 4), dtype=np.float64)
+            self._trace(*window)
+        return window
+
+
+# 2D to 3D axes of the mesh built from traced chains
+_PLANE_AXES = {"XY": (0, 1), "XZ": (0, 2), "YZ": (1, 2)}
+
+
+def _signed_area(pts):
+    x = pts[:, 0]
+    y = pts[:, 1]
+    return 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def _bridge_holes(verts, ring, holes, vert_count):
+    """Merges the holes into the outer ring with zero-width bridges.
+    ring and holes are vertex id arrays; the two ends of each bridge get new duplicated verts,
+    numbered from vert_count.
+    Returns (ring, dupes): the merged ring and the source vert ids of the duplicates"""
+    dupes = []
+    ring_sign = _signed_area(verts[ring]) >= 0.0
+    # source vert of each ring vert, for the duplicates
+    src = ring
+
+    # rightmost holes first, so the later bridges can reach the merged ones
+    holes = sorted(holes, key=lambda h: -verts[h, 0].max())
+    for hole in holes:
+        if (_signed_area(verts[hole]) >= 0.0) == ring_sign:
+            hole = hole[::-1]
+        hi = int(verts[hole, 0].argmax())
+        d = verts[src] - verts[hole[hi]]
+        ri = int(np.einsum("ij,ij->i", d, d).argmin())
+        bridge = (vert_count + len(dupes), vert_count + len(dupes) + 1)
+        dupes.extend((hole[hi], src[ri]))
+        ring = np.concatenate((ring[: ri + 1], hole[hi:], hole[:hi], bridge, ring[ri + 1 :]))
+        src = np.concatenate((src[: ri + 1], hole[hi:], hole[:hi], (hole[hi], src[ri]), src[ri + 1 :]))
+    return ring, dupes
+
+
+def chain_buffers(chains):
+    """Concatenates the verts of the chains.
+    Returns (verts, offsets, parents, inner): the (N, 2) buffer, the start of each chain followed by N,
+    the index of the parent chain (-1 for none) and the hole flag of each chain"""
+    ids = {id(ch): i for i, ch in enumerate(chains)}
+    offsets = np.zeros(len(chains) + 1, dtype=np.intp)
+    np.cumsum([len(ch) for ch in chains], out=offsets[1:])
+    if chains:
+        verts = np.concatenate([ch.verts for ch in chains])
+    else:
+        verts = np.zeros((0, 2), dtype=np.float64)
+    parents = np.array([ids.get(id(ch.parent), -1) for ch in chains], dtype=np.intp)
+    inner = np.array([bool(ch.inner) for ch in chains], dtype=bool)
+    return verts, offsets, parents, inner
+
+
+def chains_to_mesh(mesh, verts, offsets, parents=None, inner=None, plane="XZ"):
+    """Adds the traced chains to an empty mesh in one go, using foreach_set.
+    verts, offsets, parents, inner: see chain_buffers.
+    Outer chains become ngons, holes (inner chains) are bridged into the face of their parent.
+    plane: the 3D plane of the 2D coordinates, "XY", "XZ" or "YZ"."""
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.intp)
+    count = len(offsets) - 1
+    if parents is None:
+        parents = np.full(count, -1, dtype=np.intp)
+    if inner is None:
+        inner = np.zeros(count, dtype=bool)
+
+    holes = defaultdict(list)
+    for i in np.flatnonzero(inner & (parents >= 0)):
+        holes[parents[i]].append(np.arange(offsets[i], offsets[i + 1]))
+
+    rings = []
+    dupes = []
+    for i in np.flatnonzero(~inner):
+        ring = np.arange(offsets[i], offsets[i + 1])
+        if len(ring) < 3:
+            continue
+        if i in holes:
+            ring, d = _bridge_holes(verts, ring, holes[i], len(verts) + len(dupes))
+            dupes.extend(d)
+        rings.append(ring)
+
+    co2 = np.concatenate((verts, verts[np.array(dupes, dtype=np.intp)]))
+    co = np.zeros((len(co2), 3), dtype=np.float32)
+    ax0, ax1 = _PLANE_AXES[plane]
+    co[:, ax0] = co2[:, 0]
+    co[:, ax1] = co2[:, 1]
+
+    loop_total = np.array([len(r) for r in rings], dtype=np.int32)
+    loop_start = np.zeros(len(rings), dtype=np.int32)
+    np.cumsum(loop_total[:-1], out=loop_start[1:])
+    if rings:
+        loops = np.concatenate(rings).astype(np.int32)
+    else:
+        loops = np.zeros(0, dtype=np.int32)
+
+    mesh.vertices.add(len(co))
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.loops.add(len(loops))
+    mesh.loops.foreach_set("vertex_index", loops)
+    mesh.polygons.add(len(rings))
+    mesh.polygons.foreach_set("loop_start", loop_start)
+    try:
+        mesh.polygons.foreach_set("loop_total", loop_total)
+    except (AttributeError, TypeError):
+        # read-only since Blender 4.0, deduced from loop_start
+        pass
+    mesh.update(calc_edges=True)
+    return mesh
+
+
+def mesh_from_chains(mesh, chains, plane="XZ"):
+    """Adds the valid chains to a mesh, see chains_to_mesh"""
+    chains = [ch for ch in chains if not ch.invalid]
+    verts, offsets, parents, inner = chain_buffers(chains)
+    return chains_to_mesh(mesh, verts, offsets, parents, inner, plane)
 
 
 def tri_ori(p1, p2, p3):
@@ -475,6 +1393,208 @@ def tri_ori(p1, p2, p3):
     return (p2[1] - p1[1]) * (p3[0] - p2[0]) - (p2[0] - p1[0]) * (p3[1] - p2[1]) > 0
 
 
+def _tri_ori_loop(p1, p2, p3):
+    out = np.empty(len(p1), dtype=np.bool_)
+    for i in range(len(p1)):
+        out[i] = (p2[i, 1] - p1[i, 1]) * (p3[i, 0] - p2[i, 0]) - (p2[i, 0] - p1[i, 0]) * (
+            p3[i, 1] - p2[i, 1]
+        ) > 0
+    return out
+
+
+_tri_ori_nb = _jit(_tri_ori_loop)
+
+
+def tri_ori_batch(p1, p2, p3):
+    """tri_ori for (N, 2) arrays of points"""
+    p1, p2, p3 = (np.ascontiguousarray(p, dtype=np.float64).reshape(-1, 2) for p in (p1, p2, p3))
+    if _backend == "numba":
+        return _tri_ori_nb(p1, p2, p3)
+    return (p2[:, 1] - p1[:, 1]) * (p3[:, 0] - p2[:, 0]) - (p2[:, 0] - p1[:, 0]) * (p3[:, 1] - p2[:, 1]) > 0
+
+
+def dist_points_segments(pts, a, b):
+    """Distances of the (N, 2) points to the (N, 2) - (N, 2) segments, row by row"""
+    ab = b - a
+    ap = pts - a
+    lsq = np.einsum("ij,ij->i", ab, ab)
+    t = np.einsum("ij,ij->i", ap, ab)
+    nz = lsq > 0.0
+    t[nz] /= lsq[nz]
+    t[~nz] = 0.0
+    np.clip(t, 0.0, 1.0, out=t)
+    d = ap - ab * t[:, None]
+    return np.sqrt(np.einsum("ij,ij->i", d, d))
+
+
+def triangle_edges(tris):
+    """Unique edges of an (T, 3) triangle buffer.
+    Returns (edges, tri_edges, face_count): the (E, 2) sorted vertex ids of the edges,
+    the (T, 3) edge ids of the triangles (edge k goes from corner k to corner k + 1)
+    and the number of triangles using each edge"""
+    tris = np.asarray(tris, dtype=np.intp).reshape(-1, 3)
+    pairs = np.stack((tris, np.roll(tris, -1, axis=1)), axis=2).reshape(-1, 2)
+    pairs.sort(axis=1)
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    spairs = pairs[order]
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = np.any(spairs[1:] != spairs[:-1], axis=1)
+    inverse = np.empty(len(order), dtype=np.intp)
+    inverse[order] = np.cumsum(is_first) - 1
+    face_count = np.bincount(inverse, minlength=int(is_first.sum()))
+    return spairs[is_first], inverse.reshape(-1, 3), face_count
+
+
+def _prune_spine(co, edges, width, prune):
+    """Collapses the leaf branches shorter than prune * width / 2 at their base.
+    Returns the mask of the remaining edges"""
+    alive = np.ones(len(edges), dtype=bool)
+    if len(edges) == 0:
+        return alive
+
+    # CSR vertex to edge links
+    src = edges.reshape(-1)
+    counts = np.bincount(src, minlength=len(co))
+    indptr = np.zeros(len(co) + 1, dtype=np.intp)
+    np.cumsum(counts, out=indptr[1:])
+    link_edges = (np.argsort(src, kind="stable") >> 1).tolist()
+    indptr = indptr.tolist()
+    degree = counts.tolist()
+
+    # xor of the two ends: other[k] ^ v is the other end of the edge k
+    other = (edges[:, 0] ^ edges[:, 1]).tolist()
+    lengths = np.sqrt(np.sum((co[edges[:, 0]] - co[edges[:, 1]]) ** 2, axis=1)).tolist()
+    limit = (0.5 * prune * width).tolist()
+    # length of the branches collapsed into each vertex
+    reach = [0.0] * len(co)
+
+    leafs = np.flatnonzero(counts == 1).tolist()
+    while leafs:
+        v = leafs.pop()
+        if degree[v] != 1:
+            continue
+        k = next(k for k in link_edges[indptr[v] : indptr[v + 1]] if alive[k])
+        u = other[k] ^ v
+        branch = reach[v] + lengths[k]
+        # keep the last edge of a component
+        if degree[u] == 1 or branch > limit[u]:
+            continue
+
+        alive[k] = False
+        degree[v] = 0
+        degree[u] -= 1
+        reach[u] = max(reach[u], branch)
+        if degree[u] == 1:
+            leafs.append(u)
+    return alive
+
+
+def spine_graph(co, tris, prune=1.2):
+    """Chordal axis of a 2D triangulation: the midpoints of the interior edges, linked
+    across the sleeve triangles, and by their two shortest links in the junction triangles.
+    co: (V, 2) vertex locations, tris: (T, 3) vertex ids.
+    prune: leaf branches shorter than prune times the local half width are removed, 0 to keep them.
+    Returns (verts, edges, width): the (S, 2) spine vertices, the (K, 2) spine edges,
+    and the local width of the shape at each spine vertex"""
+    co = np.asarray(co, dtype=np.float64).reshape(-1, 2)
+    edges, tri_edges, face_count = triangle_edges(tris)
+    interior = face_count == 2
+    border = face_count == 1
+
+    # one spine vertex per interior edge
+    spine_id = np.full(len(edges), -1, dtype=np.intp)
+    inner_edges = np.flatnonzero(interior)
+    spine_id[inner_edges] = np.arange(len(inner_edges))
+    e0 = co[edges[inner_edges, 0]]
+    e1 = co[edges[inner_edges, 1]]
+    verts = (e0 + e1) * 0.5
+
+    # width: edge length, or twice the distance to the border edges of the two triangles
+    width = np.sqrt(np.sum((e1 - e0) ** 2, axis=1))
+    tri_ids = np.arange(len(tri_edges)).repeat(3)
+    edge_tris = np.full((len(edges), 2), -1, dtype=np.intp)
+    flat_edges = tri_edges.reshape(-1)
+    order = np.argsort(flat_edges, kind="stable")
+    starts = np.searchsorted(flat_edges[order], np.arange(len(edges)))
+    edge_tris[:, 0] = tri_ids[order[starts]]
+    second = np.minimum(starts + 1, len(order) - 1)
+    edge_tris[interior, 1] = tri_ids[order[second[interior]]]
+
+    candidates = tri_edges[edge_tris[inner_edges]].reshape(len(inner_edges), 6)
+    on_border = border[candidates]
+    rows, cols = np.nonzero(on_border)
+    cand = candidates[rows, cols]
+    d = dist_points_segments(verts[rows], co[edges[cand, 0]], co[edges[cand, 1]]) * 2.0
+    np.minimum.at(width, rows, d)
+
+    # links inside the triangles
+    tri_spine = spine_id[tri_edges]
+    inner_count = np.count_nonzero(tri_spine >= 0, axis=1)
+    links = []
+
+    # sleeves: the two midpoints
+    sleeve = tri_spine[inner_count == 2]
+    sleeve.sort(axis=1)
+    links.append(sleeve[:, 1:])
+
+    # junctions: the midpoint triangle without its longest edge
+    junction = tri_spine[inner_count == 3]
+    jl = np.stack([junction, np.roll(junction, -1, axis=1)], axis=2)
+    lengths = np.sum((verts[jl[:, :, 0]] - verts[jl[:, :, 1]]) ** 2, axis=2)
+    keep = np.ones(lengths.shape, dtype=bool)
+    keep[np.arange(len(junction)), np.argmax(lengths, axis=1)] = False
+    links.append(jl[keep].reshape(-1, 2))
+
+    spine_edges = np.concatenate([l.reshape(-1, 2) for l in links]).astype(np.intp)
+    if prune > 0.0:
+        spine_edges = spine_edges[_prune_spine(verts, spine_edges, width, prune)]
+
+    # drop the unused vertices
+    used = np.zeros(len(verts), dtype=bool)
+    used[spine_edges.reshape(-1)] = True
+    remap = np.cumsum(used) - 1
+    return verts[used], remap[spine_edges], width[used]
+
+
+def mesh_triangles(mesh, plane="XZ"):
+    """Reads the 2D vertex locations and the triangulation of a mesh with foreach_get.
+    Returns (co, tris): (V, 2) float64 and (T, 3) int arrays"""
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    co = co.reshape(-1, 3)
+    ax0, ax1 = _PLANE_AXES[plane]
+
+    mesh.calc_loop_triangles()
+    tris = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", tris)
+    return co[:, (ax0, ax1)].astype(np.float64), tris.reshape(-1, 3)
+
+
+def spine_to_mesh(mesh, verts, edges, plane="XZ"):
+    """Adds the spine vertices and edges to an empty mesh in one go, using foreach_set"""
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 2)
+    co = np.zeros((len(verts), 3), dtype=np.float32)
+    ax0, ax1 = _PLANE_AXES[plane]
+    co[:, ax0] = verts[:, 0]
+    co[:, ax1] = verts[:, 1]
+
+    mesh.vertices.add(len(co))
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.edges.add(len(edges))
+    mesh.edges.foreach_set("vertices", np.asarray(edges, dtype=np.int32).ravel())
+    mesh.update()
+    return mesh
+
+
+def build_spine_np(mesh, spine_mesh, plane="XZ", prune=1.2):
+    """Builds the spine of the triangulated shape mesh into the empty spine_mesh.
+    Returns the local width of the shape at each spine vertex"""
+    co, tris = mesh_triangles(mesh, plane)
+    verts, edges, width = spine_graph(co, tris, prune)
+    spine_to_mesh(spine_mesh, verts, edges, plane)
+    return width
+
+
 def radial_edges(iv):
     loop = iv.link_loops[0]
     eg = []
@@ -532,6 +1652,36 @@ def triangle_strip2(bm, v0):
     return True
 
 
+def _selected_degree(v):
+    return sum(e.select for e in v.link_edges)
+
+
+def collapse_leafs(bm, limit_len=0.0):
+    """Collapses the selected edge strips from their leafs, while triangle_strip_intersect allows it.
+    The leafs are processed from a queue: only the vertex a leaf is merged into is checked again.
+    Returns the number of collapsed leafs"""
+    leafs = deque(v for v in bm.verts if v.select and _selected_degree(v) == 1)
+    blocked = set()
+    count = 0
+    while leafs:
+        v = leafs.popleft()
+        if not v.is_valid or v in blocked or _selected_degree(v) != 1:
+            continue
+        if triangle_strip_intersect(bm, v, limit_len=limit_len):
+            blocked.add(v)
+            continue
+
+        ov = next(e for e in v.link_edges if e.select).other_vert(v)
+        triangle_strip2(bm, v)
+        count += 1
+
+        # pointmerge keeps one of the two verts
+        merged = ov if ov.is_valid else v
+        if merged.is_valid and _selected_degree(merged) == 1:
+            leafs.append(merged)
+    return count
+
+
 def build_spine(bm):
     border = set([e for e in bm.edges if e.is_boundary])
     border_verts = set()
@@ -657,26 +1807,8 @@ def build_spine(bm):
                     tt += cv.co
                 v.co = tt / len(c_verts) * 0.5 + v.co * 0.5
 
-    # iter from leafs
-    count = 0
-    skiplist = set()
-    while count < 20:
-        leafs = set(v for v in bm.verts if v.select and sum(e.select for e in v.link_edges) == 1)
-        print(len(leafs))
-        if len(leafs) == 0 or len(skiplist) == len(leafs):
-            print("broke out")
-            break
-
-        for v in leafs:
-            if v in skiplist:
-                continue
-
-            if not triangle_strip_intersect(bm, v, limit_len=1.2):
-                triangle_strip2(bm, v)
-            else:
-                skiplist.add(v)
-
-        count += 1
+    # collapse from the leafs until convergence
+    collapse_leafs(bm, limit_len=1.2)
 
     # while tree:
     #     count = 0
@@ -744,4 +1876,110 @@ def apply_transfrom(ob, use_location=False, use_rotation=False, use_scale=False)
     for c in ob.children:
         c.matrix_local = M @ c.matrix_local
         
-    ob.matrix_basis = basis[0] @ basis[1] @ basis[2]
\ No newline at end of file
+    ob.matrix_basis = basis[0] @ basis[1] @ basis[2]
+
+
+def _decompose(mb):
+    """Stacked apply_transfrom decomposition of (N, 4, 4) matrices into the T, R, S matrices"""
+    count = len(mb)
+    m3 = mb[:, :3, :3]
+    norms = np.linalg.norm(m3, axis=1)
+    # like Matrix.decompose, a negative determinant negates the scale
+    scale = norms * np.where(np.linalg.det(m3) < 0.0, -1.0, 1.0)[:, None]
+
+    T = np.tile(np.eye(4), (count, 1, 1))
+    T[:, :3, 3] = mb[:, :3, 3]
+    R = np.tile(np.eye(4), (count, 1, 1))
+    # Matrix.normalized: unit columns, zero columns stay zero
+    nz = norms > 0.0
+    R[:, :3, :3] = m3 / np.where(nz, norms, 1.0)[:, None, :]
+    S = np.tile(np.eye(4), (count, 1, 1))
+    S[:, [0, 1, 2], [0, 1, 2]] = scale
+    return T, R, S
+
+
+def _transform_mesh(mesh, M):
+    """Transforms the vertices of a mesh with foreach_get/foreach_set.
+    Like Mesh.transform (used by apply_transfrom), the shape keys are left as they are"""
+    m3 = M[:3, :3].T.astype(np.float32)
+    t = M[:3, 3].astype(np.float32)
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    v = co.reshape(-1, 3)
+    np.matmul(v, m3, out=v)
+    v += t
+    mesh.vertices.foreach_set("co", co)
+    mesh.update()
+
+
+def _object_depth(ob, selected):
+    depth = 0
+    parent = ob.parent
+    while parent is not None:
+        if parent in selected:
+            depth += 1
+        parent = parent.parent
+    return depth
+
+
+def apply_transforms(obs, use_location=False, use_rotation=False, use_scale=False):
+    """apply_transfrom for many objects at once.
+    The decompositions are computed in stacked arrays, each data block is transformed once
+    (a copy is made for the objects needing another transform, or if it has other users),
+    and mesh coordinates are written with foreach_set; other data (curves, lattices...) use data.transform.
+    Parents are applied before their children."""
+    # only needed here: the rest of the module runs outside of Blender
+    import bpy
+
+    obs = list(dict.fromkeys(obs))
+    selected = set(obs)
+    levels = defaultdict(list)
+    for ob in obs:
+        levels[_object_depth(ob, selected)].append(ob)
+
+    for depth in sorted(levels):
+        level = levels[depth]
+        mb = np.array([ob.matrix_basis for ob in level], dtype=np.float64).reshape(-1, 4, 4)
+        T, R, S = _decompose(mb)
+        I = np.tile(np.eye(4), (len(level), 1, 1))
+        transform = [T if use_location else I, R if use_rotation else I, S if use_scale else I]
+        basis = [I if use_location else T, I if use_rotation else R, I if use_scale else S]
+        M = transform[0] @ transform[1] @ transform[2]
+        B = basis[0] @ basis[1] @ basis[2]
+
+        # group the objects by data and transform
+        groups = defaultdict(list)
+        for k, ob in enumerate(level):
+            if ob.data is not None and hasattr(ob.data, "transform"):
+                groups[ob.data].append(k)
+
+        for data, ids in groups.items():
+            # one data block per distinct transform, copied before any transform
+            targets = []
+            for k in ids:
+                for target in targets:
+                    if np.allclose(target[1], M[k]):
+                        target[2].append(k)
+                        break
+                else:
+                    targets.append([None, M[k], [k]])
+            for n, target in enumerate(targets):
+                target[0] = data if n == 0 and data.users <= len(ids) else data.copy()
+
+            for target, m, users in targets:
+                if np.allclose(m, np.eye(4)):
+                    pass
+                elif isinstance(target, bpy.types.Mesh) and not target.has_custom_normals:
+                    _transform_mesh(target, m)
+                else:
+                    target.transform(mu.Matrix(m.tolist()))
+                for k in users:
+                    if level[k].data is not target:
+                        level[k].data = target
+
+        for k, ob in enumerate(level):
+            if ob.children:
+                Mk = mu.Matrix(M[k].tolist())
+                for c in ob.children:
+                    c.matrix_local = Mk @ c.matrix_local
+            ob.matrix_basis = mu.Matrix(B[k].tolist())
@@ -1,9 +1,18 @@
 import numpy as np
 import math
+import mathutils as mu
+from collections import OrderedDict, defaultdict
 import gpu
 import bgl
 import bpy
 from gpu_extras.batch import batch_for_shader
+from . import color, handlers
+
+# update count of the images, while track_image_updates is on
+_image_updates = defaultdict(int)
+# sources whose pixels change with the frame
+_ANIMATED_SOURCES = ("SEQUENCE", "MOVIE")
+_tracking = False
 
 
 def get_teximage(context):
@@ -16,7 +25,9 @@ def get_teximage(context):
         return None
 
 
-def gl_copy(image):
+def gl_copy(image, dtype=np.float32):
+    """Reads the image back from the GPU, as a (height, width, 4) array with the bottom row first.
+    dtype: np.uint8 for the raw bytes (a view on the read buffer), or a float type for [0, 1] values"""
     if image.gl_load():
         raise Exception()
 
@@ -47,45 +58,224 @@ def gl_copy(image):
             shader.uniform_int("image", 0)
             batch.draw(shader)
 
+        # bgl has no unsigned byte buffer, the signed bytes are read back as uint8
         buffer = bgl.Buffer(bgl.GL_BYTE, width * height * 4)
         bgl.glReadBuffer(bgl.GL_BACK)
         bgl.glReadPixels(0, 0, width, height, bgl.GL_RGBA, bgl.GL_UNSIGNED_BYTE, buffer)
 
     offscreen.free()
-    return np.array(buffer.to_list()).astype(np.float).reshape((width, height, 4)) / 255.0
+    pixels = buffer_as_uint8(buffer).reshape((height, width, 4))
+    if np.dtype(dtype) == np.uint8:
+        return pixels
+    out = np.empty(pixels.shape, dtype=dtype)
+    np.multiply(pixels, 1.0 / 255.0, out=out)
+    return out
 
 
-def rgb2hsv(image):
-    tmp = image[:, :, :3]
-    r = tmp[:, :, 0]
-    g = tmp[:, :, 1]
-    b = tmp[:, :, 2]
+def buffer_as_uint8(buffer):
+    """Flat uint8 view of a GL_BYTE bgl.Buffer, through the buffer protocol if available"""
+    try:
+        return np.frombuffer(buffer, dtype=np.uint8)
+    except (TypeError, ValueError):
+        # older bgl.Buffer without the buffer protocol
+        return np.array(buffer.to_list(), dtype=np.int8).view(np.uint8)
+
+
+@bpy.app.handlers.persistent
+def _count_image_updates(scene, depsgraph):
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Image):
+            _image_updates[update.id.name] += 1
+
+
+def track_image_updates(enable=True):
+    """Counts the image updates (edits, saves, reloads) with a depsgraph handler,
+    so image_pixels can tell when its cached pixels are out of date.
+    image_pixels starts it on its first cached read; without it, nothing is read from the cache"""
+    global _tracking
+    _tracking = enable
+    if enable:
+        handlers.depsgraph_update_post_append(_count_image_updates)
+    else:
+        handlers.depsgraph_update_post_remove(_count_image_updates)
+        _image_updates.clear()
+        # the stamps of the cached arrays can't be checked anymore
+        pixel_cache.clear()
+
+
+class PixelCache:
+    """LRU cache of the arrays computed from the images, by image name and modification stamp.
+    Least recently used images are evicted when the arrays take more than budget bytes."""
+
+    __slots__ = ("budget", "hits", "misses", "_entries", "_nbytes")
+
+    def __init__(self, budget=1 << 30):
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        # name: (stamp, {channel: array}), least recently used first
+        self._entries = OrderedDict()
+        self._nbytes = 0
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def get(self, name, stamp, channel):
+        """The cached array, or None if it is missing or out of date"""
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == stamp and channel in entry[1]:
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return entry[1][channel]
+        self.misses += 1
+        return None
+
+    def peek(self, name, channel):
+        """The array even if it is out of date, to reuse its memory, without counting a hit"""
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        return entry[1].get(channel)
+
+    def put(self, name, stamp, channel, array):
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] != stamp:
+            self.clear(name)
+            entry = None
+        if entry is None:
+            entry = (stamp, {})
+            self._entries[name] = entry
+        old = entry[1].get(channel)
+        if old is not None:
+            self._nbytes -= old.nbytes
+        entry[1][channel] = array
+        self._nbytes += array.nbytes
+        self._entries.move_to_end(name)
+
+        # the image just added stays, even over budget
+        while self._nbytes > self.budget and len(self._entries) > 1:
+            _, (_, arrays) = self._entries.popitem(last=False)
+            self._nbytes -= sum(a.nbytes for a in arrays.values())
+
+    def clear(self, name=None):
+        """Removes the arrays of an image, or of all of them"""
+        if name is None:
+            self._entries.clear()
+            self._nbytes = 0
+            return
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._nbytes -= sum(a.nbytes for a in entry[1].values())
 
-    acmax = tmp.argmax(2)
-    cmax = tmp.max(2)
-    cmin = tmp.min(2)
-    delta = cmax - cmin
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "images": len(self._entries),
+            "bytes": self._nbytes,
+            "budget": self.budget,
+        }
 
-    # R G B = 0 1 2
-    # prevent zero division
-    delta[delta == 0.0] = 1.0
-    hr = np.where(acmax == 0, ((g - b) / delta) % 6.0, 0.0)
-    hg = np.where(acmax == 1, (b - r) / delta + 2.0, 0.0)
-    hb = np.where(acmax == 2, (r - g) / delta + 4.0, 0.0)
 
-    H = np.where(cmax == cmin, 0.0, (hr + hg + hb) / 6.0)
-    H[H < 0.0] += 1.0
+pixel_cache = PixelCache()
 
-    # L = (cmax + cmin) / 2.0
-    # St = (cmax <= 0.0001) + (cmin >= 0.9999) + (L == 1.0) + (L == 0.0)
-    # S = np.where(St, 0.0, (cmax - L) / np.minimum(L, 1.0 - L))
 
-    L = cmax
-    St = cmax <= 0.0001
-    cmax[St] = 1.0
-    S = np.where(St, 0.0, (cmax - cmin) / cmax)
+def clear_pixels_cache(name=None):
+    """Frees the cached arrays of an image, or of all of them"""
+    pixel_cache.clear(name)
 
-    return [H, S, L]
+
+def _image_stamp(image):
+    return (image.filepath_raw, image.source, image.size[0], image.size[1], image.channels,
+            image.is_dirty, _image_updates.get(image.name, 0))
+
+
+def _use_cache(image, use_cache):
+    """Whether the cached arrays of the image can be trusted"""
+    if not use_cache or image.source in _ANIMATED_SOURCES:
+        return False
+    if not _tracking:
+        track_image_updates()
+    return True
+
+
+def image_pixels(image, use_cache=True):
+    """Reads the pixels with foreach_get, without drawing, so it works in background mode.
+    Returns a read-only (height, width, channels) float32 array with the bottom row first;
+    it is shared with the cache, copy it before changing it.
+    The buffer is reused for the next reads of the same image. Render results and viewer images
+    have no pixels: they are read back from the GPU with gl_copy.
+    Sequences and movies are read again each time, their pixels depend on the frame."""
+    if image.type in ("RENDER_RESULT", "COMPOSITING"):
+        return gl_copy(image)
+
+    width, height = image.size
+    channels = image.channels
+    count = width * height * channels
+    if count == 0 or len(image.pixels) != count:
+        return gl_copy(image)
+
+    use_cache = _use_cache(image, use_cache)
+    stamp = _image_stamp(image)
+    if use_cache:
+        buffer = pixel_cache.get(image.name, stamp, "pixels")
+        if buffer is not None:
+            return _read_only(buffer, height, width, channels)
+
+    buffer = pixel_cache.peek(image.name, "pixels")
+    if buffer is None or len(buffer) != count:
+        buffer = np.empty(count, dtype=np.float32)
+    image.pixels.foreach_get(buffer)
+    # the derived channels are out of date too
+    pixel_cache.clear(image.name)
+    pixel_cache.put(image.name, stamp, "pixels", buffer)
+    return _read_only(buffer, height, width, channels)
+
+
+def _read_only(buffer, height, width, channels):
+    pixels = buffer.reshape((height, width, channels))
+    pixels.flags.writeable = False
+    return pixels
+
+
+def _derive_channel(pixels, channel):
+    if channel == "alpha":
+        if pixels.shape[2] in (2, 4):
+            return pixels[:, :, -1].copy()
+        return np.ones(pixels.shape[:2], dtype=np.float32)
+    if channel == "luminance":
+        if pixels.shape[2] < 3:
+            return pixels[:, :, 0].copy()
+        return color.luminance(pixels)
+    if channel == "hsv":
+        return color.rgb_to_hsv(pixels)
+    raise ValueError("Unknown channel: " + str(channel))
+
+
+def image_channel(image, channel, use_cache=True):
+    """A channel computed from the pixels of the image: "hsv" (height, width, 3),
+    "luminance" or "alpha" (height, width), cached with the pixels"""
+    pixels = image_pixels(image, use_cache)
+    if image.type in ("RENDER_RESULT", "COMPOSITING") or image.name not in pixel_cache:
+        return _derive_channel(pixels, channel)
+
+    stamp = _image_stamp(image)
+    array = pixel_cache.get(image.name, stamp, channel) if _use_cache(image, use_cache) else None
+    if array is None:
+        array = _derive_channel(pixels, channel)
+        array.flags.writeable = False
+        pixel_cache.put(image.name, stamp, channel, array)
+    return array
+
+
+def rgb2hsv(image):
+    """H, S, V planes of an (height, width, 3 or 4) image, see color.rgb_to_hsv"""
+    hsv = color.rgb_to_hsv(image)
+    return [hsv[:, :, 0], hsv[:, :, 1], hsv[:, :, 2]]
 
 
 def add_material(name, image):
@@ -113,7 +303,5 @@ def linear2srgb(c):
 
 
 def linear2srgb_np(c):
-    srgb = np.where(c < 0.0031308, c * 12.92, 1.055 * np.pow(c, 1.0 / 2.4) - 0.055)
-    srgb[srgb > 1.0] = 1.0
-    srgb[srgb < 0.0] = 0.0
-    return srgb
+    """linear2srgb for arrays, see color.linear_to_srgb"""
+    return color.linear_to_srgb(c)
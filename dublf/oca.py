@@ -1,5 +1,10 @@
 
 import json
+import os
+import re
+import threading
+from bisect import bisect_right
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 
 # correspondance table for blending modes OCA / Krita
 OCABlendingModes = {}
@@ -52,9 +57,9 @@ OCABlendingModes['hard mix'] = 'hard_mix'
 OCABlendingModes['hard_mix_photoshop'] = 'hard_mix_photoshop'
 OCABlendingModes['parallel'] = 'parallel'
 OCABlendingModes['penumbra a'] = 'penumbra_a'
-OCABlendingModes['penumbra a'] = 'penumbra_b'
-OCABlendingModes['penumbra a'] = 'penumbra_c'
-OCABlendingModes['penumbra a'] = 'penumbra_d'
+OCABlendingModes['penumbra b'] = 'penumbra_b'
+OCABlendingModes['penumbra c'] = 'penumbra_c'
+OCABlendingModes['penumbra d'] = 'penumbra_d'
 OCABlendingModes['greater'] = 'greater'
 OCABlendingModes['geometric_mean'] = 'geometric_mean'
 OCABlendingModes['additive_subtractive'] = 'additive_subtractive'
@@ -129,7 +134,503 @@ OCALabels.append([ 0.83 , 0.43 , 0.81, 1.0 ])
 # Methods
 
 def load(filepath):
-    oca = {}
-    with open(filepath, 'r') as ocaFile:
-        oca = json.loads(ocaFile.read())
-    return oca
\ No newline at end of file
+    """The OCA document as a dict, parsed by chunks (see OCAReader)"""
+    return OCAReader(filepath, validate=False).read()
+
+class OCAError(ValueError):
+    """Invalid OCA document. path is the JSON path of the error, line the line of the invalid value.
+    Values checked after being decoded as a whole (the layers) have no line of their own:
+    startLine is then the line where the top-level value containing them starts"""
+
+    def __init__(self, message, path='$', line=None, startLine=None):
+        self.path = path
+        self.line = line
+        self.startLine = startLine
+        location = path
+        if line is not None:
+            location += ' (line ' + str(line) + ')'
+        elif startLine is not None:
+            location += ' (in the value starting at line ' + str(startLine) + ')'
+        super().__init__(location + ': ' + message)
+
+# OCA schema: key: (types, required)
+_NUMBER = (int, float)
+_FRAME_SCHEMA = {
+    'name': (str, False),
+    'fileName': (str, False),
+    'frameNumber': (int, True),
+    'duration': (int, False),
+    'position': (list, False),
+    'width': (int, False),
+    'height': (int, False),
+    'opacity': (_NUMBER, False),
+}
+_LAYER_SCHEMA = {
+    'name': (str, True),
+    'type': (str, False),
+    'fileType': (str, False),
+    'blendingMode': (str, False),
+    'animated': (bool, False),
+    'label': (int, False),
+    'opacity': (_NUMBER, False),
+    'visible': (bool, False),
+    'reference': (bool, False),
+    'passThrough': (bool, False),
+    'inheritAlpha': (bool, False),
+    'position': (list, False),
+    'width': (int, False),
+    'height': (int, False),
+    'frames': (list, False),
+    'childLayers': (list, False),
+}
+_DOCUMENT_SCHEMA = {
+    'name': (str, False),
+    'width': (int, True),
+    'height': (int, True),
+    'frameRate': (_NUMBER, True),
+    'startTime': (int, True),
+    'endTime': (int, True),
+    'backgroundColor': (list, False),
+    'colorDepth': (str, False),
+    'originApp': (str, False),
+    'originAppVersion': (str, False),
+    'ocaVersion': (str, False),
+    'layers': (list, True),
+}
+
+def _checkKeys(obj, schema, path, line=None, startLine=None, keys=None):
+    if not isinstance(obj, dict):
+        raise OCAError('expected an object', path, line, startLine)
+    for key, value in obj.items() if keys is None else ((k, obj[k]) for k in keys if k in obj):
+        spec = schema.get(key)
+        if spec is None:
+            continue
+        types = spec[0]
+        # bool is an int in Python, but not in the schema
+        if not isinstance(value, types) or (value is True or value is False) and types is not bool:
+            raise OCAError('wrong type for "' + key + '": ' + type(value).__name__, path + '.' + key, line, startLine)
+    for key, (types, required) in schema.items():
+        if required and key not in obj and (keys is None or key in keys):
+            raise OCAError('missing "' + key + '"', path, line, startLine)
+
+def validateLayer(layer, path='$.layers[0]', startLine=None):
+    """Checks a layer and its frames and child layers against the OCA schema, raises OCAError"""
+    stack = [(layer, path)]
+    while stack:
+        layer, path = stack.pop()
+        _checkKeys(layer, _LAYER_SCHEMA, path, startLine=startLine)
+        for i, frame in enumerate(layer.get('frames', ())):
+            _checkKeys(frame, _FRAME_SCHEMA, path + '.frames[' + str(i) + ']', startLine=startLine)
+        for i, child in enumerate(layer.get('childLayers', ())):
+            stack.append((child, path + '.childLayers[' + str(i) + ']'))
+
+def validate(document):
+    """Checks a whole OCA document against the schema, raises OCAError"""
+    _checkKeys(document, _DOCUMENT_SCHEMA, '$')
+    for i, layer in enumerate(document['layers']):
+        validateLayer(layer, '$.layers[' + str(i) + ']')
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# anything but brackets, skipping whole strings and lists of numbers: stops on a bracket,
+# or on a string cut by the end of the buffer
+_SKIP = re.compile(r'[^"\[\]{}]*(?:(?:"[^"\\]*(?:\\.[^"\\]*)*"|\[[^"\[\]{}]*\])[^"\[\]{}]*)*')
+
+class OCAReader():
+    """Parses an OCA file by chunks: the layers are decoded and validated one at a time,
+    without reading the whole file in memory first."""
+
+    __slots__ = ('filepath', 'validate', 'chunkSize', 'header', '_file', '_text', '_pos', '_eof', '_lines', '_decoder')
+
+    def __init__(self, filepath, validate=True, chunkSize=1 << 16):
+        self.filepath = filepath
+        self.validate = validate
+        self.chunkSize = chunkSize
+        # the document keys other than the layers, filled while reading
+        self.header = {}
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Drops the parsed text and reads more, returns False at the end of the file"""
+        text = self._text
+        self._lines += text.count('\n', 0, self._pos)
+        chunk = self._file.read(max(self.chunkSize, len(text) - self._pos))
+        self._text = text[self._pos:] + chunk
+        self._pos = 0
+        if chunk == '':
+            self._eof = True
+        return chunk != ''
+
+    def _line(self):
+        return self._lines + self._text.count('\n', 0, self._pos) + 1
+
+    def _peek(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._text, self._pos).end()
+            if self._pos < len(self._text) or not self._fill():
+                break
+        return self._text[self._pos:self._pos + 1]
+
+    def _expect(self, char, path):
+        if self._peek() != char:
+            raise OCAError('expected "' + char + '"', path, self._line())
+        self._pos += 1
+
+    def _value(self, path):
+        # numbers and literals have no closing character: one cut by the end of the buffer
+        # ("24." or "1e+" before "5") decodes as a shorter value, or fails
+        scalar = self._peek() not in '{["'
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._text, self._pos)
+                # a number followed by 3 more characters is complete
+                if not scalar or self._eof or len(self._text) - end > 2:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise OCAError('invalid JSON: ' + e.msg, path, self._lines + e.lineno) from None
+            self._fill()
+
+    def _skip(self, path):
+        """Skips the value at the current position without decoding it.
+        Returns the number of objects directly in it (the frames of a frame list)"""
+        if self._peek() not in '[{':
+            self._value(path)
+            return 0
+        self._pos += 1
+        depth = 1
+        count = 0
+        while True:
+            self._pos = _SKIP.match(self._text, self._pos).end()
+            if self._pos == len(self._text) or self._text[self._pos] == '"':
+                if not self._fill():
+                    raise OCAError('invalid JSON: unterminated value', path, self._line())
+                continue
+            char = self._text[self._pos]
+            self._pos += 1
+            if char == '[' or char == '{':
+                if depth == 1 and char == '{':
+                    count += 1
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return count
+
+    def _keys(self, path):
+        """Yields the keys of the object at the current position, with their line.
+        The caller reads each value before the next key"""
+        self._expect('{', path)
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            line = self._line()
+            key = self._value(path)
+            if not isinstance(key, str):
+                raise OCAError('expected a key', path, line)
+            self._expect(':', path + '.' + key)
+            yield key
+            char = self._peek()
+            self._pos += 1
+            if char == '}':
+                break
+            if char != ',':
+                raise OCAError('expected "," or "}"', path, self._line())
+
+    def _items(self, path, read):
+        """Yields read(path) for each item of the array at the current position"""
+        self._expect('[', path)
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        i = 0
+        while True:
+            yield read(path + '[' + str(i) + ']')
+            i += 1
+            char = self._peek()
+            self._pos += 1
+            if char == ']':
+                break
+            if char != ',':
+                raise OCAError('expected "," or "]"', path, self._line())
+
+    def _document(self, readLayer):
+        with open(self.filepath, 'r', encoding='utf-8') as self._file:
+            self._text = ''
+            self._pos = 0
+            self._eof = False
+            self._lines = 0
+            hasLayers = False
+            for key in self._keys('$'):
+                if key == 'layers':
+                    hasLayers = True
+                    yield from self._items('$.layers', readLayer)
+                    continue
+                self._peek()
+                line = self._line()
+                self.header[key] = self._value('$.' + key)
+                if self.validate and key in _DOCUMENT_SCHEMA:
+                    _checkKeys(self.header, _DOCUMENT_SCHEMA, '$', line, keys=[key])
+        self._file = None
+        self._text = ''
+        if self.validate:
+            if not hasLayers:
+                raise OCAError('missing "layers"', '$')
+            _checkKeys(self.header, _DOCUMENT_SCHEMA, '$', keys=[k for k in _DOCUMENT_SCHEMA if k != 'layers'])
+
+    def _layer(self, path):
+        self._peek()
+        startLine = self._line()
+        layer = self._value(path)
+        if self.validate:
+            validateLayer(layer, path, startLine)
+        return layer
+
+    def _layerSummary(self, path):
+        summary = {'name': '', 'type': 'paintlayer', 'frameCount': 0, 'childLayers': []}
+        if self._peek() != '{':
+            # not a layer: reported by the validation
+            layer = self._value(path)
+        else:
+            layer = {}
+            for key in self._keys(path):
+                isList = self._peek() == '['
+                if key == 'frames' and isList:
+                    summary['frameCount'] = self._skip(path + '.frames')
+                elif key == 'childLayers' and isList:
+                    summary['childLayers'] = list(self._items(path + '.childLayers', self._layerSummary))
+                else:
+                    line = self._line()
+                    layer[key] = self._value(path + '.' + key)
+                    if self.validate:
+                        _checkKeys(layer, _LAYER_SCHEMA, path, line, keys=[key])
+        if self.validate:
+            _checkKeys(layer, _LAYER_SCHEMA, path, keys=[k for k in _LAYER_SCHEMA if k not in ('frames', 'childLayers')])
+        if isinstance(layer, dict):
+            summary['name'] = layer.get('name', '')
+            summary['type'] = layer.get('type', 'paintlayer')
+        return summary
+
+    def layers(self):
+        """Yields the top-level layers as they are read; header holds the other keys once done"""
+        return self._document(self._layer)
+
+    def layerSummaries(self):
+        """Like layers, but yields the name, type, frame count and child layer summaries of each layer.
+        The frames are skipped without being decoded nor validated"""
+        return self._document(self._layerSummary)
+
+    def read(self):
+        """The whole document as a dict, like json.load"""
+        layers = list(self.layers())
+        document = dict(self.header)
+        document['layers'] = layers
+        return document
+
+def readHeader(filepath, validate=True):
+    """The document keys (size, frame range...) and a summary of the layers (names, types,
+    frame counts, children), for file browsers and thumbnails. The frames are not validated"""
+    reader = OCAReader(filepath, validate)
+    layers = list(reader.layerSummaries())
+    header = dict(reader.header)
+    header['layers'] = layers
+    return header
+
+def readBytes(filepath):
+    """Default image loader: the content of the file"""
+    with open(filepath, 'rb') as imageFile:
+        return imageFile.read()
+
+class OCAFrame():
+    """A frame of an OCA layer. The image is loaded by the document loader on first access"""
+
+    __slots__ = ('layer', 'data', 'name', 'fileName', 'frameNumber', 'duration',
+        'position', 'width', 'height', 'opacity', '_image', '_future', '_generation')
+
+    def __init__(self, layer, data):
+        self.layer = layer
+        self.data = data
+        self.name = data.get('name', '')
+        self.fileName = data.get('fileName', '')
+        self.frameNumber = data.get('frameNumber', 0)
+        self.duration = data.get('duration', 1)
+        self.position = data.get('position', [0, 0])
+        self.width = data.get('width', 0)
+        self.height = data.get('height', 0)
+        self.opacity = data.get('opacity', 1.0)
+        self._image = None
+        self._future = None
+        # incremented by unload, so a load still running keeps its image to itself
+        self._generation = 0
+
+    @property
+    def filepath(self):
+        """Absolute path of the image, resolved from the folder of the document"""
+        if self.fileName == '':
+            return ''
+        return os.path.normpath(os.path.join(self.layer.document.folder, self.fileName))
+
+    @property
+    def isLoaded(self):
+        return self._image is not None
+
+    @property
+    def image(self):
+        """The image data returned by the loader of the document, loaded on first access"""
+        if self._image is None:
+            future = self._future
+            if future is not None:
+                try:
+                    future.result()
+                except CancelledError:
+                    pass
+            if self._image is None:
+                self._load()
+        return self._image
+
+    def _load(self):
+        generation = self._generation
+        if self._image is None and self.fileName != '':
+            image = self.layer.document.loader(self.filepath)
+            # not kept if the frame was unloaded meanwhile
+            if generation == self._generation:
+                self._image = image
+            return image
+        return self._image
+
+    def unload(self):
+        """Frees the image, it will be loaded again on next access"""
+        self._generation += 1
+        self._image = None
+        self._future = None
+
+    def endFrame(self):
+        return self.frameNumber + self.duration
+
+class OCALayer():
+    """A layer of an OCA document, with its frames and child layers"""
+
+    __slots__ = ('document', 'parent', 'data', 'name', 'type', 'fileType', 'blendingMode',
+        'animated', 'label', 'opacity', 'visible', 'reference', 'passThrough', 'inheritAlpha',
+        'position', 'width', 'height', 'frames', 'childLayers', '_starts')
+
+    def __init__(self, document, data, parent=None):
+        self.document = document
+        self.parent = parent
+        self.data = data
+        self.name = data.get('name', '')
+        self.type = data.get('type', 'paintlayer')
+        self.fileType = data.get('fileType', 'png')
+        self.blendingMode = data.get('blendingMode', 'normal')
+        self.animated = data.get('animated', False)
+        self.label = data.get('label', 0)
+        self.opacity = data.get('opacity', 1.0)
+        self.visible = data.get('visible', True)
+        self.reference = data.get('reference', False)
+        self.passThrough = data.get('passThrough', False)
+        self.inheritAlpha = data.get('inheritAlpha', False)
+        self.position = data.get('position', [0, 0])
+        self.width = data.get('width', 0)
+        self.height = data.get('height', 0)
+        self.frames = sorted((OCAFrame(self, f) for f in data.get('frames', ())), key=lambda f: f.frameNumber)
+        self.childLayers = [OCALayer(document, l, self) for l in data.get('childLayers', ())]
+        self._starts = [f.frameNumber for f in self.frames]
+
+    def frameAt(self, frame):
+        """The frame displayed at this frame number, or None"""
+        i = bisect_right(self._starts, frame) - 1
+        if i < 0:
+            return None
+        f = self.frames[i]
+        if frame >= f.endFrame():
+            return None
+        return f
+
+    def framesBetween(self, start, end):
+        """The frames displayed between start and end (excluded)"""
+        i = max(bisect_right(self._starts, start) - 1, 0)
+        j = bisect_right(self._starts, end - 1)
+        return [f for f in self.frames[i:j] if f.endFrame() > start]
+
+class OCADocument():
+    """An OCA document: typed layers and frames, with lazy image loading.
+    loader(filepath) returns the image data of a frame; it must be thread-safe to use prefetch"""
+
+    __slots__ = ('filepath', 'folder', 'data', 'name', 'width', 'height', 'frameRate',
+        'startTime', 'endTime', 'backgroundColor', 'colorDepth', 'originApp', 'ocaVersion',
+        'layers', 'loader', 'workers', '_executor', '_lock')
+
+    def __init__(self, filepath, data=None, loader=readBytes, workers=4):
+        self.filepath = os.path.abspath(filepath)
+        self.folder = os.path.dirname(self.filepath)
+        if data is None:
+            data = load(filepath)
+        self.data = data
+        self.name = data.get('name', '')
+        self.width = data.get('width', 0)
+        self.height = data.get('height', 0)
+        self.frameRate = data.get('frameRate', 24.0)
+        self.startTime = data.get('startTime', 0)
+        self.endTime = data.get('endTime', 0)
+        self.backgroundColor = data.get('backgroundColor', [0.0, 0.0, 0.0, 0.0])
+        self.colorDepth = data.get('colorDepth', 'U8')
+        self.originApp = data.get('originApp', '')
+        self.ocaVersion = data.get('ocaVersion', '')
+        self.loader = loader
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.layers = [OCALayer(self, l) for l in data.get('layers', ())]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def allLayers(self):
+        """All the layers, depth first"""
+        stack = list(reversed(self.layers))
+        while stack:
+            layer = stack.pop()
+            yield layer
+            stack.extend(reversed(layer.childLayers))
+
+    def allFrames(self):
+        for layer in self.allLayers():
+            yield from layer.frames
+
+    def prefetch(self, frame, before=0, after=24):
+        """Loads the images displayed from frame - before to frame + after in a thread pool.
+        Returns the futures of the frames being loaded"""
+        futures = []
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            for layer in self.allLayers():
+                for f in layer.framesBetween(frame - before, frame + after + 1):
+                    if f._image is None and f._future is None and f.fileName != '':
+                        f._future = self._executor.submit(f._load)
+                        futures.append(f._future)
+        return futures
+
+    def unloadOutside(self, start, end):
+        """Frees the images which are not displayed between start and end (excluded)"""
+        for layer in self.allLayers():
+            for f in layer.frames:
+                if f.frameNumber >= end or f.endFrame() <= start:
+                    if f._future is not None:
+                        f._future.cancel()
+                    f.unload()
+
+    def close(self):
+        """Stops the prefetch threads"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+def loadDocument(filepath, loader=readBytes, workers=4):
+    """Opens an OCA document, the images are loaded when they are needed"""
+    return OCADocument(filepath, loader=loader, workers=workers)
@@ -0,0 +1,47 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+# Test setup: the pure Python and NumPy parts of DuBLF are tested outside of Blender.
+# The Blender modules are replaced by empty modules when they are not available,
+# and the dublf package is registered without running its __init__ (which imports the Blender only modules).
+
+import importlib
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BLENDER_MODULES = ("bpy", "bmesh", "mathutils", "gpu", "bgl", "gpu_extras", "gpu_extras.batch")
+
+for name in BLENDER_MODULES:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        sys.modules[name] = types.ModuleType(name)
+if not hasattr(sys.modules["gpu_extras.batch"], "batch_for_shader"):
+    sys.modules["gpu_extras.batch"].batch_for_shader = None
+if not hasattr(sys.modules["bpy"], "app"):
+    # used at import time by the handlers
+    sys.modules["bpy"].app = types.SimpleNamespace(handlers=types.SimpleNamespace(persistent=lambda fn: fn))
+
+if "dublf" not in sys.modules:
+    package = types.ModuleType("dublf")
+    package.__path__ = [os.path.join(ROOT, "dublf")]
+    sys.modules["dublf"] = package
@@ -0,0 +1,66 @@
+import colorsys
+
+import numpy as np
+import pytest
+
+from dublf import color
+
+
+@pytest.fixture
+def rgb():
+    rng = np.random.default_rng(0)
+    values = rng.random((300, 3))
+    # dark pixels, greys, pure colours and each channel as the max
+    dark = rng.random((100, 3)) * np.logspace(-8, -2, 100)[:, None]
+    special = np.array([
+        (0, 0, 0), (1, 1, 1), (0.5, 0.5, 0.5), (1e-6, 1e-6, 1e-6), (1e-6, 0, 0), (0, 5e-5, 1e-5),
+        (1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (0, 1, 1), (1, 0, 1), (1, 0, 0.2),
+    ])
+    return np.concatenate([values, dark, special]).astype(np.float32)
+
+
+def _hue_error(a, b):
+    d = np.abs(a - b) % 1.0
+    return np.minimum(d, 1.0 - d)
+
+
+def _check(result, expected, hue=True):
+    expected = np.array(expected)
+    if hue:
+        assert _hue_error(result[:, 0], expected[:, 0]).max() < 1e-5
+        result, expected = result[:, 1:], expected[:, 1:]
+    np.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_rgb_to_hsv(rgb):
+    _check(color.rgb_to_hsv(rgb), [colorsys.rgb_to_hsv(*p) for p in rgb.astype(float)])
+
+
+def test_rgb_to_hsl(rgb):
+    # colorsys returns (h, l, s)
+    expected = [colorsys.rgb_to_hls(*p) for p in rgb.astype(float)]
+    _check(color.rgb_to_hsl(rgb), [(h, s, l) for h, l, s in expected])
+
+
+def test_hsv_to_rgb(rgb):
+    hsv = color.rgb_to_hsv(rgb)
+    _check(color.hsv_to_rgb(hsv), [colorsys.hsv_to_rgb(*p) for p in hsv.astype(float)], hue=False)
+
+
+def test_hsl_to_rgb(rgb):
+    hsl = color.rgb_to_hsl(rgb)
+    _check(color.hsl_to_rgb(hsl), [colorsys.hls_to_rgb(h, l, s) for h, s, l in hsl.astype(float)], hue=False)
+
+
+def test_dark_saturation():
+    hsv = color.rgb_to_hsv(np.array([[1e-6, 0.0, 0.0], [2e-5, 1e-5, 1e-5], [0.0, 0.0, 0.0]], dtype=np.float32))
+    np.testing.assert_allclose(hsv[:, 1], [1.0, 0.5, 0.0], rtol=1e-6)
+
+
+@pytest.mark.parametrize("chunk", [1, 7, None])
+def test_chunks_and_alpha(rgb, chunk):
+    rgba = np.concatenate([rgb, np.ones((len(rgb), 1), dtype=np.float32)], axis=1).reshape(-1, 1, 4)
+    out = np.empty(rgba.shape[:-1] + (3,), dtype=np.float32)
+    result = color.rgb_to_hsv(rgba, out=out, chunk=chunk)
+    assert result is out
+    np.testing.assert_array_equal(result.reshape(-1, 3), color.rgb_to_hsv(rgb))
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from dublf import color
+
+
+def _to_srgb(x):
+    x = np.clip(x, 0.0, 1.0)
+    return np.where(x < 0.0031308, x * 12.92, 1.055 * x ** (1.0 / 2.4) - 0.055)
+
+
+def _to_linear(x):
+    x = np.clip(x, 0.0, 1.0)
+    return np.where(x < 0.04045, x / 12.92, ((x + 0.055) / 1.055) ** 2.4)
+
+
+FUNCTIONS = [(color.linear_to_srgb, _to_srgb), (color.srgb_to_linear, _to_linear)]
+
+# largest error against the float64 formula, relative to 1 for normalized integers
+TOLERANCES = {np.float16: 2.0 ** -11, np.float32: 1e-6, np.float64: 1e-12}
+
+
+def _values(dtype):
+    """All the values of 8 and 16 bit types, a sample in [-0.5, 1.5] for the others"""
+    if dtype in (np.uint8, np.uint16):
+        return np.arange(np.iinfo(dtype).max + 1, dtype=dtype)
+    if dtype == np.float16:
+        x = np.arange(1 << 16, dtype=np.uint16).view(np.float16)
+        return x[np.isfinite(x) & (x >= -0.5) & (x <= 1.5)]
+    rng = np.random.default_rng(0)
+    x = np.concatenate([rng.uniform(-0.5, 1.5, 10000), np.logspace(-9, 0, 1000), [0.0, 0.0031308, 0.04045, 1.0]])
+    return x.astype(dtype)
+
+
+def _check(result, a, exact):
+    dtype = a.dtype.type
+    assert result.dtype == a.dtype and result.shape == a.shape
+    if dtype in (np.uint8, np.uint16):
+        # rounded to the nearest integer
+        top = np.iinfo(dtype).max
+        expected = exact(a.astype(np.float64) / top) * top
+        assert np.abs(result.astype(np.float64) - expected).max() <= 0.5 + 1e-9
+    else:
+        expected = exact(a.astype(np.float64))
+        assert np.abs(result.astype(np.float64) - expected).max() <= TOLERANCES[dtype]
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.float16, np.float32, np.float64])
+@pytest.mark.parametrize("fn, exact", FUNCTIONS)
+def test_transfer(fn, exact, dtype):
+    a = _values(dtype)
+    _check(fn(a), a, exact)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.float16, np.float32, np.float64])
+@pytest.mark.parametrize("fn, exact", FUNCTIONS)
+def test_transfer_in_place(fn, exact, dtype):
+    a = _values(dtype)
+    expected = fn(a)
+    b = a.copy()
+    assert fn(b, out=b, chunk=100) is b
+    np.testing.assert_array_equal(b, expected)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.float16, np.float32])
+@pytest.mark.parametrize("fn, exact", FUNCTIONS)
+def test_transfer_non_contiguous(fn, exact, dtype):
+    a = _values(dtype)[:1000].reshape(-1, 4)[:, ::2]
+    assert not a.flags.c_contiguous
+    result = fn(a)
+    _check(result, a, exact)
+    np.testing.assert_array_equal(result, fn(np.ascontiguousarray(a)))
+
+
+def test_transfer_errors():
+    a = np.zeros((4, 4), dtype=np.float32)
+    with pytest.raises(ValueError):
+        color.linear_to_srgb(a, out=np.zeros((4, 4), dtype=np.float64))
+    with pytest.raises(ValueError):
+        color.linear_to_srgb(a[:, ::2], out=np.zeros((4, 4), dtype=np.float32)[:, ::2])
+    with pytest.raises(TypeError):
+        color.linear_to_srgb(np.zeros(4, dtype=np.int32))
@@ -0,0 +1,239 @@
+import numpy as np
+import pytest
+
+from dublf import composite, oca
+
+# Expected colors of each mode with opaque src and dst, computed by hand from the formulas
+# of Krita's KoCompositeOpFunctions.h, for the src, dst pairs below.
+# Separable modes: channels on both sides of 0.5, with src + dst below and above 1
+SEPARABLE_PAIRS = [((0.2, 0.7, 0.9), (0.6, 0.25, 0.85)), ((0.6, 0.25, 0.85), (0.2, 0.7, 0.9))]
+# non-separable modes: a dark pair and a light pair (lightness sums below and above 1)
+NON_SEPARABLE_PAIRS = [((0.8, 0.3, 0.2), (0.2, 0.4, 0.6)), ((0.9, 0.7, 0.5), (0.6, 0.8, 0.95))]
+
+SEPARABLE_EXPECTED = {
+    'additive_subtractive': [(0.327383, 0.33666, 0.026729), (0.327383, 0.33666, 0.026729)],
+    'allanon': [(0.4, 0.475, 0.875), (0.4, 0.475, 0.875)],
+    'and': [(0.066667, 0.0, 0.750011), (0.066667, 0.0, 0.750011)],
+    'arc_tangent': [(0.204833, 0.781624, 0.518184), (0.795167, 0.218376, 0.481816)],
+    'burn': [(0.0, 0.0, 0.833333), (0.0, 0.0, 0.882353)],
+    'converse': [(0.466667, 0.749996, 0.900008), (0.866667, 0.300008, 0.850004)],
+    'darken': [(0.2, 0.25, 0.85), (0.2, 0.25, 0.85)],
+    'diff': [(0.4, 0.45, 0.05), (0.4, 0.45, 0.05)],
+    'divide': [(1.0, 0.357143, 0.944444), (0.333333, 1.0, 1.0)],
+    'divisive_modulo': [(1.0, 0.357143, 0.944444), (0.333333, 0.8, 0.058823)],
+    'dodge': [(0.75, 0.833333, 1.0), (0.5, 0.933333, 1.0)],
+    'easy burn': [(0.129982, 0.268774, 0.869383), (0.173527, 0.188956, 0.830636)],
+    'easy dodge': [(0.653765, 0.648869, 0.98324), (0.511951, 0.75714, 0.983698)],
+    'equivalence': [(0.4, 0.45, 0.05), (0.4, 0.45, 0.05)],
+    'exclusion': [(0.56, 0.6, 0.22), (0.56, 0.6, 0.22)],
+    'flat_light': [(0.25, 0.416667, 0.941176), (0.25, 0.416667, 0.941176)],
+    'fog_darken_ifs_illusions': [(0.28, 0.385, 0.855), (0.36, 0.3625, 0.8925)],
+    'fog_lighten_ifs_illusions': [(0.52, 0.565, 0.895), (0.44, 0.5875, 0.8575)],
+    'freeze': [(0.2, 0.196429, 0.975), (0.0, 0.64, 0.988235)],
+    'freeze_reflect': [(0.45, 0.208333, 0.975), (0.1, 0.653333, 0.988235)],
+    'gamma_dark': [(0.07776, 0.138011, 0.834789), (0.068399, 0.2401, 0.883421)],
+    'gamma_illumination': [(0.681892, 0.616701, 1.0), (0.427567, 0.79917, 1.0)],
+    'gamma_light': [(0.90288, 0.378929, 0.863927), (0.380731, 0.914691, 0.914337)],
+    'geometric_mean': [(0.34641, 0.41833, 0.874643), (0.34641, 0.41833, 0.874643)],
+    'glow': [(0.1, 0.653333, 1.0), (0.45, 0.208333, 1.0)],
+    'glow_heat': [(0.0, 0.64, 1.0), (0.2, 0.196429, 1.0)],
+    'hard mix': [(0.75, 0.0, 1.0), (0.0, 0.933333, 1.0)],
+    'hard overlay': [(0.24, 0.416667, 1.0), (0.25, 0.35, 1.0)],
+    'hard_light': [(0.24, 0.55, 0.97), (0.36, 0.35, 0.97)],
+    'hard_mix_photoshop': [(0.0, 0.0, 1.0), (0.0, 0.0, 1.0)],
+    'heat': [(0.0, 0.64, 0.988235), (0.2, 0.196429, 0.975)],
+    'heat_glow': [(0.1, 0.653333, 0.988235), (0.45, 0.208333, 0.975)],
+    'heat_glow_freeze_reflect_hybrid': [(0.45, 0.208333, 0.988235), (0.1, 0.653333, 0.975)],
+    'implication': [(0.866667, 0.300008, 0.850004), (0.466667, 0.749996, 0.900008)],
+    'interpolation': [(0.375, 0.47017, 0.960516), (0.375, 0.47017, 0.960516)],
+    'interpolation 2x': [(0.308658, 0.453211, 0.996158), (0.308658, 0.453211, 0.996158)],
+    'inverse_subtract': [(0.0, 0.0, 0.75), (0.0, 0.0, 0.75)],
+    'lighten': [(0.6, 0.7, 0.9), (0.6, 0.7, 0.9)],
+    'linear light': [(0.0, 0.65, 1.0), (0.4, 0.2, 1.0)],
+    'linear_burn': [(0.0, 0.0, 0.75), (0.0, 0.0, 0.75)],
+    'linear_dodge': [(0.8, 0.95, 1.0), (0.8, 0.95, 1.0)],
+    'luminosity_sai': [(0.8, 0.95, 1.0), (0.8, 0.95, 1.0)],
+    'multiply': [(0.12, 0.175, 0.765), (0.12, 0.175, 0.765)],
+    'nand': [(0.933333, 1.0, 0.249989), (0.933333, 1.0, 0.249989)],
+    'negation': [(0.8, 0.95, 0.25), (0.8, 0.95, 0.25)],
+    'nor': [(0.266667, 0.050004, 0.0), (0.266667, 0.050004, 0.0)],
+    'normal': [(0.2, 0.7, 0.9), (0.6, 0.25, 0.85)],
+    'not_converse': [(0.533333, 0.250004, 0.099992), (0.133333, 0.699992, 0.149996)],
+    'not_implication': [(0.133333, 0.699992, 0.149996), (0.533333, 0.250004, 0.099992)],
+    'or': [(0.733333, 0.949996, 1.0), (0.733333, 0.949996, 1.0)],
+    'overlay': [(0.36, 0.35, 0.97), (0.24, 0.55, 0.97)],
+    'parallel': [(0.3, 0.368421, 0.874286), (0.3, 0.368421, 0.874286)],
+    'penumbra a': [(0.375, 0.416667, 0.941176), (0.25, 0.466667, 0.916667)],
+    'penumbra b': [(0.25, 0.466667, 0.916667), (0.375, 0.416667, 0.941176)],
+    'penumbra c': [(0.409666, 0.442284, 0.925446), (0.295167, 0.478056, 0.894863)],
+    'penumbra d': [(0.295167, 0.478056, 0.894863), (0.409666, 0.442284, 0.925446)],
+    'pin_light': [(0.4, 0.4, 0.85), (0.2, 0.5, 0.9)],
+    'pnorm_a': [(0.619391, 0.726478, 1.0), (0.619391, 0.726478, 1.0)],
+    'pnorm_b': [(0.601843, 0.70283, 1.0), (0.601843, 0.70283, 1.0)],
+    'reflect': [(0.45, 0.208333, 1.0), (0.1, 0.653333, 1.0)],
+    'reflect_freeze': [(0.1, 0.653333, 0.988235), (0.45, 0.208333, 0.975)],
+    'screen': [(0.68, 0.775, 0.985), (0.68, 0.775, 0.985)],
+    'shade_ifs_illusions': [(0.025573, 0.0, 0.548772), (0.0, 0.058975, 0.527702)],
+    'soft_light': [(0.456, 0.35, 0.907564), (0.249443, 0.595, 0.934078)],
+    'soft_light_ifs_illusions': [(0.461042, 0.349723, 0.910881), (0.246327, 0.603859, 0.937201)],
+    'soft_light_pegtop_delphi': [(0.456, 0.325, 0.952), (0.232, 0.595, 0.963)],
+    'soft_light_svg': [(0.456, 0.35, 0.907564), (0.2496, 0.595, 0.934078)],
+    'subtract': [(0.4, 0.0, 0.0), (0.0, 0.45, 0.05)],
+    'super_light': [(0.340618, 0.433352, 1.0), (0.254528, 0.462633, 1.0)],
+    'tint_ifs_illusions': [(0.934597, 0.71, 1.0), (0.687214, 1.0, 1.0)],
+    'vivid_light': [(0.0, 0.416667, 1.0), (0.25, 0.4, 1.0)],
+    'xnor': [(0.333333, 0.050004, 0.750011), (0.333333, 0.050004, 0.750011)],
+    'xor': [(0.666667, 0.949996, 0.249989), (0.666667, 0.949996, 0.249989)],
+}
+NON_SEPARABLE_EXPECTED = {
+    'color': [(0.7249, 0.2249, 0.1249), (0.9203, 0.7203, 0.5203)],
+    'color_hsi': [(0.766667, 0.266667, 0.166667), (0.983333, 0.783333, 0.583333)],
+    'color_hsl': [(0.7, 0.2, 0.1), (0.975, 0.775, 0.575)],
+    'color_hsv': [(0.6, 0.1, 0.0), (0.95, 0.75, 0.55)],
+    'darker color': [(0.2, 0.4, 0.6), (0.9, 0.7, 0.5)],
+    'dec_intensity': [(0.0, 0.0, 0.0), (0.3, 0.5, 0.65)],
+    'dec_lightness': [(0.0, 0.0, 0.0), (0.3, 0.5, 0.65)],
+    'dec_luminosity': [(0.0, 0.0, 0.0), (0.337, 0.537, 0.687)],
+    'dec_saturation': [(0.2652, 0.3852, 0.5052), (0.69438, 0.77438, 0.83438)],
+    'dec_saturation_hsi': [(0.265385, 0.4, 0.534615), (0.748307, 0.786518, 0.815176)],
+    'dec_saturation_hsl': [(0.25, 0.4, 0.55), (0.55, 0.807143, 1.0)],
+    'dec_saturation_hsv': [(0.1, 0.35, 0.6), (0.786257, 0.879825, 0.95)],
+    'dec_value': [(0.0, 0.2, 0.4), (0.5, 0.7, 0.85)],
+    'hue': [(0.604267, 0.270933, 0.204267), (0.899925, 0.724925, 0.549925)],
+    'hue_hsi': [(0.705556, 0.288889, 0.205556), (0.900355, 0.783333, 0.666312)],
+    'hue_hsl': [(0.65, 0.233333, 0.15), (1.0, 0.775, 0.55)],
+    'inc_intensity': [(0.666667, 0.833333, 1.0), (1.0, 1.0, 1.0)],
+    'inc_lightness': [(0.8, 0.9, 1.0), (1.0, 1.0, 1.0)],
+    'inc_luminosity': [(0.664304, 0.832152, 1.0), (1.0, 1.0, 1.0)],
+    'inc_saturation': [(0.0533, 0.4333, 0.8133), (0.559185, 0.811079, 1.0)],
+    'inc_saturation_hsi': [(0.015385, 0.4, 0.784615), (0.546107, 0.804899, 0.998994)],
+    'inc_saturation_hsl': [(0.0, 0.4, 0.8), (0.55, 0.807143, 1.0)],
+    'inc_saturation_hsv': [(0.0, 0.3, 0.6), (0.300877, 0.671805, 0.95)],
+    'inc_value': [(1.0, 1.0, 1.0), (1.0, 1.0, 1.0)],
+    'intensity': [(0.233333, 0.433333, 0.633333), (0.516667, 0.716667, 0.866667)],
+    'lighter color': [(0.8, 0.3, 0.2), (0.6, 0.8, 0.95)],
+    'lightness': [(0.3, 0.5, 0.7), (0.525, 0.725, 0.875)],
+    'luminize': [(0.2751, 0.4751, 0.6751), (0.5797, 0.7797, 0.9297)],
+    'saturation': [(0.1185, 0.4185, 0.7185), (0.577529, 0.8061, 0.977529)],
+    'saturation_hsi': [(0.130769, 0.4, 0.669231), (0.633673, 0.796939, 0.919388)],
+    'saturation_hsl': [(0.1, 0.4, 0.7), (0.55, 0.807143, 1.0)],
+    'saturation_hsv': [(0.0, 0.3, 0.6), (0.505556, 0.759524, 0.95)],
+    'value': [(0.4, 0.6, 0.8), (0.55, 0.75, 0.9)],
+}
+
+
+def _opaque(colors):
+    colors = np.asarray(colors, dtype=np.float32)
+    return np.concatenate([colors, np.ones(colors.shape[:-1] + (1,), dtype=np.float32)], -1)[None]
+
+
+def test_modes_are_oca_modes():
+    assert set(composite.BLEND_MODES) == set(oca.OCABlendingModes)
+    expected = set(SEPARABLE_EXPECTED) | set(NON_SEPARABLE_EXPECTED) | set(composite._ALPHA)
+    assert set(composite.BLEND_MODES) == expected
+
+
+@pytest.mark.parametrize("mode, pairs, expected", [(m, SEPARABLE_PAIRS, e) for m, e in SEPARABLE_EXPECTED.items()]
+    + [(m, NON_SEPARABLE_PAIRS, e) for m, e in NON_SEPARABLE_EXPECTED.items()])
+def test_blend_mode(mode, pairs, expected):
+    src = _opaque([s for s, d in pairs])
+    dst = _opaque([d for s, d in pairs])
+    result = composite.blend(dst, src, mode)
+    np.testing.assert_allclose(result[0, :, :3], expected, atol=1e-5)
+    np.testing.assert_array_equal(result[0, :, 3], 1.0)
+
+
+def test_blend_alpha():
+    # W3C compositing: sa = 0.5, da = 0.6, multiply b = 0.8 * 0.4 = 0.32
+    # alpha = 0.5 + 0.6 - 0.3 = 0.8, color = (0.3 * 0.32 + 0.2 * 0.8 + 0.3 * 0.4) / 0.8 = 0.47
+    src = np.array([[[0.8, 0.8, 0.8, 1.0]]], dtype=np.float32)
+    dst = np.array([[[0.4, 0.4, 0.4, 0.6]]], dtype=np.float32)
+    np.testing.assert_allclose(composite.blend(dst, src, 'multiply', 0.5)[0, 0], [0.47, 0.47, 0.47, 0.8], atol=1e-6)
+    # inherit_alpha: sa = 0.5 * 0.6 = 0.3, alpha = 0.72, color = 0.3216 / 0.72, dst alpha kept
+    result = composite.blend(dst, src, 'multiply', 0.5, inherit_alpha=True)
+    np.testing.assert_allclose(result[0, 0], [0.446667, 0.446667, 0.446667, 0.6], atol=1e-6)
+    # transparent result
+    np.testing.assert_array_equal(composite.blend(dst * 0.0, src * 0.0)[0, 0], 0.0)
+
+
+def test_alpha_modes():
+    src = np.array([[[0.8, 0.2, 0.4, 0.5]]], dtype=np.float32)
+    dst = np.array([[[0.2, 0.6, 0.4, 0.3]]], dtype=np.float32)
+    np.testing.assert_allclose(composite.blend(dst, src, 'erase', 0.8)[0, 0], [0.2, 0.6, 0.4, 0.3 * 0.6], atol=1e-6)
+    np.testing.assert_allclose(composite.blend(dst, src, 'destination-in')[0, 0], [0.2, 0.6, 0.4, 0.15], atol=1e-6)
+    # halfway to src, keeping the highest alpha
+    np.testing.assert_allclose(composite.blend(dst, src, 'alphadarken')[0, 0], [0.5, 0.4, 0.4, 0.5], atol=1e-6)
+
+
+def test_dissolve():
+    src = np.full((64, 64, 4), 0.25, dtype=np.float32)
+    src[..., 3] = 0.5
+    dst = np.ones((64, 64, 4), dtype=np.float32)
+    result = composite.blend(dst, src, 'dissolve')
+    hit = result[..., 0] == 0.25
+    assert np.all(hit | (result[..., 0] == 1.0))
+    assert 0.4 < hit.mean() < 0.6
+    np.testing.assert_array_equal(result[..., 3], 1.0)
+    # the same noise for a tile at its position in the document
+    tile = composite.blend(dst[16:, 32:], src[16:, 32:], 'dissolve', origin=(32, 16))
+    np.testing.assert_array_equal(tile, result[16:, 32:])
+
+
+def test_unknown_mode():
+    image = np.zeros((1, 1, 4), dtype=np.float32)
+    with pytest.raises(ValueError):
+        composite.blend(image, image, 'not a mode')
+
+
+def _stack():
+    rng = np.random.default_rng(0)
+    images = [rng.random((h, w, 4), dtype=np.float32) for h, w in ((40, 50), (20, 30), (25, 25), (10, 60))]
+    group = composite.Layer(mode='screen', opacity=0.7, children=[
+        composite.Layer(images[2], 'multiply', offset=(5, 12)),
+        composite.Layer(images[3], 'dissolve', 0.9, offset=(-7, 30), inherit_alpha=True),
+    ])
+    return [
+        composite.Layer(images[0], offset=(3, -4)),
+        composite.Layer(images[1], 'color', 0.5, offset=(20, 10)),
+        group,
+        composite.Layer(images[1], 'destination-in', offset=(10, 8)),
+    ]
+
+
+def test_flatten_tiles():
+    layers = _stack()
+    expected = composite.flatten(layers, 53, 41, background=(0.1, 0.2, 0.3, 1.0), tile=1024, workers=1)
+    for tile, workers in ((7, 1), (16, 3)):
+        result = composite.flatten(layers, 53, 41, background=(0.1, 0.2, 0.3, 1.0), tile=tile, workers=workers)
+        np.testing.assert_allclose(result, expected, atol=1e-6)
+
+
+def test_flatten_pass_through():
+    rng = np.random.default_rng(1)
+    base = composite.Layer(rng.random((8, 8, 4), dtype=np.float32))
+    child = composite.Layer(rng.random((8, 8, 4), dtype=np.float32), 'multiply')
+    group = composite.Layer(opacity=0.5, pass_through=True, children=[child])
+    expected = composite.blend(base.image, child.image, 'multiply', 0.5)
+    np.testing.assert_allclose(composite.flatten([base, group], 8, 8), expected, atol=1e-6)
+
+
+def test_flatten_document():
+    frame = {"fileName": "a.png", "frameNumber": 0, "duration": 2, "position": [2, 1], "width": 4, "height": 2}
+    data = {
+        "width": 4, "height": 2, "backgroundColor": [0.0, 0.0, 1.0, 1.0],
+        "layers": [
+            {"name": "top", "blendingMode": "multiply", "opacity": 0.5, "frames": [frame]},
+            {"name": "reference", "reference": True, "frames": [frame]},
+            {"name": "group", "type": "grouplayer", "childLayers": [{"name": "empty", "frames": []}]},
+        ],
+    }
+    document = oca.OCADocument("doc.oca", data)
+    image = np.full((2, 4, 4), 0.5, dtype=np.float32)
+    layers = composite.document_layers(document, 1, lambda f: image)
+    # bottom to top, the reference layer hidden
+    assert [(l.mode, l.visible) for l in layers] == [('normal', True), ('normal', False), ('multiply', True)]
+    assert layers[0].children == [] and layers[2].offset == (0.0, 0.0)
+    # sa = 0.5 * 0.5 over the blue background: 0.25 * 0.5 + 0.75 * 1.0
+    result = composite.flatten_document(document, 1, lambda f: image, workers=1)
+    np.testing.assert_allclose(result[..., :3], np.broadcast_to([0.0, 0.0, 0.875], (2, 4, 3)), atol=1e-6)
+    assert composite.document_layers(document, 2, lambda f: image)[1:] == []
@@ -0,0 +1,135 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from dublf import geo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# geo.py loaded like tools/bench_geo.py does, and as dublf.geo like the tests do
+LOADERS = {
+    "bench": (
+        "import importlib.util, sys\n"
+        "spec = importlib.util.spec_from_file_location('bench_geo', 'tools/bench_geo.py')\n"
+        "bench = importlib.util.module_from_spec(spec)\n"
+        "spec.loader.exec_module(bench)\n"
+        "geo = bench.load_geo()\n"
+    ),
+    "package": (
+        "import runpy\n"
+        "runpy.run_path('tests/conftest.py')\n"
+        "from dublf import geo\n"
+    ),
+}
+RUN_KERNELS = (
+    "import numpy as np\n"
+    "geo.set_backend('numba')\n"
+    "pts = np.random.default_rng(0).random((50, 2))\n"
+    "geo.smooth_verts(pts.copy(), [0, 50], 0.5, 2, -0.53)\n"
+    "geo.douglas_peucker_ids(pts, 0.1)\n"
+    "geo.tri_ori_batch(pts[:-2], pts[1:-1], pts[2:])\n"
+)
+
+BACKENDS = [
+    "numpy",
+    pytest.param("numba", marks=pytest.mark.skipif(not geo.HAS_NUMBA, reason="numba is not installed")),
+]
+
+
+@pytest.fixture
+def backend(request):
+    previous = geo.get_backend()
+    geo.set_backend(request.param)
+    yield request.param
+    geo.set_backend(previous)
+
+
+def _loop(n, seed=0):
+    """Noisy closed loop, (n, 2)"""
+    rng = np.random.default_rng(seed)
+    a = np.linspace(0.0, 2.0 * np.pi, n, endpoint=False)
+    r = 50.0 + rng.normal(0.0, 2.0, n)
+    return np.stack((r * np.cos(a), r * np.sin(a)), axis=1)
+
+
+@pytest.mark.parametrize("backend", BACKENDS, indirect=True)
+def test_dist_points_line(backend):
+    pts = _loop(500)
+    expected = geo._dist_points_line_loop(pts, (1.0, 2.0), (30.0, -4.0))
+    np.testing.assert_allclose(geo.dist_points_line(pts, (1.0, 2.0), (30.0, -4.0)), expected, rtol=1e-12)
+    # degenerated line
+    expected = geo._dist_points_line_loop(pts, (3.0, 3.0), (3.0, 3.0))
+    np.testing.assert_allclose(geo.dist_points_line(pts, (3.0, 3.0), (3.0, 3.0)), expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize("backend", BACKENDS, indirect=True)
+@pytest.mark.parametrize("eps", [0.0, 0.5, 3.0])
+def test_douglas_peucker_ids(backend, eps):
+    pts = _loop(2000)
+    expected = geo._dp_loop(pts[:, 0].copy(), pts[:, 1].copy(), eps)
+    np.testing.assert_array_equal(np.sort(geo.douglas_peucker_ids(pts, eps)), np.sort(expected))
+
+
+@pytest.mark.parametrize("backend", BACKENDS, indirect=True)
+@pytest.mark.parametrize("mu", [None, -0.53])
+def test_smooth_verts(backend, mu):
+    verts = np.concatenate((_loop(300, 1), _loop(40, 2) * 0.2))
+    offsets = np.array([0, 300, 340])
+    expected = verts.copy()
+    factors = np.array((0.5,) if mu is None else (0.5, mu))
+    geo._smooth_loop(expected, offsets, factors, 4)
+    result = geo.smooth_verts(verts.copy(), offsets, 0.5, 4, mu)
+    np.testing.assert_allclose(result, expected, rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize("backend", BACKENDS, indirect=True)
+def test_tri_ori_batch(backend):
+    rng = np.random.default_rng(3)
+    p1, p2, p3 = (rng.random((1000, 2)) for _ in range(3))
+    np.testing.assert_array_equal(geo.tri_ori_batch(p1, p2, p3), geo._tri_ori_loop(p1, p2, p3))
+
+
+@pytest.mark.skipif(not geo.HAS_NUMBA, reason="numba is not installed")
+def test_backends_equal():
+    pts = _loop(3000)
+    results = {}
+    for name in ("numpy", "numba"):
+        geo.set_backend(name)
+        try:
+            verts = pts.copy()
+            geo.smooth_verts(verts, [0, len(verts)], 0.5, 3, -0.53)
+            results[name] = (
+                geo.dist_points_line(pts, (0.0, 0.0), (10.0, 5.0)),
+                np.sort(geo.douglas_peucker_ids(pts, 1.0)),
+                verts,
+                geo.tri_ori_batch(pts[:-2], pts[1:-1], pts[2:]),
+            )
+        finally:
+            geo.set_backend("numba")
+    for a, b in zip(results["numpy"], results["numba"]):
+        np.testing.assert_allclose(a, b, rtol=1e-12, atol=1e-12)
+
+
+def test_set_backend():
+    previous = geo.get_backend()
+    with pytest.raises(ValueError):
+        geo.set_backend("cuda")
+    if not geo.HAS_NUMBA:
+        with pytest.raises(ValueError):
+            geo.set_backend("numba")
+    assert geo.get_backend() == previous
+
+
+@pytest.mark.skipif(not geo.HAS_NUMBA, reason="numba is not installed")
+def test_loaders(tmp_path):
+    """The compiled kernels work whichever way geo.py was loaded before"""
+    env = dict(os.environ, NUMBA_CACHE_DIR=str(tmp_path))
+    for loader in ("bench", "package"):
+        result = subprocess.run(
+            [sys.executable, "-c", LOADERS[loader] + RUN_KERNELS],
+            cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+        assert result.returncode == 0, result.stderr
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from dublf import geo
+
+
+class RefChain:
+    """The list based Chain this module replaced: vertices as tuples, bounding box updated per vertex"""
+
+    def __init__(self):
+        self.verts = []
+        self.ids = [0, 0, 0, 0]
+        self.bb = None
+
+    def add_vert(self, vert):
+        if self.bb is None:
+            self.bb = [vert[0], vert[1], vert[0], vert[1]]
+        n = len(self.verts)
+        if vert[0] < self.bb[0]:
+            self.bb[0], self.ids[0] = vert[0], n
+        if vert[1] < self.bb[1]:
+            self.bb[1], self.ids[1] = vert[1], n
+        if vert[0] > self.bb[2]:
+            self.bb[2], self.ids[2] = vert[0], n
+        if vert[1] > self.bb[3]:
+            self.bb[3], self.ids[3] = vert[1], n
+        self.verts.append(vert)
+
+    def get_end_location(self, loc):
+        if loc == "CENTER":
+            return ((self.bb[2] + self.bb[0]) / 2, (self.bb[3] + self.bb[1]) / 2)
+        return self.verts[self.ids[{"BOTTOM": 0, "LEFT": 1, "TOP": 2, "RIGHT": 3}[loc]]]
+
+    def get_segments(self):
+        return list(zip(self.verts, self.verts[1:] + self.verts[:1]))
+
+
+def _bb_ids(ch):
+    return [ch._minx_id, ch._miny_id, ch._maxx_id, ch._maxy_id]
+
+
+@pytest.fixture
+def verts():
+    # a rounded shape with ties on the extreme coordinates
+    rng = np.random.default_rng(0)
+    pts = np.round(rng.normal(size=(500, 2)) * 4.0)
+    return [tuple(p) for p in pts.tolist()]
+
+
+def test_add_vert_matches_reference(verts):
+    ref = RefChain()
+    ch = geo.Chain()
+    for i, v in enumerate(verts):
+        ref.add_vert(v)
+        ch.add_vert(v)
+        # the bounding box is right after every vertex, even when the buffer grows
+        if i % 37 == 0:
+            assert _bb_ids(ch) == ref.ids
+    assert len(ch) == len(verts)
+    assert _bb_ids(ch) == ref.ids
+    assert [ch._minx, ch._miny, ch._maxx, ch._maxy] == ref.bb
+    for loc in ("CENTER", "LEFT", "RIGHT", "BOTTOM", "TOP"):
+        assert tuple(ch.get_end_location(loc)) == tuple(ref.get_end_location(loc))
+    segments, np_segments = ch.get_segments()
+    assert segments == ref.get_segments()
+    np.testing.assert_array_equal(np_segments, np.array(ref.get_segments()))
+
+
+def test_extend_matches_add_vert(verts):
+    added = geo.Chain()
+    for v in verts:
+        added.add_vert(v)
+    for parts in ((verts,), (verts[:1], verts[1:200], [], verts[200:])):
+        ch = geo.Chain()
+        for part in parts:
+            ch.extend(part)
+        np.testing.assert_array_equal(ch.verts, added.verts)
+        assert _bb_ids(ch) == _bb_ids(added)
+    np.testing.assert_array_equal(geo.Chain(np.array(verts)).verts, added.verts)
+
+
+def test_verts_view():
+    ch = geo.Chain()
+    ch.extend([(0, 0), (1, 0), (1, 1)])
+    view = ch.verts
+    assert view.shape == (3, 2) and view.dtype == np.float64
+    assert np.shares_memory(view, ch._buf)
+    # the buffer doubles
+    for i in range(100):
+        ch.add_vert((i, -i))
+    assert len(ch._buf) == 128
+    assert ch._maxx_id == 102 and ch._miny_id == 102
+
+
+def test_verts_setter_resets_bounding_box():
+    ch = geo.Chain([(0, 0), (4, 0), (4, 4)])
+    segments = ch.get_segments()[1]
+    ch.verts = [(1, 1), (-2, 3), (0, -5)]
+    assert _bb_ids(ch) == [1, 2, 0, 1]
+    assert ch.get_segments()[1] is not segments
+    ch.add_vert((7, 0))
+    assert ch._maxx_id == 3
+
+
+def test_verify():
+    assert geo.Chain([(0, 0), (1, 0), (1, 1)]).verify()
+    assert not geo.Chain([(0, 0), (1, 0), (1, 0), (1, 1)]).verify()
+    assert not geo.Chain([(0, 0), (1, 0), (1, 1), (0, 0)]).verify()
@@ -0,0 +1,49 @@
+import numpy as np
+
+from dublf import geo
+
+
+def _square(offset):
+    """Closed chain of 4 segments"""
+    x, y = offset
+    pts = [(x, y), (x + 1, y), (x + 1, y + 1), (x, y + 1)]
+    return [(pts[i], pts[(i + 1) % 4]) for i in range(4)]
+
+
+def test_chain_ids_closed():
+    verts, chains, failures = geo.parse_segments_np(_square((0, 0)) + _square((5, 5)))
+    assert failures == 0
+    assert sorted(len(ids) for ids in chains) == [4, 4]
+    for ids in chains:
+        assert len(set(ids.tolist())) == len(ids)
+
+
+def test_chain_ids_open_and_closed():
+    # an open path, a closed square and a branching chain
+    path = [((10, 0), (11, 0)), ((11, 0), (12, 0)), ((12, 0), (13, 1))]
+    branch = _square((20, 20)) + [((20, 20), (19, 19))]
+    verts, chains, failures = geo.parse_segments_np(path + _square((0, 0)) + branch)
+    assert len(chains) == 1
+    assert sorted(map(tuple, verts[chains[0]].tolist())) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert failures > 0
+
+
+def test_chain_ids_open_only():
+    edges = np.array([(0, 1), (1, 2), (3, 4)])
+    chains, failures = geo.chain_ids(5, edges)
+    assert chains == []
+    assert failures > 0
+
+
+def test_chain_ids_empty():
+    assert geo.chain_ids(0, np.zeros((0, 2), dtype=np.intp)) == ([], 0)
+
+
+def test_parse_segments(capsys):
+    path = [((10, 0), (11, 0)), ((11, 0), (12, 0))]
+    chains, failures = geo.parse_segments(None, _square((0, 0)) + _square((5, 5)) + path)
+    assert [len(ch) for ch in chains] == [4, 4]
+    assert all(isinstance(ch, geo.Chain) for ch in chains)
+    assert failures > 0
+    assert geo.parse_segments(None, []) == ([], 0)
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+import pytest
+
+from dublf import geo
+
+
+def _crosses(p0, p1, q0, q1):
+    """Closed segments p0 p1 and q0 q1 intersect (what mathutils.geometry.intersect_line_line_2d tested)"""
+    def side(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    d1, d2 = side(q0, q1, p0), side(q0, q1, p1)
+    d3, d4 = side(p0, p1, q0), side(p0, p1, q1)
+    return d1 * d2 <= 0.0 and d3 * d4 <= 0.0
+
+
+def _ref_inside(ch, other):
+    """The former Chain.inside: bounding box test, then an even-odd count along a vertical line"""
+    if ch._minx > other._maxx or ch._miny > other._maxy or ch._maxx < other._minx or ch._maxy < other._miny:
+        return False
+    mp = ch.verts[ch._miny_id]
+    x = mp[0] + 0.001
+    line = ((x, other._miny - 1.0), (x, mp[1]))
+    v = other.verts.tolist()
+    count = 0
+    for a, b in zip(v, v[1:] + v[:1]):
+        if (a[0] - x) * (b[0] - x) <= 0.0 and _crosses(line[0], line[1], a, b):
+            count += 1
+    return count % 2 != 0
+
+
+def _ref_classify(chains):
+    """Pairwise classification: the parent is the container with the most containers"""
+    containers = [[j for j, other in enumerate(chains) if j != i and _ref_inside(ch, other)]
+        for i, ch in enumerate(chains)]
+    parents = [max(c, key=lambda j: len(containers[j])) if c else None for c in containers]
+    return parents, [len(c) % 2 == 1 for c in containers]
+
+
+def _ring(cx, cy, r, n=40, noise=0.0, rng=None):
+    a = np.linspace(0.0, 2.0 * math.pi, n, endpoint=False)
+    rr = r * (1.0 + (rng.uniform(-noise, noise, n) if noise else 0.0))
+    return geo.Chain(np.stack([cx + rr * np.cos(a), cy + rr * np.sin(a)], axis=1))
+
+
+@pytest.fixture
+def chains():
+    rng = np.random.default_rng(0)
+    chains = []
+    # nested rings (islands in holes in islands), side by side
+    for k in range(4):
+        for depth in range(k + 1):
+            chains.append(_ring(100.0 * k, 0.0, 40.0 - 9.0 * depth, noise=0.1, rng=rng))
+    # many small islands, some of them in a big ring
+    chains.append(_ring(200.0, 300.0, 120.0, n=200, noise=0.05, rng=rng))
+    for _ in range(60):
+        x, y = rng.uniform(60.0, 340.0), rng.uniform(160.0, 440.0)
+        chains.append(_ring(x, y, rng.uniform(1.0, 4.0), n=8, noise=0.2, rng=rng))
+    # concave shape with an island in its notch
+    chains.append(geo.Chain([(500, 0), (600, 0), (600, 100), (560, 100), (560, 20), (540, 20), (540, 100), (500, 100)]))
+    chains.append(_ring(550.0, 60.0, 5.0))
+    return chains
+
+
+def test_inside_matches_reference(chains):
+    for ch in chains[:20]:
+        for other in chains:
+            if ch is not other:
+                assert ch.inside(other) == _ref_inside(ch, other)
+
+
+def test_classify_matches_reference(chains):
+    parents, inner = _ref_classify(chains)
+    geo.classify_chains(chains)
+    ids = {id(ch): i for i, ch in enumerate(chains)}
+    assert [None if ch.parent is None else ids[id(ch.parent)] for ch in chains] == parents
+    assert [ch.inner for ch in chains] == inner
+    for i, ch in enumerate(chains):
+        assert sorted(ids[id(c)] for c in ch.children) == [j for j, p in enumerate(parents) if p == i]
+    # the nested rings alternate islands and holes
+    assert [ch.inner for ch in chains[6:10]] == [False, True, False, True]
+    assert chains[-1].parent is None
+
+
+def test_classify_small():
+    ch = _ring(0.0, 0.0, 1.0)
+    ch.parent = ch
+    ch.inner = True
+    geo.classify_chains([ch])
+    assert ch.parent is None and ch.children == [] and not ch.inner
+    geo.classify_chains([])
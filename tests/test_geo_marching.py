@@ -0,0 +1,43 @@
+import numpy as np
+
+from dublf import geo
+
+
+def _noise_mask(size, seed=0):
+    rng = np.random.default_rng(seed)
+    img = rng.random((size, size)).astype(np.float32)
+    # smooth it a little, for blobs and holes
+    return (img + np.roll(img, 1, 0) + np.roll(img, 1, 1) + np.roll(img, (1, 1), (0, 1))) * 0.25
+
+
+def _sorted_segments(segs):
+    segs = np.asarray(segs).reshape(-1, 4)
+    return segs[np.lexsort(segs.T[::-1])]
+
+
+def test_marching_graph_matches_segments():
+    img = _noise_mask(96)
+    segs = geo.lines_marching_np(img, 0.5, img > 0.5)
+    verts, edges = geo.marching_graph(img, 0.5, img > 0.5)
+    assert len(np.unique(edges)) == len(verts)
+    np.testing.assert_array_equal(_sorted_segments(np.take(verts, edges, axis=0)), _sorted_segments(segs))
+
+
+def test_trace_marching_closed():
+    img = _noise_mask(64, 1)
+    verts, chains, failures = geo.trace_marching(img, 0.5, img > 0.5)
+    assert failures == 0
+    assert sum(len(ids) for ids in chains) == len(verts)
+
+
+def test_lines_marching_levels():
+    img = _noise_mask(80, 2)
+    # unsorted, with a duplicate and levels outside of the image range
+    cutoffs = [0.6, 0.3, 0.5, 0.3, -1.0, 2.0, 0.45]
+    expected = [geo.lines_marching_np(img, c, img > c) for c in cutoffs]
+    for workers in (None, 3):
+        levels = geo.lines_marching_levels(img, cutoffs, workers)
+        assert len(levels) == len(cutoffs)
+        for segs, ref in zip(levels, expected):
+            np.testing.assert_array_equal(segs, ref)
+    assert geo.lines_marching_levels(img, []) == []
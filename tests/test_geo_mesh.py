@@ -0,0 +1,88 @@
+import numpy as np
+
+from dublf import geo
+
+
+class StubCollection:
+    """A mesh vertices, loops or polygons collection recording the foreach_set buffers"""
+
+    def __init__(self):
+        self.count = 0
+        self.buffers = {}
+
+    def add(self, count):
+        self.count += count
+
+    def foreach_set(self, attr, values):
+        self.buffers[attr] = np.array(values)
+
+
+class StubMesh:
+    def __init__(self):
+        self.vertices = StubCollection()
+        self.loops = StubCollection()
+        self.polygons = StubCollection()
+        self.updated = False
+
+    def update(self, calc_edges=False):
+        self.updated = calc_edges
+
+
+def _square(x, y, size):
+    # counter clockwise
+    return [(x, y), (x + size, y), (x + size, y + size), (x, y + size)]
+
+
+def _chains():
+    return [geo.Chain(_square(0, 0, 10)), geo.Chain(_square(2, 2, 2)), geo.Chain(_square(20, 0, 5)),
+        geo.Chain([(30, 0), (31, 0)])]
+
+
+def _check(mesh):
+    # the 14 chain verts (the 2 vertex chain is not a face, its verts are still added) and 2 bridge ends
+    assert mesh.vertices.count == 16
+    co = mesh.vertices.buffers["co"].reshape(-1, 3)
+    assert co.dtype == np.float32 and len(co) == 16
+    # XZ plane
+    np.testing.assert_array_equal(co[:, 1], 0.0)
+    np.testing.assert_array_equal(co[4, [0, 2]], (2, 2))
+    # the duplicates of the bridge ends: the rightmost hole vert and the closest outer vert
+    np.testing.assert_array_equal(co[14:, [0, 2]], [(4, 4), (0, 0)])
+
+    # the hole is reversed and bridged from its vert 6 to the outer vert 0
+    assert mesh.loops.count == 14
+    np.testing.assert_array_equal(mesh.loops.buffers["vertex_index"],
+        [0, 6, 5, 4, 7, 14, 15, 1, 2, 3, 8, 9, 10, 11])
+    assert mesh.polygons.count == 2
+    np.testing.assert_array_equal(mesh.polygons.buffers["loop_start"], [0, 10])
+    np.testing.assert_array_equal(mesh.polygons.buffers["loop_total"], [10, 4])
+    assert mesh.updated
+
+
+def test_chains_to_mesh():
+    verts, offsets, parents, inner = geo.chain_buffers(_chains())
+    parents[1] = 0
+    inner[1] = True
+    _check(geo.chains_to_mesh(StubMesh(), verts, offsets, parents, inner))
+
+
+def test_mesh_from_chains():
+    chains = _chains()
+    geo.classify_chains(chains)
+    assert chains[1].parent is chains[0] and chains[1].inner
+    invalid = geo.Chain(_square(50, 50, 1))
+    invalid.invalid = True
+    _check(geo.mesh_from_chains(StubMesh(), chains[:2] + [invalid] + chains[2:]))
+
+
+def test_chains_to_mesh_plane():
+    mesh = geo.chains_to_mesh(StubMesh(), _square(1, 2, 1), [0, 4], plane="YZ")
+    co = mesh.vertices.buffers["co"].reshape(-1, 3)
+    np.testing.assert_array_equal(co[:, 0], 0.0)
+    np.testing.assert_array_equal(co[0], (0, 1, 2))
+    assert mesh.polygons.count == 1
+
+
+def test_chains_to_mesh_empty():
+    mesh = geo.mesh_from_chains(StubMesh(), [])
+    assert mesh.vertices.count == mesh.loops.count == mesh.polygons.count == 0
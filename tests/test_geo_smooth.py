@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from dublf import geo
+
+BACKENDS = [
+    "numpy",
+    pytest.param("numba", marks=pytest.mark.skipif(not geo.HAS_NUMBA, reason="numba is not installed")),
+]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    previous = geo.get_backend()
+    geo.set_backend(request.param)
+    yield request.param
+    geo.set_backend(previous)
+
+
+def _ref_smooth(verts, amount, t, mu=None):
+    """The per vertex loop of the former Chain.smooth, on a copy of the previous pass (Jacobi)"""
+    ch = [tuple(v) for v in verts]
+    for _ in range(t):
+        for f in (amount,) if mu is None else (amount, mu):
+            prev = list(ch)
+            n = len(prev)
+            for i in range(n):
+                vl = prev[(i - 1) % n]
+                vr = prev[(i + 1) % n]
+                ch[i] = (((vl[0] + vr[0]) * 0.5) * f + prev[i][0] * (1.0 - f),
+                    ((vl[1] + vr[1]) * 0.5) * f + prev[i][1] * (1.0 - f))
+    return np.array(ch)
+
+
+def _loop(n, seed):
+    rng = np.random.default_rng(seed)
+    a = np.linspace(0.0, 2.0 * np.pi, n, endpoint=False)
+    r = 20.0 + rng.normal(0.0, 1.0, n)
+    return np.stack((r * np.cos(a) + seed * 50.0, r * np.sin(a)), axis=1)
+
+
+def _area(v):
+    x, y = v[:, 0], v[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+@pytest.mark.parametrize("mu", [None, -0.53])
+def test_chain_smooth(backend, mu):
+    verts = _loop(300, 1)
+    ch = geo.Chain(verts)
+    ch.smooth(0.5, 10, mu)
+    np.testing.assert_allclose(ch.verts, _ref_smooth(verts, 0.5, 10, mu), rtol=0, atol=1e-9)
+    # the bounding box follows the smoothed vertices
+    assert ch._minx == ch.verts[:, 0].min() and ch._maxy == ch.verts[:, 1].max()
+
+
+@pytest.mark.parametrize("mu", [None, -0.53])
+def test_smooth_chains(backend, mu):
+    # chains of 3 vertices and more, smoothed in one buffer
+    loops = [_loop(n, seed) for seed, n in enumerate((3, 4, 57, 200))]
+    chains = [geo.Chain(v) for v in loops]
+    geo.smooth_chains(chains, 0.3, 7, mu)
+    for ch, verts in zip(chains, loops):
+        np.testing.assert_allclose(ch.verts, _ref_smooth(verts, 0.3, 7, mu), rtol=0, atol=1e-9)
+    geo.smooth_chains([], 0.3, 7)
+
+
+def test_taubin_keeps_area(backend):
+    verts = _loop(400, 2)
+    laplace = geo.smooth_verts(verts.copy(), [0, len(verts)], 0.5, 50)
+    taubin = geo.smooth_verts(verts.copy(), [0, len(verts)], 0.5, 50, -0.53)
+    assert abs(_area(taubin) / _area(verts) - 1.0) < 0.02
+    assert _area(laplace) < _area(taubin)
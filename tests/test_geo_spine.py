@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from dublf import geo
+
+
+class _Builder:
+    """Triangulation from vertex locations, sharing the vertices at the same location"""
+
+    def __init__(self):
+        self.ids = {}
+        self.tris = []
+
+    def vert(self, p):
+        return self.ids.setdefault(p, len(self.ids))
+
+    def tri(self, a, b, c):
+        self.tris.append((self.vert(a), self.vert(b), self.vert(c)))
+
+    def quad(self, a, b, c, d):
+        self.tri(a, b, c)
+        self.tri(a, c, d)
+
+    def arrays(self):
+        co = np.array(sorted(self.ids, key=self.ids.get), dtype=np.float64)
+        return co, np.array(self.tris)
+
+
+def _strip(length, width=2):
+    """[0, length] x [0, width] rectangle, in one row of quads"""
+    b = _Builder()
+    for x in range(length):
+        b.quad((x, 0), (x + 1, 0), (x + 1, width), (x, width))
+    return b.arrays()
+
+
+def _tee():
+    """A bar [-10, 10] x [0, 2] and a stem [-1, 1] x [2, 12], joined by one junction triangle"""
+    b = _Builder()
+    for x in range(-10, 10):
+        if x not in (-1, 0):
+            b.quad((x, 0), (x + 1, 0), (x + 1, 2), (x, 2))
+    b.tri((-1, 0), (0, 0), (-1, 2))
+    b.tri((0, 0), (1, 0), (1, 2))
+    b.tri((0, 0), (1, 2), (-1, 2))
+    for y in range(2, 12):
+        b.quad((-1, y), (1, y), (1, y + 1), (-1, y + 1))
+    return b.arrays()
+
+
+def _degrees(verts, edges):
+    return np.bincount(edges.reshape(-1), minlength=len(verts))
+
+
+def _components(verts, edges):
+    parent = list(range(len(verts)))
+
+    def find(v):
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    for a, b in edges.tolist():
+        parent[find(a)] = find(b)
+    return len({find(v) for v in range(len(verts))})
+
+
+def test_strip_centre_line():
+    co, tris = _strip(20)
+    verts, edges, width = geo.spine_graph(co, tris, prune=0.0)
+    # the midpoints of the rungs and of the diagonals
+    np.testing.assert_array_equal(verts[:, 1], 1.0)
+    np.testing.assert_array_equal(np.sort(verts[:, 0]), np.arange(1, 40) * 0.5)
+    # the shape is 2 wide, except at the ends where the nearest border is the end edge
+    ends = (verts[:, 0] == 0.5) | (verts[:, 0] == 19.5)
+    np.testing.assert_allclose(width[~ends], 2.0)
+    np.testing.assert_allclose(width[ends], 1.0)
+    # a single path
+    assert len(edges) == len(verts) - 1
+    assert _components(verts, edges) == 1
+    assert np.count_nonzero(_degrees(verts, edges) == 1) == 2
+    np.testing.assert_allclose(np.abs(np.diff(verts[edges], axis=1)).sum(), 19.0)
+
+
+@pytest.mark.parametrize("prune", [0.5, 1.2, 3.0])
+def test_strip_prune(prune):
+    co, tris = _strip(20)
+    verts, edges, width = geo.spine_graph(co, tris, prune)
+    # the ends are eroded by about prune * width / 2, the path stays whole
+    np.testing.assert_array_equal(verts[:, 1], 1.0)
+    assert len(edges) == len(verts) - 1
+    assert _components(verts, edges) == 1
+    assert verts[:, 0].min() <= 0.5 + prune + 0.5
+    assert verts[:, 0].max() >= 19.5 - prune - 0.5
+
+
+def test_tee_centre_lines():
+    co, tris = _tee()
+    verts, edges, width = geo.spine_graph(co, tris, prune=0.0)
+    assert _components(verts, edges) == 1
+    degrees = _degrees(verts, edges)
+    # the bar ends, the stem end, and one fork
+    assert np.count_nonzero(degrees == 1) == 3
+    assert np.count_nonzero(degrees == 3) == 1
+    assert np.all(degrees <= 3)
+
+    bar = np.abs(verts[:, 0]) >= 1.0
+    stem = verts[:, 1] >= 2.0
+    np.testing.assert_array_equal(verts[bar, 1], 1.0)
+    np.testing.assert_array_equal(verts[stem, 0], 0.0)
+    ends = (np.abs(verts[:, 0]) == 9.5) | (verts[:, 1] == 11.5)
+    np.testing.assert_allclose(width[(bar | stem) & ~ends], 2.0)
+    # the branches reach the ends of the bar and of the stem
+    assert verts[:, 0].min() == -9.5
+    assert verts[:, 0].max() == 9.5
+    assert verts[:, 1].max() == 11.5
+
+
+def test_tee_prune_keeps_the_fork():
+    co, tris = _tee()
+    verts, edges, _ = geo.spine_graph(co, tris, prune=1.2)
+    degrees = _degrees(verts, edges)
+    assert _components(verts, edges) == 1
+    assert np.count_nonzero(degrees == 1) == 3
+    assert np.count_nonzero(degrees == 3) == 1
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from dublf import geo
+
+
+def _ref_lines_square(img, cutoff):
+    """lines_square before it was streamed by bands, on the whole image at once"""
+    nm = img > cutoff
+
+    nm[0, :] = False
+    nm[-1, :] = False
+    nm[:, 0] = False
+    nm[:, -1] = False
+
+    one_vert = ~nm[:-1, :-1] & nm[1:, :-1] & nm[:-1, 1:] & ~nm[1:, 1:]
+    nm[:-1, :-1] = np.where(one_vert, True, nm[:-1, :-1])
+    one_vert = nm[:-1, :-1] & ~nm[1:, :-1] & ~nm[:-1, 1:] & nm[1:, 1:]
+    nm[:-1, :-1] = np.where(one_vert, False, nm[:-1, :-1])
+
+    not_single = nm[:-2, 1:-1] & nm[2:, 1:-1] & nm[1:-1, :-2] & nm[1:-1, 2:]
+    nm[1:-1, 1:-1] = np.where(not_single * (~nm[1:-1, 1:-1]), True, nm[1:-1, 1:-1])
+
+    ylocs = np.argwhere(nm[1:, :] != nm[:-1, :])
+    y_verts = [((l[0], l[1]), (l[0], l[1] - 1)) for l in ylocs]
+    nmt = nm.copy()
+    nmt[1:-1, :] = False
+    ylocs = np.argwhere(nmt)
+    y_verts.extend([((l[0], l[1]), (l[0], l[1] - 1)) for l in ylocs])
+
+    xlocs = np.argwhere(nm[:, 1:] != nm[:, :-1])
+    x_verts = [((l[0], l[1]), (l[0] - 1, l[1])) for l in xlocs]
+    nmt = nm.copy()
+    nmt[:, 1:-1] = False
+    xlocs = np.argwhere(nmt)
+    x_verts.extend([((l[0], l[1]), (l[0] - 1, l[1])) for l in xlocs])
+
+    return x_verts + y_verts
+
+
+def _masks():
+    rng = np.random.default_rng(4)
+    noise = rng.random((61, 47)).astype(np.float32)
+    blobs = (noise + np.roll(noise, 1, 0) + np.roll(noise, 1, 1) + np.roll(noise, (1, 1), (0, 1))) * 0.25
+    # one vertex corners and single holes, which the cleanup changes
+    checker = np.zeros((12, 14), dtype=np.float32)
+    checker[2:10:2, 2:12:2] = 1.0
+    checker[3:10:2, 3:12:2] = 1.0
+    holes = np.ones((9, 11), dtype=np.float32)
+    holes[2:8:2, 2:10:3] = 0.0
+    full = np.ones((5, 6), dtype=np.float32)
+    return {"noise": noise, "blobs": blobs, "checker": checker, "holes": holes, "full": full}
+
+
+MASKS = _masks()
+
+
+@pytest.mark.parametrize("band_rows", [1, 2, 3, 5, 16, 256])
+@pytest.mark.parametrize("mask", sorted(MASKS))
+def test_lines_square_np(mask, band_rows):
+    img = MASKS[mask]
+    expected = np.array(_ref_lines_square(img, 0.5), dtype=np.int32).reshape(-1, 2, 2)
+    segs = geo.lines_square_np(img, 0.5, band_rows)
+    assert segs.dtype == np.int32
+    # edge for edge, in the same order
+    np.testing.assert_array_equal(segs, expected)
+
+
+def test_lines_square():
+    img = MASKS["blobs"]
+    expected = [(tuple(map(int, p0)), tuple(map(int, p1))) for p0, p1 in _ref_lines_square(img, 0.5)]
+    assert geo.lines_square(img, 0.5) == expected
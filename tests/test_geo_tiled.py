@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from dublf import geo
+
+
+def _disc_mask(size, centers, radius):
+    y, x = np.mgrid[:size, :size]
+    img = np.zeros((size, size), dtype=np.float32)
+    for cy, cx in centers:
+        img[(y - cy) ** 2 + (x - cx) ** 2 < radius ** 2] = 1.0
+    return img
+
+
+def _loops(verts, chains):
+    return sorted(tuple(sorted(map(tuple, np.round(verts[ids], 6).tolist()))) for ids in chains)
+
+
+def _reference(img, cutoff):
+    verts, chains, failures = geo.parse_segments_np(geo.lines_marching_np(img, cutoff, img > cutoff))
+    return _loops(verts, chains), failures
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_trace_tiled_no_seam(use_processes):
+    # two blobs inside their own tiles: no chain crosses a seam
+    img = _disc_mask(64, [(12, 12), (48, 48)], 6)
+    verts, chains, failures = geo.trace_tiled(img, 0.5, tile_size=32, workers=2, use_processes=use_processes)
+    assert len(chains) == 2
+    assert (_loops(verts, chains), failures) == _reference(img, 0.5)
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_trace_tiled_seams(use_processes):
+    # blobs across the seams, and empty tiles
+    img = _disc_mask(96, [(32, 32), (10, 70)], 9)
+    verts, chains, failures = geo.trace_tiled(img, 0.5, tile_size=32, workers=2, use_processes=use_processes)
+    assert len(chains) == 2
+    assert (_loops(verts, chains), failures) == _reference(img, 0.5)
+
+
+def test_trace_tiled_empty():
+    img = np.zeros((64, 64), dtype=np.float32)
+    verts, chains, failures = geo.trace_tiled(img, 0.5, tile_size=32, use_processes=False)
+    assert len(verts) == 0 and chains == [] and failures == 0
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from dublf import geo
+
+
+def _disc(img, center, radius, value):
+    rows, cols = np.ogrid[: img.shape[0], : img.shape[1]]
+    img[(rows - center[0]) ** 2 + (cols - center[1]) ** 2 <= radius**2] = value
+
+
+def _image():
+    img = np.zeros((80, 96), dtype=np.float32)
+    for center, radius in (((20, 20), 9), ((20, 60), 12), ((55, 30), 14), ((60, 75), 8)):
+        _disc(img, center, radius, 1.0)
+    # a hole in one of the discs
+    _disc(img, (55, 30), 5, 0.0)
+    return img
+
+
+def _canonical(chains):
+    """The loops as vertex tuples, from their smallest vertex and in their smaller direction"""
+    loops = []
+    for pts in chains:
+        pts = [tuple(p) for p in np.round(pts, 9).tolist()]
+        k = pts.index(min(pts))
+        forward = pts[k:] + pts[:k]
+        backward = forward[:1] + forward[:0:-1]
+        loops.append(tuple(min(forward, backward)))
+    return sorted(loops)
+
+
+def _edit(img, center, radius, value):
+    img = img.copy()
+    _disc(img, center, radius, value)
+    r0 = max(0, center[0] - radius)
+    c0 = max(0, center[1] - radius)
+    return img, (r0, center[0] + radius + 1, c0, center[1] + radius + 1)
+
+
+EDITS = {
+    # a new blob away from the others
+    "add": ((8, 88), 4, 1.0),
+    # joins two discs
+    "merge": ((20, 40), 8, 1.0),
+    # cuts a disc in two
+    "split": ((20, 60), 3, 0.0),
+    # fills the hole
+    "fill": ((55, 30), 6, 1.0),
+    # along the black border of the image
+    "border": ((78, 48), 5, 1.0),
+    # removes a whole disc
+    "erase": ((60, 75), 9, 0.0),
+}
+
+
+@pytest.mark.parametrize("use_rect", [True, False])
+@pytest.mark.parametrize("edit", sorted(EDITS))
+def test_update_matches_full_trace(edit, use_rect):
+    img = _image()
+    cache = geo.TraceCache(img, 0.5)
+    new_img, rect = _edit(img, *EDITS[edit])
+    window = cache.update(new_img, rect if use_rect else None)
+    assert window is not None
+    expected = geo.TraceCache(new_img, 0.5)
+    assert _canonical(cache.chains) == _canonical(expected.chains)
+    np.testing.assert_array_equal(cache.img, new_img)
+
+
+def test_update_sequence():
+    img = _image()
+    cache = geo.TraceCache(img, 0.5)
+    for center, radius, value in EDITS.values():
+        img, rect = _edit(img, center, radius, value)
+        cache.update(img, rect)
+        assert _canonical(cache.chains) == _canonical(geo.TraceCache(img, 0.5).chains)
+
+
+def test_update_unchanged():
+    img = _image()
+    cache = geo.TraceCache(img, 0.5)
+    chains = cache.chains
+    assert cache.update(img.copy()) is None
+    assert cache.update(img, (10, 10, 0, 5)) is None
+    assert cache.chains is chains
+    with pytest.raises(ValueError):
+        cache.update(img[:-1])
@@ -0,0 +1,278 @@
+import contextlib
+import types
+
+import numpy as np
+import pytest
+
+from dublf import image
+
+
+class ProtocolBuffer(bytearray):
+    """bgl.Buffer of GL_BYTE values, with the buffer protocol"""
+
+    def to_list(self):
+        raise AssertionError("the values must not go through a list")
+
+
+class ListBuffer:
+    """Older bgl.Buffer, without the buffer protocol"""
+
+    def __init__(self, size):
+        self.data = bytearray(size)
+
+    def __setitem__(self, key, values):
+        self.data[key] = values
+
+    def to_list(self):
+        return np.frombuffer(self.data, dtype=np.int8).tolist()
+
+
+def _fake_gl(monkeypatch, pixels, protocol=True):
+    """Replaces the GPU modules used by gl_copy; glReadPixels writes pixels into the buffer"""
+    def read_pixels(x, y, width, height, fmt, kind, buffer):
+        buffer[:] = pixels.tobytes()
+
+    bgl = types.SimpleNamespace(
+        GL_COLOR_BUFFER_BIT=0, GL_TEXTURE0=0, GL_TEXTURE_2D=0, GL_BACK=0, GL_RGBA=0, GL_BYTE=0,
+        GL_UNSIGNED_BYTE=0,
+        glClear=lambda *a: None, glActiveTexture=lambda *a: None, glBindTexture=lambda *a: None,
+        glReadBuffer=lambda *a: None, glReadPixels=read_pixels,
+        Buffer=lambda kind, size: ProtocolBuffer(size) if protocol else ListBuffer(size),
+    )
+    offscreen = types.SimpleNamespace(bind=contextlib.nullcontext, free=lambda: None)
+    shader = types.SimpleNamespace(bind=lambda: None, uniform_int=lambda *a: None)
+    gpu = types.SimpleNamespace(
+        types=types.SimpleNamespace(GPUOffScreen=lambda w, h: offscreen),
+        matrix=types.SimpleNamespace(push_pop=contextlib.nullcontext, load_matrix=lambda m: None,
+            load_projection_matrix=lambda m: None),
+        shader=types.SimpleNamespace(from_builtin=lambda name: shader),
+    )
+    mu = types.SimpleNamespace(Matrix=types.SimpleNamespace(Identity=lambda n: None))
+    batch = types.SimpleNamespace(draw=lambda shader: None)
+    monkeypatch.setattr(image, "bgl", bgl, raising=False)
+    monkeypatch.setattr(image, "gpu", gpu, raising=False)
+    monkeypatch.setattr(image, "mu", mu, raising=False)
+    monkeypatch.setattr(image, "batch_for_shader", lambda *a: batch, raising=False)
+
+
+@pytest.fixture
+def pixels():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (5, 7, 4), dtype=np.uint8)
+
+
+def _image(width, height):
+    return types.SimpleNamespace(size=(width, height), bindcode=1, gl_load=lambda: 0)
+
+
+@pytest.mark.parametrize("protocol", [True, False])
+@pytest.mark.parametrize("dtype", [np.uint8, "uint8", np.dtype(np.uint8)])
+def test_gl_copy_uint8(monkeypatch, pixels, protocol, dtype):
+    _fake_gl(monkeypatch, pixels, protocol)
+    result = image.gl_copy(_image(7, 5), dtype)
+    assert result.dtype == np.uint8
+    np.testing.assert_array_equal(result, pixels)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, "float64"])
+def test_gl_copy_float(monkeypatch, pixels, dtype):
+    _fake_gl(monkeypatch, pixels)
+    result = image.gl_copy(_image(7, 5), dtype)
+    assert result.dtype == np.dtype(dtype) and result.shape == (5, 7, 4)
+    np.testing.assert_allclose(result, pixels / 255.0, rtol=1e-6)
+
+
+def test_gl_copy_view(monkeypatch, pixels):
+    # with the buffer protocol, uint8 pixels are a view on the read buffer
+    buffers = []
+    _fake_gl(monkeypatch, pixels)
+    image.bgl.Buffer = lambda kind, size: buffers.append(ProtocolBuffer(size)) or buffers[-1]
+    result = image.gl_copy(_image(7, 5), np.uint8)
+    assert np.shares_memory(result, np.frombuffer(buffers[0], dtype=np.uint8))
+
+
+def test_buffer_as_uint8():
+    values = bytes([0, 1, 127, 128, 200, 255, 3, 4])
+    np.testing.assert_array_equal(image.buffer_as_uint8(ProtocolBuffer(values)), list(values))
+    buffer = ListBuffer(8)
+    buffer[:] = values
+    np.testing.assert_array_equal(image.buffer_as_uint8(buffer), list(values))
+
+
+class StubPixels:
+    """Image.pixels, counting the foreach_get reads"""
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float32).reshape(-1)
+        self.reads = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def foreach_get(self, buffer):
+        self.reads += 1
+        buffer[:] = self.values
+
+
+class StubImage:
+    def __init__(self, name, values, source="FILE"):
+        height, width, channels = values.shape
+        self.name = name
+        self.type = "IMAGE"
+        self.source = source
+        self.filepath_raw = "//" + name + ".png"
+        self.size = (width, height)
+        self.channels = channels
+        self.is_dirty = False
+        self.pixels = StubPixels(values)
+
+    def edit(self, values):
+        """Changes the pixels, like painting or reloading, without the depsgraph update"""
+        self.pixels.values = np.asarray(values, dtype=np.float32).reshape(-1)
+
+
+def _values(seed, shape=(6, 5, 4)):
+    return np.random.default_rng(seed).random(shape).astype(np.float32)
+
+
+@pytest.fixture
+def tracked(monkeypatch):
+    """A new pixel cache, with update tracking off and the depsgraph handlers recorded"""
+    registered = []
+    monkeypatch.setattr(image, "handlers", types.SimpleNamespace(
+        depsgraph_update_post_append=lambda fn: registered.append(fn) if fn not in registered else None,
+        depsgraph_update_post_remove=lambda fn: registered.remove(fn) if fn in registered else None,
+    ))
+    monkeypatch.setattr(image, "bpy", types.SimpleNamespace(types=types.SimpleNamespace(Image=StubImage)))
+    monkeypatch.setattr(image, "pixel_cache", image.PixelCache())
+    monkeypatch.setattr(image, "_tracking", False)
+    monkeypatch.setattr(image, "_image_updates", image.defaultdict(int))
+    return types.SimpleNamespace(cache=image.pixel_cache, registered=registered)
+
+
+def _depsgraph_update(*ids):
+    """Runs the update counter like the depsgraph handler would"""
+    depsgraph = types.SimpleNamespace(updates=[types.SimpleNamespace(id=i) for i in ids])
+    image._count_image_updates(None, depsgraph)
+
+
+def test_pixel_cache():
+    cache = image.PixelCache(budget=3 * 400)
+    a, b, c = (np.zeros(100, dtype=np.float32) for _ in range(3))
+    assert cache.get("a", 0, "pixels") is None
+    cache.put("a", 0, "pixels", a)
+    cache.put("a", 0, "alpha", b)
+    assert cache.get("a", 0, "pixels") is a and cache.get("a", 0, "alpha") is b
+    assert cache.get("a", 1, "pixels") is None
+    assert cache.nbytes == 800 and "a" in cache
+    # a new stamp drops the other channels
+    cache.put("a", 1, "pixels", c)
+    assert cache.peek("a", "alpha") is None and cache.nbytes == 400
+    assert cache.stats() == {"hits": 2, "misses": 2, "images": 1, "bytes": 400, "budget": 1200}
+
+
+def test_pixel_cache_budget():
+    cache = image.PixelCache(budget=2 * 400)
+    for name in "abc":
+        cache.put(name, 0, "pixels", np.zeros(100, dtype=np.float32))
+    # the least recently used image is evicted
+    assert "a" not in cache and "b" in cache and "c" in cache
+    cache.get("b", 0, "pixels")
+    cache.put("d", 0, "pixels", np.zeros(100, dtype=np.float32))
+    assert "b" in cache and "c" not in cache
+    # the image just added stays, even over budget
+    cache.put("e", 0, "pixels", np.zeros(1000, dtype=np.float32))
+    assert list(cache._entries) == ["e"] and cache.nbytes == 4000
+    cache.clear("e")
+    assert cache.nbytes == 0
+    cache.put("f", 0, "pixels", np.zeros(10, dtype=np.float32))
+    cache.clear()
+    assert cache.nbytes == 0 and "f" not in cache
+
+
+def test_image_pixels_cached(tracked):
+    values = _values(0)
+    img = StubImage("a", values)
+    pixels = image.image_pixels(img)
+    np.testing.assert_array_equal(pixels, values)
+    assert not pixels.flags.writeable
+    # the first cached read starts the update tracking
+    assert tracked.registered == [image._count_image_updates]
+    again = image.image_pixels(img)
+    assert img.pixels.reads == 1 and np.shares_memory(again, pixels)
+    image.image_pixels(img, use_cache=False)
+    assert img.pixels.reads == 2
+
+
+def test_image_pixels_edit_save(tracked):
+    img = StubImage("a", _values(0))
+    image.image_pixels(img)
+    # painted, then saved: clean again, with the same file and size
+    img.edit(_values(1))
+    img.is_dirty = True
+    _depsgraph_update(img)
+    np.testing.assert_array_equal(image.image_pixels(img), _values(1))
+    img.edit(_values(2))
+    _depsgraph_update(img)
+    img.is_dirty = False
+    np.testing.assert_array_equal(image.image_pixels(img), _values(2))
+    assert img.pixels.reads == 3
+
+
+def test_image_pixels_reload(tracked):
+    img = StubImage("a", _values(0))
+    other = StubImage("b", _values(3))
+    image.image_pixels(img)
+    image.image_pixels(other)
+    img.edit(_values(1))
+    _depsgraph_update(img, types.SimpleNamespace(name="a"))
+    np.testing.assert_array_equal(image.image_pixels(img), _values(1))
+    # the other images stay cached
+    image.image_pixels(other)
+    assert other.pixels.reads == 1
+
+
+@pytest.mark.parametrize("source", ["SEQUENCE", "MOVIE"])
+def test_image_pixels_frames(tracked, source):
+    img = StubImage("a", _values(0), source)
+    image.image_pixels(img)
+    # another frame, nothing else changed
+    img.edit(_values(1))
+    np.testing.assert_array_equal(image.image_pixels(img), _values(1))
+    np.testing.assert_array_equal(image.image_channel(img, "alpha"), _values(1)[:, :, 3])
+    assert img.pixels.reads == 3
+
+
+def test_image_pixels_tracking_off(tracked):
+    img = StubImage("a", _values(0))
+    image.image_pixels(img)
+    image.track_image_updates(False)
+    assert tracked.registered == [] and "a" not in tracked.cache
+    # the stamp does not add update counts
+    image._image_stamp(img)
+    assert "a" not in image._image_updates
+
+
+@pytest.mark.parametrize("channel", ["alpha", "luminance", "hsv"])
+def test_image_channel(tracked, channel):
+    values = _values(0)
+    img = StubImage("a", values)
+    array = image.image_channel(img, channel)
+    np.testing.assert_array_equal(array, image._derive_channel(values, channel))
+    assert not array.flags.writeable
+    assert image.image_channel(img, channel) is array
+    assert img.pixels.reads == 1
+
+    img.edit(_values(1))
+    _depsgraph_update(img)
+    np.testing.assert_array_equal(image.image_channel(img, channel), image._derive_channel(_values(1), channel))
+    assert tracked.cache.peek("a", channel) is not array
+
+
+def test_image_channel_grey(tracked):
+    values = _values(0, (4, 3, 1))
+    img = StubImage("a", values)
+    np.testing.assert_array_equal(image.image_channel(img, "alpha"), np.ones((4, 3)))
+    np.testing.assert_array_equal(image.image_channel(img, "luminance"), values[:, :, 0])
+    with pytest.raises(ValueError):
+        image.image_channel(img, "red")
@@ -0,0 +1,262 @@
+import json
+import threading
+
+import pytest
+
+from dublf import oca
+
+
+def _frame(layer, k):
+    return {
+        "name": "%s_%03d" % (layer, k),
+        "fileName": "%s/%s_%03d.png" % (layer, layer, k),
+        "frameNumber": k * 2,
+        "duration": 2,
+        "position": [960, 540],
+        "width": 1920,
+        "height": 1080,
+        "opacity": 0.5 + k / 1000.0,
+    }
+
+
+def _layer(name, frames=3, children=()):
+    return {
+        "name": name,
+        "type": "grouplayer" if children else "paintlayer",
+        "blendingMode": "normal",
+        "animated": True,
+        "label": 2,
+        "opacity": 24.5,
+        "visible": True,
+        "reference": False,
+        "passThrough": False,
+        "inheritAlpha": False,
+        "position": [960.25, -540.5e-3],
+        "width": 1920,
+        "height": 1080,
+        "frames": [_frame(name, k) for k in range(frames)],
+        "childLayers": list(children),
+    }
+
+
+# brackets, quotes and backslashes in the strings skipped by readHeader
+ODD_NAME = "b ]}{[ \\\" \\"
+
+
+@pytest.fixture
+def document():
+    return {
+        "name": "tést \"quoted\" [ { \\ ]",
+        "width": 1920,
+        "height": 1080,
+        "frameRate": 23.976,
+        "startTime": -12,
+        "endTime": 1000,
+        "backgroundColor": [1.0, 0.25, 1e-05, -3.5e+20],
+        "colorDepth": "U8",
+        "ocaVersion": "1.1.0",
+        "layers": [
+            _layer("a"),
+            _layer(ODD_NAME, 2),
+            _layer("group", 0, [_layer("child", 5), _layer("empty group", 0, [_layer("leaf", 1)])]),
+        ],
+        "extra": [None, True, False, 0, -0.0, 12345678901234567890, {"x": []}, {}],
+    }
+
+
+def _write(tmp_path, document, **dump):
+    filepath = tmp_path / "doc.oca"
+    filepath.write_text(json.dumps(document, **dump), encoding="utf-8")
+    return str(filepath)
+
+
+CHUNK_SIZES = [1, 2, 3, 4, 5, 7, 8, 13, 16, 17, 64, 1000, 1 << 16]
+FORMATS = [{}, {"indent": 4}, {"separators": (",", ":")}]
+
+
+@pytest.mark.parametrize("dump", FORMATS)
+@pytest.mark.parametrize("chunkSize", CHUNK_SIZES)
+def test_read_round_trip(tmp_path, document, dump, chunkSize):
+    filepath = _write(tmp_path, document, **dump)
+    with open(filepath, encoding="utf-8") as f:
+        expected = json.load(f)
+    assert oca.OCAReader(filepath, chunkSize=chunkSize).read() == expected
+
+
+@pytest.mark.parametrize("dump", FORMATS)
+@pytest.mark.parametrize("chunkSize", CHUNK_SIZES)
+def test_read_header(tmp_path, document, dump, chunkSize):
+    filepath = _write(tmp_path, document, **dump)
+    reader = oca.OCAReader(filepath, chunkSize=chunkSize)
+    layers = list(reader.layerSummaries())
+    assert reader.header == {k: v for k, v in document.items() if k != "layers"}
+    assert [l["name"] for l in layers] == ["a", ODD_NAME, "group"]
+    assert [l["frameCount"] for l in layers] == [3, 2, 0]
+    group = layers[2]
+    assert group["type"] == "grouplayer"
+    assert [(l["name"], l["frameCount"]) for l in group["childLayers"]] == [("child", 5), ("empty group", 0)]
+    assert group["childLayers"][1]["childLayers"] == [
+        {"name": "leaf", "type": "paintlayer", "frameCount": 1, "childLayers": []}]
+
+
+def test_read_header_function(tmp_path, document):
+    header = oca.readHeader(_write(tmp_path, document))
+    assert header["width"] == 1920 and len(header["layers"]) == 3
+
+
+def test_number_at_chunk_end(tmp_path):
+    # "24." then "5": the number must not be decoded as 24
+    filepath = tmp_path / "doc.oca"
+    filepath.write_text('{"a": 24.5, "b": 1e+5, "c": -7, "d": true, "layers": []}')
+    for chunkSize in range(1, 30):
+        assert oca.OCAReader(str(filepath), validate=False, chunkSize=chunkSize).read() == {
+            "a": 24.5, "b": 1e+5, "c": -7, "d": True, "layers": []}
+
+
+def test_validation_error_lines(tmp_path, document):
+    document["layers"][1]["frames"] = [_frame("b", 0), dict(_frame("b", 1), frameNumber="1")]
+    filepath = _write(tmp_path, document, indent=4)
+    with open(filepath, encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    # the line of the opening brace, before the name of the layer
+    start = lines.index('            "name": ' + json.dumps(ODD_NAME) + ',')
+    with pytest.raises(oca.OCAError) as error:
+        oca.OCAReader(filepath, chunkSize=7).read()
+    assert error.value.path == "$.layers[1].frames[1].frameNumber"
+    assert error.value.line is None
+    assert error.value.startLine == start
+    assert "in the value starting at line %d" % start in str(error.value)
+
+
+def test_header_error_line(tmp_path, document):
+    document["frameRate"] = "24"
+    filepath = _write(tmp_path, document, indent=4)
+    with open(filepath, encoding="utf-8") as f:
+        line = f.read().split("\n").index('    "frameRate": "24",') + 1
+    for read in (oca.OCAReader(filepath).read, lambda: oca.readHeader(filepath)):
+        with pytest.raises(oca.OCAError) as error:
+            read()
+        assert error.value.path == "$.frameRate"
+        assert error.value.line == line
+
+
+def test_summary_validates_layer_keys(tmp_path, document):
+    document["layers"][2]["childLayers"][0]["visible"] = 1
+    with pytest.raises(oca.OCAError) as error:
+        oca.readHeader(_write(tmp_path, document))
+    assert error.value.path == "$.layers[2].childLayers[0].visible"
+
+
+def test_syntax_error_line(tmp_path):
+    filepath = tmp_path / "doc.oca"
+    filepath.write_text('{\n"width": 1,\n"layers": [\n{"name": "a",\n"frames": [}\n]}')
+    for chunkSize in (1, 5, 1000):
+        with pytest.raises(oca.OCAError) as error:
+            oca.OCAReader(str(filepath), validate=False, chunkSize=chunkSize).read()
+        assert error.value.line == 5
+
+
+def _images(tmp_path, document):
+    """Writes stub PNG files for the frames, returns the document file"""
+    def write(layer):
+        for f in layer["frames"]:
+            path = tmp_path / f["fileName"]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"\x89PNG" + f["name"].encode("utf-8"))
+        for child in layer["childLayers"]:
+            write(child)
+
+    for layer in document["layers"]:
+        write(layer)
+    return _write(tmp_path, document)
+
+
+def _names(frames):
+    return [f.name for f in frames]
+
+
+def test_frame_at(tmp_path, document):
+    # a gap after a_001
+    document["layers"][0]["frames"][1]["duration"] = 1
+    doc = oca.OCADocument(_write(tmp_path, document), document)
+    layer = doc.layers[0]
+    assert layer.frameAt(-1) is None
+    assert layer.frameAt(0).name == "a_000" and layer.frameAt(1).name == "a_000"
+    assert layer.frameAt(2).name == "a_001"
+    assert layer.frameAt(3) is None
+    assert layer.frameAt(5).name == "a_002"
+    assert layer.frameAt(6) is None
+    # group layers have no frames
+    assert doc.layers[2].frameAt(0) is None
+
+
+def test_frames_between(tmp_path, document):
+    document["layers"][0]["frames"][1]["duration"] = 1
+    layer = oca.OCADocument(_write(tmp_path, document), document).layers[0]
+    assert _names(layer.framesBetween(0, 4)) == ["a_000", "a_001"]
+    assert _names(layer.framesBetween(1, 2)) == ["a_000"]
+    assert _names(layer.framesBetween(3, 4)) == []
+    assert _names(layer.framesBetween(3, 5)) == ["a_002"]
+    assert _names(layer.framesBetween(-10, 100)) == ["a_000", "a_001", "a_002"]
+    assert layer.framesBetween(-10, 0) == [] and layer.framesBetween(6, 10) == []
+
+
+def test_lazy_image(tmp_path, document):
+    doc = oca.OCADocument(_images(tmp_path, document), document)
+    f = doc.layers[0].frames[1]
+    assert not f.isLoaded
+    assert f.image == b"\x89PNGa_001"
+    assert f.isLoaded
+    f.unload()
+    assert not f.isLoaded
+
+
+def test_prefetch(tmp_path, document):
+    with oca.OCADocument(_images(tmp_path, document), document, workers=2) as doc:
+        # frames 2 and 3
+        futures = doc.prefetch(2, before=0, after=1)
+        assert len(futures) == 3
+        for future in futures:
+            future.result()
+        loaded = sorted(f.name for f in doc.allFrames() if f.isLoaded)
+        assert loaded == sorted(["a_001", ODD_NAME + "_001", "child_001"])
+        for f in doc.allFrames():
+            if f.isLoaded:
+                assert f.image == b"\x89PNG" + f.name.encode("utf-8")
+        # the loaded frames are not loaded again
+        assert len(doc.prefetch(2, before=2, after=1)) == 4
+        assert doc.prefetch(0, before=0, after=3) == []
+
+
+def test_unload_outside(tmp_path, document):
+    with oca.OCADocument(_images(tmp_path, document), document) as doc:
+        for future in doc.prefetch(0, after=100):
+            future.result()
+        doc.unloadOutside(2, 4)
+        loaded = sorted(f.name for f in doc.allFrames() if f.isLoaded)
+        assert loaded == sorted(["a_001", ODD_NAME + "_001", "child_001"])
+        assert all(f._future is None for f in doc.allFrames() if not f.isLoaded)
+        # unloaded frames are loaded again on access
+        assert doc.layers[0].frames[0].image == b"\x89PNGa_000"
+
+
+def test_unload_while_loading(tmp_path, document):
+    started = threading.Event()
+    release = threading.Event()
+
+    def loader(filepath):
+        started.set()
+        release.wait(10)
+        return filepath
+
+    doc = oca.OCADocument(_images(tmp_path, document), document, loader=loader, workers=1)
+    f = doc.layers[0].frames[0]
+    future = doc.prefetch(0, after=0)[0]
+    assert started.wait(10)
+    doc.unloadOutside(10, 20)
+    release.set()
+    assert future.result() == f.filepath
+    # the running load does not bring the image back
+    assert not f.isLoaded
+    assert f.image == f.filepath
+    doc.close()
@@ -0,0 +1,102 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+# Benchmark of dublf.geo.apply_transforms against apply_transfrom, in Blender:
+#   blender -b --factory-startup --python tools/bench_apply.py -- --count 5000
+
+import argparse
+import importlib.util
+import math
+import os
+import sys
+import time
+
+import bpy
+
+GEO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dublf", "geo.py")
+
+
+def load_geo():
+    spec = importlib.util.spec_from_file_location("dublf_geo", GEO_PATH)
+    geo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(geo)
+    return geo
+
+
+def make_planes(count, shared_every=4):
+    """Scaled and rotated planes, like imported OCA layers; every shared_every plane shares its mesh"""
+    coll = bpy.data.collections.new("bench_apply")
+    bpy.context.scene.collection.children.link(coll)
+    obs = []
+    mesh = None
+    for i in range(count):
+        if mesh is None or i % shared_every == 0:
+            mesh = bpy.data.meshes.new("plane")
+            mesh.from_pydata([(-1, 0, -1), (1, 0, -1), (1, 0, 1), (-1, 0, 1)], [], [(0, 1, 2, 3)])
+        ob = bpy.data.objects.new("plane", mesh)
+        ob.location = (i % 100, 0.0, i // 100)
+        ob.rotation_euler = (0.0, 0.0, math.radians(i % 360))
+        # planes sharing a mesh get the same scale, except every other group
+        s = 1.0 + (i // shared_every) % 7 + (i % 2) * ((i // shared_every) % 2)
+        ob.scale = (s, s, s)
+        coll.objects.link(ob)
+        obs.append(ob)
+    return coll, obs
+
+
+def clear(coll):
+    meshes = set(ob.data for ob in coll.objects)
+    for ob in list(coll.objects):
+        bpy.data.objects.remove(ob)
+    for mesh in meshes:
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+    bpy.data.collections.remove(coll)
+
+
+def run(geo, count, bulk):
+    coll, obs = make_planes(count)
+    bpy.context.view_layer.update()
+    t = time.perf_counter()
+    if bulk:
+        geo.apply_transforms(obs, use_scale=True)
+    else:
+        for ob in obs:
+            geo.apply_transfrom(ob, use_scale=True)
+    bpy.context.view_layer.update()
+    elapsed = time.perf_counter() - t
+    clear(coll)
+    return elapsed
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(description="dublf.geo apply_transforms benchmark")
+    parser.add_argument("--count", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    geo = load_geo()
+    t_single = run(geo, args.count, False)
+    t_bulk = run(geo, args.count, True)
+    print("apply scale, %d objects: apply_transfrom %8.2f ms | apply_transforms %8.2f ms (x%.1f)" % (
+        args.count, t_single * 1000.0, t_bulk * 1000.0, t_single / t_bulk))
+
+
+if __name__ == "__main__":
+    main()
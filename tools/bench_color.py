@@ -0,0 +1,119 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+# Benchmarks for dublf.color, time and peak memory against the previous image.rgb2hsv:
+#   python tools/bench_color.py --size 4096
+
+import argparse
+import importlib.util
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+COLOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dublf", "color.py")
+
+
+def load_color():
+    spec = importlib.util.spec_from_file_location("dublf_color", COLOR_PATH)
+    color = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(color)
+    return color
+
+
+def rgb2hsv_reference(image):
+    """image.rgb2hsv before dublf.color"""
+    tmp = image[:, :, :3]
+    r = tmp[:, :, 0]
+    g = tmp[:, :, 1]
+    b = tmp[:, :, 2]
+
+    acmax = tmp.argmax(2)
+    cmax = tmp.max(2)
+    cmin = tmp.min(2)
+    delta = cmax - cmin
+
+    delta[delta == 0.0] = 1.0
+    hr = np.where(acmax == 0, ((g - b) / delta) % 6.0, 0.0)
+    hg = np.where(acmax == 1, (b - r) / delta + 2.0, 0.0)
+    hb = np.where(acmax == 2, (r - g) / delta + 4.0, 0.0)
+
+    H = np.where(cmax == cmin, 0.0, (hr + hg + hb) / 6.0)
+    H[H < 0.0] += 1.0
+
+    L = cmax
+    St = cmax <= 0.0001
+    cmax[St] = 1.0
+    S = np.where(St, 0.0, (cmax - cmin) / cmax)
+
+    return [H, S, L]
+
+
+def linear2srgb_reference(c):
+    """image.linear2srgb_np before dublf.color (with np.power)"""
+    srgb = np.where(c < 0.0031308, c * 12.92, 1.055 * np.power(c, 1.0 / 2.4) - 0.055)
+    srgb[srgb > 1.0] = 1.0
+    srgb[srgb < 0.0] = 0.0
+    return srgb
+
+
+def measure(fn, *args):
+    """(wall time, peak traced memory) of fn(*args), from two separate runs"""
+    t = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - t
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="dublf.color benchmarks")
+    parser.add_argument("--size", type=int, default=4096)
+    args = parser.parse_args(argv)
+
+    color = load_color()
+    img = np.random.default_rng(0).random((args.size, args.size, 4), dtype=np.float32)
+    hsv = np.empty(img.shape[:2] + (3,), dtype=np.float32)
+    img8 = (img * 255.0).astype(np.uint8)
+    img16 = img.astype(np.float16)
+    print("%dx%d RGBA float32 image (%.0f MB)" % (args.size, args.size, img.nbytes / 1048576.0))
+    cases = (
+        ("rgb2hsv (previous)", rgb2hsv_reference, img),
+        ("rgb_to_hsv", color.rgb_to_hsv, img),
+        ("rgb_to_hsv, out=", lambda: color.rgb_to_hsv(img, out=hsv)),
+        ("hsv_to_rgb", color.hsv_to_rgb, hsv),
+        ("rgb_to_hsl", color.rgb_to_hsl, img),
+        ("luminance", color.luminance, img),
+        ("linear2srgb (previous)", linear2srgb_reference, img),
+        ("linear_to_srgb", color.linear_to_srgb, img),
+        ("linear_to_srgb, in place", lambda: color.linear_to_srgb(img, out=img)),
+        ("linear_to_srgb, uint8", color.linear_to_srgb, img8),
+        ("linear_to_srgb, float16", color.linear_to_srgb, img16),
+    )
+    for name, fn, *fn_args in cases:
+        elapsed, peak = measure(fn, *fn_args)
+        print("  %-26s %10.2f ms %10.1f MB peak" % (name, elapsed * 1000.0, peak / 1048576.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+
+# Benchmarks for dublf.composite, blending modes on a tile and layer stack flattening:
+#   python tools/bench_composite.py --size 2048 --layers 8 --workers 4
+# The expected results of the modes are checked by tests/test_composite.py
+
+import argparse
+import importlib.util
+import os
+import time
+
+import numpy as np
+
+COMPOSITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dublf", "composite.py")
+
+
+def load_composite():
+    spec = importlib.util.spec_from_file_location("dublf_composite", COMPOSITE_PATH)
+    composite = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(composite)
+    return composite
+
+
+def gradients(size):
+    """src and dst test images: all the src / dst value pairs on colors, and alpha steps"""
+    ramp = np.linspace(0.0, 1.0, size, dtype=np.float32)
+    src = np.empty((size, size, 4), dtype=np.float32)
+    dst = np.empty((size, size, 4), dtype=np.float32)
+    src[..., 0] = ramp[:, None]
+    src[..., 1] = ramp[::-1, None]
+    src[..., 2] = 0.5
+    src[..., 3] = np.where(np.arange(size) % 8 < 6, 1.0, 0.5)[None, :]
+    dst[..., 0] = ramp[None, :]
+    dst[..., 1] = 0.25
+    dst[..., 2] = ramp[None, ::-1]
+    dst[..., 3] = np.where(np.arange(size) % 16 < 12, 1.0, 0.25)[:, None]
+    return src, dst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="dublf.composite benchmarks")
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    composite = load_composite()
+    src, dst = gradients(composite.TILE_SIZE)
+    print("blending modes, one %d px tile:" % composite.TILE_SIZE)
+    timings = []
+    for mode in composite.BLEND_MODES:
+        t = time.perf_counter()
+        composite.blend(dst, src, mode, 0.8, dst.copy())
+        timings.append((time.perf_counter() - t, mode))
+    for elapsed, mode in sorted(timings, reverse=True)[:10]:
+        print("  %-34s %8.2f ms" % (mode, elapsed * 1000.0))
+    print("  %-34s %8.2f ms" % ("(median)", sorted(timings)[len(timings) // 2][0] * 1000.0))
+
+    rng = np.random.default_rng(0)
+    modes = ("normal", "multiply", "screen", "overlay", "soft_light", "color", "diff", "dodge")
+    layers = [composite.Layer(rng.random((args.size, args.size, 4), dtype=np.float32),
+        modes[i % len(modes)], 0.8) for i in range(args.layers)]
+    print("flatten %d layers of %dx%d px:" % (args.layers, args.size, args.size))
+    for workers in sorted(set((1, args.workers))):
+        t = time.perf_counter()
+        composite.flatten(layers, args.size, args.size, workers=workers)
+        print("  %2d workers %10.2f ms" % (workers, (time.perf_counter() - t) * 1000.0))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,398 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+# Benchmarks for dublf.geo, runnable outside of Blender (Blender modules are stubbed).
+# Tracing pipeline on synthetic masks, optionally saved as JSON to compare releases:
+#   python tools/bench_geo.py --sizes 512 2048 --json bench.json
+# Kernel comparisons with the previous implementations:
+#   python tools/bench_geo.py --kernels
+
+import argparse
+import importlib.util
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import types
+
+import numpy as np
+
+GEO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dublf", "geo.py")
+
+
+def load_geo():
+    """Loads dublf/geo.py alone, with stub Blender modules if needed"""
+    for name in ("mathutils", "bmesh"):
+        if name not in sys.modules:
+            try:
+                __import__(name)
+            except ImportError:
+                sys.modules[name] = types.ModuleType(name)
+    spec = importlib.util.spec_from_file_location("dublf_geo", GEO_PATH)
+    geo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(geo)
+    return geo
+
+
+def timeit(fn, *args, repeat=3):
+    """Best wall time of fn(*args), in seconds"""
+    best = math.inf
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def noisy_loop(n, seed=0):
+    """A closed, wobbly loop of n points"""
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0.0, 2.0 * math.pi, n, endpoint=False)
+    r = 1000.0 + 50.0 * np.sin(7.0 * t) + rng.normal(0.0, 0.5, n)
+    return np.stack((r * np.cos(t), r * np.sin(t)), axis=1)
+
+
+def bench_douglas_peucker(geo, eps=0.5):
+    print("Douglas-Peucker (eps = %s)" % eps)
+    for n in (1000, 10000, 100000):
+        pts = noisy_loop(n)
+        chain = [tuple(p) for p in pts.tolist()]
+        assert geo._dpcall3(chain, eps) == geo.douglas_peucker(chain, eps)
+        t_ref = timeit(geo._dpcall3, chain, eps)
+        t_np = timeit(geo.douglas_peucker_ids, pts, eps)
+        print("  %7d pts: _dpcall3 %8.2f ms | douglas_peucker_ids %8.2f ms | x%.1f" % (
+            n, t_ref * 1000.0, t_np * 1000.0, t_ref / t_np))
+
+
+def bench_chain(geo, n=100000, chain_len=100):
+    print("Chain construction (%d verts in chains of %d)" % (n, chain_len))
+    verts = [tuple(p) for p in noisy_loop(n).tolist()]
+
+    def build_add_vert():
+        chains = []
+        for i in range(0, n, chain_len):
+            ch = geo.Chain()
+            for v in verts[i : i + chain_len]:
+                ch.add_vert(v)
+            chains.append(ch)
+        return chains
+
+    def build_extend():
+        return [geo.Chain(verts[i : i + chain_len]) for i in range(0, n, chain_len)]
+
+    for name, fn in (("add_vert", build_add_vert), ("extend", build_extend)):
+        tracemalloc.start()
+        chains = fn()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del chains
+        print("  %-8s %8.2f ms | %8.1f bytes/chain" % (
+            name, timeit(fn) * 1000.0, size / (n // chain_len)))
+
+    tracemalloc.start()
+    ch = geo.Chain(verts)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("  single %d-vert chain: %.1f bytes/vert" % (n, size / n))
+
+
+def smooth_reference(ch, amount, t):
+    """The per-vertex smoothing loop Chain.smooth used to run"""
+    for _ in range(t):
+        for i in range(len(ch)):
+            vl = ch[(i - 1) % len(ch)]
+            vr = ch[(i + 1) % len(ch)]
+            x = ((vl[0] + vr[0]) * 0.5) * amount + ch[i][0] * (1.0 - amount)
+            y = ((vl[1] + vr[1]) * 0.5) * amount + ch[i][1] * (1.0 - amount)
+            ch[i] = (x, y)
+    return ch
+
+
+def bench_smooth(geo, n=50000, t=100):
+    print("Smoothing (%d iterations, %d verts)" % (t, n))
+    pts = noisy_loop(n)
+    t_ref = timeit(smooth_reference, [tuple(p) for p in pts.tolist()], 0.5, t, repeat=1)
+    t_np = timeit(lambda: geo.Chain(pts).smooth(0.5, t))
+    t_taubin = timeit(lambda: geo.Chain(pts).smooth(0.5, t, mu=-0.53))
+    chains = [geo.Chain(noisy_loop(500, seed=i)) for i in range(n // 500)]
+    t_batch = timeit(geo.smooth_chains, chains, 0.5, t)
+    print("  loop %8.2f ms | Chain.smooth %8.2f ms (x%.1f) | Taubin %8.2f ms" % (
+        t_ref * 1000.0, t_np * 1000.0, t_ref / t_np, t_taubin * 1000.0))
+    print("  smooth_chains, %d chains of 500 verts: %8.2f ms" % (len(chains), t_batch * 1000.0))
+
+
+# Synthetic masks, float images in [0, 1]
+
+# 5x7 bitmap glyphs
+GLYPHS = {
+    "D": ("11110", "10001", "10001", "10001", "10001", "10001", "11110"),
+    "U": ("10001", "10001", "10001", "10001", "10001", "10001", "01110"),
+    "B": ("11110", "10001", "10001", "11110", "10001", "10001", "11110"),
+    "L": ("10000", "10000", "10000", "10000", "10000", "10000", "11111"),
+    "F": ("11111", "10000", "10000", "11110", "10000", "10000", "10000"),
+    "O": ("01110", "10001", "10001", "10001", "10001", "10001", "01110"),
+    "A": ("01110", "10001", "10001", "11111", "10001", "10001", "10001"),
+}
+
+
+def box_blur(img, radius):
+    """Separable box blur with cumulative sums"""
+    if radius < 1:
+        return img
+    k = 2 * radius + 1
+    for axis in (0, 1):
+        pad = [(0, 0), (0, 0)]
+        pad[axis] = (radius + 1, radius)
+        c = np.cumsum(np.pad(img, pad, mode="edge"), axis=axis)
+        img = (np.take(c, np.arange(k, c.shape[axis]), axis=axis) - np.take(c, np.arange(0, c.shape[axis] - k), axis=axis)) / k
+    return img
+
+
+def mask_circles(size, seed=0):
+    """Anti-aliased disks, some with holes"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32)
+    img = np.zeros((size, size), dtype=np.float32)
+    for _ in range(24):
+        cy, cx = rng.uniform(0.1, 0.9, 2) * size
+        r = rng.uniform(0.02, 0.12) * size
+        d = np.sqrt((yy - cy) ** 2 + (xx - cx) ** 2)
+        img = np.maximum(img, np.clip(r - d, 0.0, 1.0))
+        if rng.random() < 0.3:
+            img = np.minimum(img, np.clip(d - r * 0.5, 0.0, 1.0))
+    return img
+
+
+def mask_noise(size, seed=0):
+    """Blurred noise, many organic blobs"""
+    rng = np.random.default_rng(seed)
+    img = box_blur(rng.random((size, size)), max(1, size // 128))
+    img = (img - img.min()) / max(img.max() - img.min(), 1e-9)
+    return img.astype(np.float32)
+
+
+def mask_text(size, text="DUBLF OA"):
+    """Rows of bitmap glyphs, lots of holes and corners"""
+    scale = max(1, size // (len(text) * 6 + 2))
+    line = np.zeros((8, len(text) * 6 + 1), dtype=np.float32)
+    for i, c in enumerate(text):
+        if c in GLYPHS:
+            line[1:8, i * 6 + 1 : i * 6 + 6] = np.array([[float(b) for b in row] for row in GLYPHS[c]])
+    line = np.kron(line, np.ones((scale, scale), dtype=np.float32))
+    img = np.zeros((size, size), dtype=np.float32)
+    reps = size // line.shape[0]
+    w = min(size, line.shape[1])
+    for r in range(reps):
+        img[r * line.shape[0] : (r + 1) * line.shape[0], :w] = line[:, :w]
+    return box_blur(img, max(1, scale // 8)).astype(np.float32)
+
+
+def mask_lines(size, step=16):
+    """1 pixel wide lines: horizontal, vertical and diagonal"""
+    img = np.zeros((size, size), dtype=np.float32)
+    img[step // 2 :: step, :] = 1.0
+    img[:, step // 2 :: step * 2] = 1.0
+    i = np.arange(size)
+    img[i, (i * 3) % size] = 1.0
+    return img
+
+
+MASKS = {
+    "circles": mask_circles,
+    "noise": mask_noise,
+    "text": mask_text,
+    "lines": mask_lines,
+}
+
+
+def run_stage(fn, *args):
+    """Runs fn(*args) twice: for the wall time, then for the peak traced memory
+    (tracing slows down Python allocations a lot).
+    Returns (result, wall time, peak memory)"""
+    t = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - t
+
+    tracemalloc.start()
+    result = fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def warm_up(geo):
+    """Compiles the numba kernels before timing anything"""
+    loop = noisy_loop(64)
+    geo.douglas_peucker_ids(loop, 0.5)
+    geo.smooth_verts(loop.copy(), (0, len(loop)), 0.5, 1)
+    geo.dist_points_line(loop, (0.0, 0.0), (1.0, 1.0))
+    geo.tri_ori_batch(loop, loop, loop)
+
+
+def bench_pipeline(geo, mask_name, size, cutoff=0.5, simplify=0.5, smooth=(0.5, 10), square=True):
+    """Times each stage of the tracing pipeline on a synthetic mask"""
+    img = MASKS[mask_name](size)
+    stages = {}
+    counts = {}
+
+    def stage(name, fn, *args):
+        result, elapsed, peak = run_stage(fn, *args)
+        stages[name] = {"time": elapsed, "peak_memory": peak}
+        return result
+
+    if square:
+        square_segs = stage("lines_square", geo.lines_square_np, img, cutoff)
+        counts["square_segments"] = len(square_segs)
+        del square_segs
+
+    segs = stage("lines_marching", geo.lines_marching_np, img, cutoff, img > cutoff)
+    counts["segments"] = len(segs)
+
+    verts, chain_ids, failures = stage("parse_segments", geo.parse_segments_np, segs)
+    counts["vertices"] = len(verts)
+    counts["chains"] = len(chain_ids)
+    counts["failures"] = failures
+
+    # marching squares and parsing on shared crossings, without the segment array
+    stage("trace_marching", geo.trace_marching, img, cutoff, img > cutoff)
+
+    def simplify_all():
+        chains = [geo.Chain(verts[ids]) for ids in chain_ids]
+        for ch in chains:
+            ch.simplify(simplify)
+        return [ch for ch in chains if not ch.invalid]
+
+    chains = stage("simplify", simplify_all)
+    counts["simplified_chains"] = len(chains)
+    counts["simplified_vertices"] = sum(len(ch) for ch in chains)
+
+    # smooth copies, the stage runs twice
+    stage("smooth", lambda: geo.smooth_chains([geo.Chain(ch.verts) for ch in chains], smooth[0], smooth[1]))
+
+    return {"mask": mask_name, "size": size, "stages": stages, "counts": counts}
+
+
+def print_result(r):
+    print("%-8s %5d px | %s" % (r["mask"], r["size"], " ".join("%s=%d" % kv for kv in r["counts"].items())))
+    for name, st in r["stages"].items():
+        print("    %-15s %10.2f ms %10.1f MB" % (name, st["time"] * 1000.0, st["peak_memory"] / 1048576.0))
+
+
+def bench_levels(geo, size=2048, levels=8):
+    print("Marching squares, %d levels on a %dx%d noise mask" % (levels, size, size))
+    img = mask_noise(size)
+    cutoffs = np.linspace(0.1, 0.9, levels).tolist()
+    t_ref = timeit(lambda: [geo.lines_marching_np(img, c, img > c) for c in cutoffs], repeat=1)
+    t_levels = timeit(geo.lines_marching_levels, img, cutoffs, repeat=1)
+    t_threads = timeit(geo.lines_marching_levels, img, cutoffs, 4, repeat=1)
+    print("  per cutoff %8.2f ms | levels %8.2f ms (x%.1f) | 4 threads %8.2f ms" % (
+        t_ref * 1000.0, t_levels * 1000.0, t_ref / t_levels, t_threads * 1000.0))
+
+
+def bench_retrace(geo, size=4096, strokes=20, radius=16):
+    print("Incremental re-trace, %d strokes of %d px on a %dx%d text mask" % (strokes, 2 * radius, size, size))
+    img = mask_text(size)
+    t = time.perf_counter()
+    cache = geo.TraceCache(img, 0.5, margin=0.5)
+    t_full = time.perf_counter() - t
+
+    rng = np.random.default_rng(0)
+    t_rect = t_diff = 0.0
+    for k in range(strokes):
+        r, c = rng.integers(radius, size - radius, 2)
+        rect = (r - radius, r + radius, c - radius, c + radius)
+        img[rect[0] : rect[1], rect[2] : rect[3]] = k % 2
+        t = time.perf_counter()
+        if k % 2:
+            cache.update(img, rect)
+            t_rect += time.perf_counter() - t
+        else:
+            cache.update(img)
+            t_diff += time.perf_counter() - t
+    print("  full trace %8.2f ms | stroke, rect %8.2f ms | stroke, pixel diff %8.2f ms" % (
+        t_full * 1000.0, t_rect * 2000.0 / strokes, t_diff * 2000.0 / strokes))
+
+
+def bench_spine(geo, size=224):
+    # triangulated grid: mostly junction triangles, the worst case for the links
+    grid = np.stack(np.meshgrid(np.arange(size), np.arange(size), indexing="ij"), axis=-1)
+    co = grid.reshape(-1, 2).astype(np.float64)
+    ids = np.arange(size * size).reshape(size, size)
+    a, b, c, d = ids[:-1, :-1].ravel(), ids[1:, :-1].ravel(), ids[1:, 1:].ravel(), ids[:-1, 1:].ravel()
+    tris = np.concatenate((np.stack((a, b, c), axis=1), np.stack((a, c, d), axis=1)))
+    print("Spine of a %d triangle mesh" % len(tris))
+    t_spine = timeit(geo.spine_graph, co, tris)
+    t_raw = timeit(geo.spine_graph, co, tris, 0.0)
+    print("  spine_graph %8.2f ms | without pruning %8.2f ms" % (t_spine * 1000.0, t_raw * 1000.0))
+
+
+def run_kernels(geo):
+    bench_douglas_peucker(geo)
+    bench_chain(geo)
+    bench_smooth(geo)
+    bench_levels(geo)
+    bench_retrace(geo)
+    bench_spine(geo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="dublf.geo tracing benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024, 2048])
+    parser.add_argument("--masks", nargs="+", default=list(MASKS), choices=list(MASKS))
+    parser.add_argument("--cutoff", type=float, default=0.5)
+    parser.add_argument("--no-square", action="store_true", help="skip lines_square")
+    parser.add_argument("--backend", choices=("numba", "numpy"), help="geo kernel backend")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--kernels", action="store_true", help="compare the kernels with the previous implementations")
+    args = parser.parse_args(argv)
+
+    geo = load_geo()
+    if args.backend:
+        geo.set_backend(args.backend)
+    print("Backend: " + geo.get_backend())
+    warm_up(geo)
+
+    if args.kernels:
+        run_kernels(geo)
+        return
+
+    results = []
+    for size in args.sizes:
+        for mask_name in args.masks:
+            r = bench_pipeline(geo, mask_name, size, args.cutoff, square=not args.no_square)
+            print_result(r)
+            results.append(r)
+
+    if args.json:
+        report = {
+            "backend": geo.get_backend(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
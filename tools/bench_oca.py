@@ -0,0 +1,160 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+# Benchmarks for dublf.oca on synthetic OCA documents:
+#   python tools/bench_oca.py --frames 5000 --layers 4
+# Keep the generated documents to use them as a test corpus:
+#   python tools/bench_oca.py --frames 5000 --out /tmp/oca_corpus
+
+import argparse
+import importlib.util
+import json
+import os
+import tempfile
+import time
+
+OCA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dublf", "oca.py")
+
+
+def load_oca():
+    spec = importlib.util.spec_from_file_location("dublf_oca", OCA_PATH)
+    oca = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(oca)
+    return oca
+
+
+def make_document(folder, frames, layers, image_size=4096):
+    """Writes an animated OCA document with frames frames spread over layers paint layers
+    (and a group with a copy of the first one), with dummy image files of image_size bytes"""
+    os.makedirs(folder, exist_ok=True)
+    per_layer = max(frames // layers, 1)
+    doc = {
+        "name": "synthetic",
+        "width": 1920,
+        "height": 1080,
+        "frameRate": 24.0,
+        "startTime": 0,
+        "endTime": per_layer * layers,
+        "backgroundColor": [1.0, 1.0, 1.0, 1.0],
+        "colorDepth": "U8",
+        "originApp": "bench_oca",
+        "originAppVersion": "1.0",
+        "ocaVersion": "1.1.0",
+        "layers": [],
+    }
+    data = bytes(image_size)
+    for l in range(layers):
+        name = "layer%d" % l
+        os.makedirs(os.path.join(folder, name), exist_ok=True)
+        frame_list = []
+        for k in range(per_layer):
+            file_name = "%s/%s_%05d.png" % (name, name, k)
+            with open(os.path.join(folder, file_name), "wb") as f:
+                f.write(data)
+            frame_list.append({
+                "name": "%s_%05d" % (name, k),
+                "fileName": file_name,
+                "frameNumber": k * layers + l,
+                "duration": layers,
+                "position": [960, 540],
+                "width": 1920,
+                "height": 1080,
+                "opacity": 1.0,
+            })
+        doc["layers"].append({
+            "name": name,
+            "type": "paintlayer",
+            "fileType": "png",
+            "blendingMode": "normal",
+            "animated": True,
+            "label": l % 8,
+            "opacity": 1.0,
+            "visible": True,
+            "reference": False,
+            "passThrough": False,
+            "inheritAlpha": False,
+            "position": [960, 540],
+            "width": 1920,
+            "height": 1080,
+            "frames": frame_list,
+            "childLayers": [],
+        })
+    group = dict(doc["layers"][0], name="group", type="grouplayer", frames=[])
+    group["childLayers"] = [dict(doc["layers"][0], name="child")]
+    doc["layers"].append(group)
+
+    filepath = os.path.join(folder, "synthetic.oca")
+    with open(filepath, "w") as f:
+        json.dump(doc, f, indent=4)
+    return filepath
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="dublf.oca benchmarks")
+    parser.add_argument("--frames", type=int, default=5000)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--out", help="folder of the generated document, kept after the benchmark")
+    args = parser.parse_args(argv)
+
+    oca = load_oca()
+    with tempfile.TemporaryDirectory() as tmp:
+        filepath = make_document(args.out or tmp, args.frames, args.layers)
+        print("%d frames, %d layers, %.1f MB of JSON" % (
+            args.frames, args.layers, os.path.getsize(filepath) / 1048576.0))
+
+        t = time.perf_counter()
+        oca.load(filepath)
+        t_json = time.perf_counter() - t
+
+        t = time.perf_counter()
+        oca.OCAReader(filepath).read()
+        t_validate = time.perf_counter() - t
+
+        t = time.perf_counter()
+        oca.readHeader(filepath)
+        t_header = time.perf_counter() - t
+
+        t = time.perf_counter()
+        doc = oca.loadDocument(filepath)
+        t_doc = time.perf_counter() - t
+        frame_count = sum(1 for _ in doc.allFrames())
+
+        t = time.perf_counter()
+        for frame in doc.allFrames():
+            frame.image
+        t_eager = time.perf_counter() - t
+        doc.unloadOutside(0, 0)
+
+        t = time.perf_counter()
+        futures = doc.prefetch(doc.startTime, after=48)
+        for future in futures:
+            future.result()
+        t_prefetch = time.perf_counter() - t
+        doc.close()
+
+    print("  load (json)          %10.2f ms" % (t_json * 1000.0))
+    print("  read and validate    %10.2f ms" % (t_validate * 1000.0))
+    print("  readHeader           %10.2f ms" % (t_header * 1000.0))
+    print("  loadDocument         %10.2f ms (%d frames)" % (t_doc * 1000.0, frame_count))
+    print("  load all images      %10.2f ms" % (t_eager * 1000.0))
+    print("  prefetch 48 frames   %10.2f ms (%d images)" % (t_prefetch * 1000.0, len(futures)))
+
+
+if __name__ == "__main__":
+    main()